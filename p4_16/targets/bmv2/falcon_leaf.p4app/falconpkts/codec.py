@@ -0,0 +1,108 @@
+#
+# Wire format of the falcon packets (faclon_t in ../header.p4) with struct,
+# without scapy, for the raw socket sender and receiver (rawsock.py).
+#
+# encode_frame() builds a whole Ethernet/IPv4/UDP/falcon frame once (the IPv4
+# checksum included), and the fields that change from packet to packet (e.g.
+# seq_num) are then stamped in place in the frame buffer with stamp_seq_num(),
+# which leaves the IPv4 checksum valid. On receive, falcon_offset() finds the
+# falcon header of a frame and FALCON_HDR.unpack_from() decodes only that;
+# ipv4_offset() finds the IPv4 header (after the 802.1Q tag, if any).
+#
+# Usage:
+#
+#  frame = bytearray(encode_frame('00:00:00:00:00:01', 'AA:BB:CC:DD:EE:FF', '10.0.0.1', '10.0.2.101',
+#                                 (PKT_TYPE_NEW_TASK, 5, 1, 6, 0, 0, 0x10), pkt_len=128))
+#  stamp_seq_num(frame, 0, 0x11)
+#  pkt_type, cluster_id, local_cluster_id, src_id, dst_id, qlen, seq_num = FALCON_HDR.unpack_from(frame, falcon_offset(frame))
+#
+import socket
+import struct
+
+FALCON_PORT = 1234
+ETHER_IPV4_TYPE = 0x0800
+ETHER_VLAN_TYPE = 0x8100
+IP_PROTOCOLS_UDP = 17
+
+PKT_TYPE_NEW_TASK = 0x00
+PKT_TYPE_TASK_DONE = 0x02
+PKT_TYPE_TASK_DONE_IDLE = 0x03
+# PKT_TYPE_* of ../header.p4 (decimal), 11-15 as in the tofino headers.p4
+PKT_TYPE_NAMES = {0: 'NEW_TASK', 1: 'NEW_TASK_RANDOM', 2: 'TASK_DONE', 3: 'TASK_DONE_IDLE',
+                  4: 'QUEUE_REMOVE', 5: 'SCAN_QUEUE_SIGNAL', 6: 'IDLE_SIGNAL', 7: 'QUEUE_SIGNAL',
+                  8: 'PROBE_IDLE_QUEUE', 9: 'PROBE_IDLE_RESPONSE', 10: 'IDLE_REMOVE', 11: 'KEEP_ALIVE',
+                  12: 'WORKER_ID', 13: 'WORKER_ID_ACK', 14: 'REMOVE_ACK', 15: 'QUEUE_SIGNAL_INIT'}
+
+ETHERNET_HDR = struct.Struct('!6s6sH')
+IPV4_HDR = struct.Struct('!BBHHHBBH4s4s')
+UDP_HDR = struct.Struct('!HHHH')
+U16 = struct.Struct('!H')
+# pkt_type, cluster_id, local_cluster_id, src_id, dst_id, qlen, seq_num
+FALCON_HDR = struct.Struct('!BHBHHBH')
+FALCON_FIELDS = ('pkt_type', 'cluster_id', 'local_cluster_id', 'src_id', 'dst_id', 'qlen', 'seq_num')
+
+FALCON_OFFSET = ETHERNET_HDR.size + IPV4_HDR.size + UDP_HDR.size # falcon header in a frame without VLAN tag
+FALCON_SEQ_NUM = struct.Struct('!H')
+FALCON_SEQ_NUM_OFFSET = FALCON_OFFSET + FALCON_HDR.size - FALCON_SEQ_NUM.size
+MIN_FRAME_LEN = FALCON_OFFSET + FALCON_HDR.size
+
+def mac_bytes(mac):
+    return bytes(bytearray(int(byte, 16) for byte in mac.split(':')))
+
+def ipv4_checksum(header):
+    # Ones' complement of the ones' complement sum of the 16 bit words (RFC 1071)
+    total = sum(struct.unpack('!%dH' % (len(header) // 2), header))
+    while total >> 16:
+        total = (total & 0xFFFF) + (total >> 16)
+    return ~total & 0xFFFF
+
+def encode_frame(src_mac, dst_mac, src_ip, dst_ip, falcon_fields, pkt_len=MIN_FRAME_LEN, payload=None, udp_sport=FALCON_PORT):
+    #
+    # Ethernet/IPv4/UDP/falcon frame of pkt_len bytes (at least the headers).
+    # falcon_fields in wire order (FALCON_FIELDS). The payload is payload
+    # (repeated or cut to length) or zeros. The UDP checksum is 0.
+    #
+    payload_len = max(0, pkt_len - MIN_FRAME_LEN)
+    if payload:
+        payload = (payload * (payload_len // len(payload) + 1))[:payload_len]
+    else:
+        payload = b'\x00' * payload_len
+    falcon = FALCON_HDR.pack(*falcon_fields) + payload
+    udp = UDP_HDR.pack(udp_sport, FALCON_PORT, UDP_HDR.size + len(falcon), 0) + falcon
+    ip_header = IPV4_HDR.pack(0x45, 0, IPV4_HDR.size + len(udp), 0, 0, 64, IP_PROTOCOLS_UDP, 0,
+                              socket.inet_aton(src_ip), socket.inet_aton(dst_ip))
+    ip_header = ip_header[:10] + struct.pack('!H', ipv4_checksum(ip_header)) + ip_header[12:]
+    return ETHERNET_HDR.pack(mac_bytes(dst_mac), mac_bytes(src_mac), ETHER_IPV4_TYPE) + ip_header + udp
+
+def stamp_seq_num(buf, frame_offset, seq_num):
+    # Writes seq_num in the frame at frame_offset of buf
+    FALCON_SEQ_NUM.pack_into(buf, frame_offset + FALCON_SEQ_NUM_OFFSET, seq_num & 0xFFFF)
+
+def ipv4_offset(buf, offset=0, length=None):
+    # Offset in buf of the IPv4 header of the frame at offset (optional 802.1Q tag), -1 if it is not IPv4
+    end = len(buf) if length is None else offset + length
+    l3 = offset + ETHERNET_HDR.size
+    if l3 + IPV4_HDR.size > end:
+        return -1
+    ether_type = U16.unpack_from(buf, l3 - 2)[0]
+    if ether_type == ETHER_VLAN_TYPE:
+        ether_type = U16.unpack_from(buf, l3 + 2)[0]
+        l3 += 4
+    if ether_type != ETHER_IPV4_TYPE or l3 + IPV4_HDR.size > end:
+        return -1
+    return l3
+
+def falcon_offset(buf, offset=0, length=None):
+    #
+    # Offset in buf of the falcon header of the frame at offset (Ethernet,
+    # optional 802.1Q tag, IPv4, UDP to FALCON_PORT), -1 if it is not a
+    # complete falcon packet.
+    #
+    end = len(buf) if length is None else offset + length
+    l3 = ipv4_offset(buf, offset, length)
+    if l3 < 0 or buf[l3 + 9] != IP_PROTOCOLS_UDP:
+        return -1
+    udp = l3 + (buf[l3] & 0x0F) * 4
+    if udp + UDP_HDR.size + FALCON_HDR.size > end or U16.unpack_from(buf, udp + 2)[0] != FALCON_PORT:
+        return -1
+    return udp + UDP_HDR.size
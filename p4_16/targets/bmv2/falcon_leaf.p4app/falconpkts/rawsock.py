@@ -0,0 +1,258 @@
+#
+# AF_PACKET raw sockets for the falcon hosts, instead of scapy send()/sniff().
+#
+# BatchSender sends frames that are already in one buffer (see codec.py) with
+# one sendmmsg() system call per batch (through ctypes, python has no
+# sendmmsg), or one send() per frame where sendmmsg is not available. The
+# socket is non-blocking: frames the kernel does not take (ENOBUFS/EAGAIN)
+# are reported as not sent instead of blocking the sender.
+#
+# BatchReceiver reads up to batch_size frames per recvmmsg() call into fixed
+# slots of snaplen bytes. RingReceiver maps a PACKET_RX_RING (TPACKET_V2) ring
+# shared with the kernel and reads the frames in place, without a system call
+# per batch while frames are waiting. Both return the frames of a batch as
+# (buffer, [(offset, length), ...]), valid until the next recv_batch().
+# Frames sent by the host itself are not received where the kernel supports
+# PACKET_IGNORE_OUTGOING (Linux 4.20).
+#
+# Needs CAP_NET_RAW (root in the mininet hosts).
+#
+# Usage:
+#
+#  sender = BatchSender(default_interface(), frame_len=128, batch_size=64)
+#  sender.buf[0:128] = frame
+#  sent = sender.send(1)
+#
+#  receiver = RingReceiver(default_interface())
+#  buf, frames = receiver.recv_batch(timeout=1.0)
+#
+import ctypes
+import ctypes.util
+import errno
+import fcntl
+import mmap
+import os
+import select
+import socket
+import struct
+
+ETH_P_ALL = 0x0003
+SIOCGIFADDR = 0x8915
+MSG_DONTWAIT = 0x40
+
+SOL_PACKET = 263
+PACKET_RX_RING = 5
+PACKET_VERSION = 10
+PACKET_IGNORE_OUTGOING = 23
+TPACKET_V2 = 1
+TP_STATUS_KERNEL = 0
+TP_STATUS_USER = 1
+# tp_status, tp_len, tp_snaplen, tp_mac of struct tpacket2_hdr
+TPACKET2_HDR = struct.Struct('=IIIH')
+
+class iovec(ctypes.Structure):
+    _fields_ = [('iov_base', ctypes.c_void_p), ('iov_len', ctypes.c_size_t)]
+
+class msghdr(ctypes.Structure):
+    _fields_ = [('msg_name', ctypes.c_void_p), ('msg_namelen', ctypes.c_uint32),
+                ('msg_iov', ctypes.POINTER(iovec)), ('msg_iovlen', ctypes.c_size_t),
+                ('msg_control', ctypes.c_void_p), ('msg_controllen', ctypes.c_size_t),
+                ('msg_flags', ctypes.c_int)]
+
+class mmsghdr(ctypes.Structure):
+    _fields_ = [('msg_hdr', msghdr), ('msg_len', ctypes.c_uint)]
+
+def _libc_function(name):
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+        return getattr(libc, name)
+    except (OSError, AttributeError):
+        return None
+
+def default_interface():
+    # First interface that is not loopback (h1-eth0 in the mininet hosts)
+    for iface in sorted(os.listdir('/sys/class/net')):
+        if iface != 'lo':
+            return iface
+    return 'lo'
+
+def interface_mac(iface):
+    with open('/sys/class/net/%s/address' % iface) as f:
+        return f.read().strip()
+
+def interface_ip(iface):
+    # IPv4 address of iface, None if it has none
+    s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    try:
+        ifreq = fcntl.ioctl(s.fileno(), SIOCGIFADDR, struct.pack('256s', iface[:15].encode('ascii')))
+        return socket.inet_ntoa(ifreq[20:24])
+    except IOError:
+        return None
+    finally:
+        s.close()
+
+def open_raw_socket(iface, protocol=ETH_P_ALL, blocking=True, ignore_outgoing=False):
+    s = socket.socket(socket.AF_PACKET, socket.SOCK_RAW, socket.htons(protocol))
+    if ignore_outgoing:
+        try:
+            s.setsockopt(SOL_PACKET, PACKET_IGNORE_OUTGOING, 1)
+        except (socket.error, OSError):
+            pass
+    s.bind((iface, protocol))
+    s.setblocking(blocking)
+    return s
+
+class BatchSender():
+    #
+    # batch_size slots of frame_len bytes in buf. send(n) sends the frames of
+    # the first n slots and returns how many the kernel accepted.
+    #
+    def __init__(self, iface, frame_len, batch_size=64, sndbuf=1 << 22):
+        self.sock = open_raw_socket(iface, blocking=False)
+        self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, sndbuf)
+        self.frame_len = frame_len
+        self.batch_size = batch_size
+        self.buf = bytearray(frame_len * batch_size)
+        self.view = memoryview(self.buf)
+        self.sendmmsg = _libc_function('sendmmsg')
+        if self.sendmmsg is not None:
+            base = ctypes.addressof((ctypes.c_char * len(self.buf)).from_buffer(self.buf))
+            self.iovecs = (iovec * batch_size)()
+            self.msgs = (mmsghdr * batch_size)()
+            for i in range(batch_size):
+                self.iovecs[i].iov_base = base + i * frame_len
+                self.iovecs[i].iov_len = frame_len
+                self.msgs[i].msg_hdr.msg_iov = ctypes.pointer(self.iovecs[i])
+                self.msgs[i].msg_hdr.msg_iovlen = 1
+        self.num_syscalls = 0
+
+    def send(self, n):
+        if self.sendmmsg is None:
+            return self._send_each(n)
+        sent = 0
+        while sent < n:
+            self.num_syscalls += 1
+            result = self.sendmmsg(self.sock.fileno(), ctypes.byref(self.msgs, sent * ctypes.sizeof(mmsghdr)), n - sent, MSG_DONTWAIT)
+            if result < 0:
+                error = ctypes.get_errno()
+                if error in (errno.ENOBUFS, errno.EAGAIN, errno.EINTR):
+                    break
+                raise OSError(error, os.strerror(error))
+            sent += result
+        return sent
+
+    def _send_each(self, n):
+        frame_len = self.frame_len
+        for i in range(n):
+            self.num_syscalls += 1
+            try:
+                self.sock.send(self.view[i * frame_len:(i + 1) * frame_len])
+            except (socket.error, OSError) as e:
+                if e.errno in (errno.ENOBUFS, errno.EAGAIN, errno.EINTR):
+                    return i
+                raise
+        return n
+
+    def close(self):
+        self.sock.close()
+
+class BatchReceiver():
+    def __init__(self, iface, batch_size=256, snaplen=128, rcvbuf=1 << 24):
+        self.sock = open_raw_socket(iface, blocking=False, ignore_outgoing=True)
+        self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, rcvbuf)
+        self.batch_size = batch_size
+        self.snaplen = snaplen
+        self.buf = bytearray(snaplen * batch_size)
+        self.recvmmsg = _libc_function('recvmmsg')
+        if self.recvmmsg is not None:
+            base = ctypes.addressof((ctypes.c_char * len(self.buf)).from_buffer(self.buf))
+            self.iovecs = (iovec * batch_size)()
+            self.msgs = (mmsghdr * batch_size)()
+            for i in range(batch_size):
+                self.iovecs[i].iov_base = base + i * snaplen
+                self.iovecs[i].iov_len = snaplen
+                self.msgs[i].msg_hdr.msg_iov = ctypes.pointer(self.iovecs[i])
+                self.msgs[i].msg_hdr.msg_iovlen = 1
+        self.view = memoryview(self.buf)
+        self.num_syscalls = 0
+
+    def recv_batch(self, timeout=None):
+        # Waits up to timeout s for frames, then reads the frames waiting (at most batch_size)
+        if not select.select([self.sock], [], [], timeout)[0]:
+            return self.buf, []
+        self.num_syscalls += 1
+        if self.recvmmsg is None:
+            return self._recv_each()
+        n = self.recvmmsg(self.sock.fileno(), self.msgs, self.batch_size, MSG_DONTWAIT, None)
+        if n < 0:
+            error = ctypes.get_errno()
+            if error in (errno.EAGAIN, errno.EINTR):
+                return self.buf, []
+            raise OSError(error, os.strerror(error))
+        snaplen = self.snaplen
+        msgs = self.msgs
+        return self.buf, [(i * snaplen, min(msgs[i].msg_len, snaplen)) for i in range(n)]
+
+    def _recv_each(self):
+        frames = []
+        for i in range(self.batch_size):
+            try:
+                length = self.sock.recv_into(self.view[i * self.snaplen:(i + 1) * self.snaplen])
+            except (socket.error, OSError) as e:
+                if e.errno in (errno.EAGAIN, errno.EINTR):
+                    break
+                raise
+            frames.append((i * self.snaplen, length))
+        return self.buf, frames
+
+    def close(self):
+        self.sock.close()
+
+class RingReceiver():
+    #
+    # frame_nr slots of frame_size bytes in blocks of block_size bytes. A slot
+    # belongs to the kernel until it sets TP_STATUS_USER, and is given back
+    # (TP_STATUS_KERNEL) when the next batch is read.
+    #
+    def __init__(self, iface, frame_size=2048, frame_nr=4096, block_size=1 << 16, batch_size=256):
+        self.sock = open_raw_socket(iface, ignore_outgoing=True)
+        self.sock.setsockopt(SOL_PACKET, PACKET_VERSION, TPACKET_V2)
+        block_nr = frame_nr * frame_size // block_size
+        self.sock.setsockopt(SOL_PACKET, PACKET_RX_RING, struct.pack('IIII', block_size, block_nr, frame_size, frame_nr))
+        self.ring = mmap.mmap(self.sock.fileno(), block_size * block_nr, mmap.MAP_SHARED, mmap.PROT_READ | mmap.PROT_WRITE)
+        self.frame_size = frame_size
+        self.frame_nr = frame_nr
+        self.batch_size = batch_size
+        self.poll = select.poll()
+        self.poll.register(self.sock.fileno(), select.POLLIN | select.POLLERR)
+        self.index = 0
+        self.pending = []
+        self.num_syscalls = 0
+
+    def _release(self):
+        for slot in self.pending:
+            struct.pack_into('=I', self.ring, slot, TP_STATUS_KERNEL)
+        self.pending = []
+
+    def recv_batch(self, timeout=None):
+        self._release()
+        ring = self.ring
+        slot = self.index * self.frame_size
+        if not TPACKET2_HDR.unpack_from(ring, slot)[0] & TP_STATUS_USER:
+            self.num_syscalls += 1
+            self.poll.poll(None if timeout is None else int(timeout * 1000))
+        frames = []
+        while len(frames) < self.batch_size:
+            slot = self.index * self.frame_size
+            status, _, snaplen, mac = TPACKET2_HDR.unpack_from(ring, slot)
+            if not status & TP_STATUS_USER:
+                break
+            frames.append((slot + mac, snaplen))
+            self.pending.append(slot)
+            self.index = (self.index + 1) % self.frame_nr
+        return ring, frames
+
+    def close(self):
+        self._release()
+        self.ring.close()
+        self.sock.close()
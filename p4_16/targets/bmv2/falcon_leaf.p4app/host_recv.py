@@ -14,54 +14,133 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
-from scapy.all import sniff, sendp
-from scapy.all import Packet
-from scapy.all import ShortField, IntField, LongField, BitField
-from scapy.all import *
-
-from falconpkts.pkts import *
-
+#
+# Worker host: receives the falcon packets with an AF_PACKET raw socket
+# (falconpkts/rawsock.py) in batches, decodes only the falcon header
+# (falconpkts/codec.py) and counts the packets per pkt_type and per
+# (pkt_type, dst_id). A summary is printed every interval seconds instead of
+# one line per packet. 'ring' reads the frames from a PACKET_RX_RING shared
+# with the kernel, 'mmsg' with recvmmsg(). With REPLY_TASK_DONE, every
+# NEW_TASK is answered with a TASK_DONE (same seq_num) to its source, sent in
+# batches.
+#
+# Usage:
+#
+#  python3 host_recv.py <host> <rack_local_id> <global_id> [iface] [ring|mmsg] [interval] [duration]
+#
+import collections
 import sys
-import struct
+import time
+
+from falconpkts.codec import (encode_frame, stamp_seq_num, falcon_offset, ipv4_offset, FALCON_HDR, PKT_TYPE_NAMES,
+                              PKT_TYPE_NEW_TASK, PKT_TYPE_TASK_DONE)
+from falconpkts.rawsock import BatchReceiver, BatchSender, RingReceiver, default_interface, interface_mac, interface_ip
 
+REPLY_TASK_DONE = True
+BATCH_SIZE = 256
+REPLY_PKT_LEN = 64
+TOP_DST_IDS = 8
+MODES = ('ring', 'mmsg')
 
 class Worker:
-    def __init__(self, ip_address, rack_local_id, global_id):
+    def __init__(self, ip_address, rack_local_id, global_id, iface=None, mode='ring'):
         self.ip_address = ip_address
-        self.rack_local_id = rack_local_id
+        self.rack_local_id = int(rack_local_id)
         self.global_id = global_id
+        self.iface = iface or default_interface()
+        if mode == 'ring':
+            self.receiver = RingReceiver(self.iface, batch_size=BATCH_SIZE)
+        elif mode == 'mmsg':
+            self.receiver = BatchReceiver(self.iface, batch_size=BATCH_SIZE)
+        else:
+            raise ValueError("Unknown mode %s, expected one of %s" % (mode, ', '.join(MODES)))
+        self.type_counts = collections.Counter()
+        self.dst_counts = collections.Counter()
+        self.num_other = 0
+        self.sender = None
+        if REPLY_TASK_DONE:
+            self.sender = BatchSender(self.iface, REPLY_PKT_LEN, BATCH_SIZE)
+            self.mac = interface_mac(self.iface)
+            self.ip = interface_ip(self.iface) or '0.0.0.0'
+            self.reply_templates = {}
+        self.num_replies = 0
+        self.reply_dropped = 0
         print (ip_address)
 
-    def receive_pkt(self):
-        sniff(filter=("ip src not %s and udp" % self.ip_address), prn = lambda x: self.handle_pkt(x))
+    def _reply_template(self, buf, frame_offset, cluster_id, local_cluster_id):
+        # TASK_DONE frame back to the source (MAC and IP) of the task at frame_offset (untagged, also for 802.1Q tasks)
+        src_ip_offset = ipv4_offset(buf, frame_offset) + 12
+        key = (bytes(buf[frame_offset + 6:frame_offset + 12]), bytes(buf[src_ip_offset:src_ip_offset + 4]), cluster_id, local_cluster_id)
+        template = self.reply_templates.get(key)
+        if template is None:
+            src_mac = ':'.join('%02x' % byte for byte in bytearray(key[0]))
+            src_ip = '.'.join(str(byte) for byte in bytearray(key[1]))
+            template = encode_frame(self.mac, src_mac, self.ip, src_ip,
+                                    (PKT_TYPE_TASK_DONE, cluster_id, local_cluster_id, self.rack_local_id, 0, 0, 0), REPLY_PKT_LEN)
+            self.reply_templates[key] = template
+        return template
 
-    def handle_pkt(self, pkt):
-        eth_kwargs = {
-            'src_mac': '01:02:03:04:05:06',
-            'dst_mac': 'AA:BB:CC:DD:EE:FF'
-        }
-        if not pkt[UDP]:
-            print("Packet not UDP")
-            return
+    def handle_batch(self, buf, frames):
+        unpack_from = FALCON_HDR.unpack_from
+        type_counts = self.type_counts
+        dst_counts = self.dst_counts
+        num_replies = 0
+        for offset, length in frames:
+            falcon = falcon_offset(buf, offset, length)
+            if falcon < 0:
+                self.num_other += 1
+                continue
+            pkt_type, cluster_id, local_cluster_id, _, dst_id, _, seq_num = unpack_from(buf, falcon)
+            type_counts[pkt_type] += 1
+            dst_counts[(pkt_type, dst_id)] += 1
+            if self.sender is not None and pkt_type == PKT_TYPE_NEW_TASK:
+                slot = num_replies * REPLY_PKT_LEN
+                self.sender.buf[slot:slot + REPLY_PKT_LEN] = self._reply_template(buf, offset, cluster_id, local_cluster_id)
+                stamp_seq_num(self.sender.buf, slot, seq_num)
+                num_replies += 1
+        if num_replies:
+            sent = self.sender.send(num_replies)
+            self.num_replies += sent
+            self.reply_dropped += num_replies - sent
 
-        if (pkt[UDP].dport==1234):
-            rcv_hdr = FalconPacket(pkt[UDP].payload)
+    def summary(self, label, run_time):
+        total = sum(self.type_counts.values())
+        print ('%s: %d falcon packets (%.0f pps), %d other frames, %d replies (%d dropped)' % (label, total,
+               total / max(run_time, 1e-9), self.num_other, self.num_replies, self.reply_dropped))
+        for pkt_type, count in sorted(self.type_counts.items()):
+            top = sorted(((count, dst_id) for (t, dst_id), count in self.dst_counts.items() if t == pkt_type), reverse=True)
+            print ('  %-20s %10d  dst_id %s' % (PKT_TYPE_NAMES.get(pkt_type, pkt_type), count,
+                   ', '.join('%d: %d' % (dst_id, n) for n, dst_id in top[:TOP_DST_IDS])))
+        sys.stdout.flush()
 
-            rcv_hdr.show()
-            print ("received packet")
-            
-            task_done_pkt = make_falcon_task_done_pkt(dst_ip=pkt[IP].src, cluster_id=rcv_hdr.cluster_id, local_cluster_id=rcv_hdr.local_cluster_id, src_id=int(self.rack_local_id), **eth_kwargs)
-            
-            #print('>> Task Done packet (size = %d bytes):' % len(task_done_pkt))
-            
-            #task_done_pkt.show()
-
-            send(task_done_pkt)
+    def receive_pkt(self, interval=1.0, duration=None):
+        start_time = time.time()
+        next_summary = start_time + interval
+        try:
+            while duration is None or time.time() - start_time < duration:
+                buf, frames = self.receiver.recv_batch(timeout=interval)
+                self.handle_batch(buf, frames)
+                now = time.time()
+                if now >= next_summary:
+                    self.summary('%.0f s' % (now - start_time), now - start_time)
+                    next_summary += interval
+        except KeyboardInterrupt:
+            pass
+        self.summary('Total', time.time() - start_time)
+        print ('%d system calls' % (self.receiver.num_syscalls))
+        self.receiver.close()
 
 if __name__ == '__main__':
+    mode = sys.argv[5] if len(sys.argv) > 5 else 'ring'
+    if len(sys.argv) < 4 or mode not in MODES:
+        print ('Usage: %s <host> <rack_local_id> <global_id> [iface] [ring|mmsg] [interval] [duration]' % sys.argv[0])
+        sys.exit(1)
     host_ip = sys.argv[1]
     local_id = sys.argv[2]
     global_id = sys.argv[3]
-    
-    worker = Worker(host_ip, local_id, global_id)
-    worker.receive_pkt()
+    iface = sys.argv[4] if len(sys.argv) > 4 else None
+    interval = float(sys.argv[6]) if len(sys.argv) > 6 else 1.0
+    duration = float(sys.argv[7]) if len(sys.argv) > 7 else None
+
+    worker = Worker(host_ip, local_id, global_id, iface, mode)
+    worker.receive_pkt(interval, duration)
@@ -14,57 +14,142 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
-#from socket import *
-from scapy.all import *
-from scapy.all import sniff, sendp
-from scapy.all import Packet
-from scapy.all import ShortField, IntField, LongField, BitField
-
-from falconpkts.pkts import *
-
+#
+# Sends new tasks at a target rate with AF_PACKET raw sockets (falconpkts/
+# rawsock.py) instead of one scapy send() per packet.
+#
+# The frames are encoded once per destination (falconpkts/codec.py), copied
+# into the slots of the send buffer and stamped with their seq_num in place,
+# then sent in batches of up to BATCH_SIZE frames per system call. A token
+# bucket sets the rate: tokens arrive at rps per second, evenly ('constant')
+# or as a Poisson process ('poisson'), and at most 2 * BATCH_SIZE tokens are
+# kept. A batch waits for as many tokens as arrive in MAX_BATCH_DELAY, so high
+# rates are sent in large batches and low rates frame by frame.
+# Tokens that arrive while the bucket is full are counted as late (the sender
+# cannot keep up), frames the kernel does not accept as dropped. The tasks go
+# to the clusters in round robin, each cluster to its own destination address.
+#
+# Usage:
+#
+#  python3 host_send.py [rps] [num_tasks] [constant|poisson] [cluster_id:dst_ip,...] [iface]
+#
+import random
 import sys
+import time
+
+from falconpkts.codec import encode_frame, stamp_seq_num, PKT_TYPE_NEW_TASK
+from falconpkts.rawsock import BatchSender, default_interface, interface_mac, interface_ip
 
 num_tasks = 1
 
-class SrcRoute(Packet):
-    name = "SrcRoute"
-    fields_desc = [
-        LongField("preamble", 0),
-        IntField("num_valid", 0)
-    ]
+BATCH_SIZE = 64
+PKT_LEN = 128
+LOCAL_CLUSTER_ID = 1
+SRC_ID = 6
+FIRST_SEQ_NUM = 0x10
+DST_MAC = 'AA:BB:CC:DD:EE:FF'
+MAX_BATCH_DELAY = 0.0001 # s
+REPORT_INTERVAL = 1.0
 
-def read_topo():
-    nb_hosts = 0
-    nb_switches = 0
-    links = []
-    with open("topo.txt", "r") as f:
-        line = f.readline()[:-1]
-        w, nb_switches = line.split()
-        assert(w == "switches")
-        line = f.readline()[:-1]
-        w, nb_hosts = line.split()
-        assert(w == "hosts")
-        for line in f:
-            if not f: break
-            a, b = line.split()
-            links.append( (a, b) )
-    return int(nb_hosts), int(nb_switches), links
+class TokenBucket():
+    def __init__(self, rate, burst, distribution='constant', seed=None):
+        self.rate = float(rate)
+        self.burst = burst
+        self.poisson = distribution == 'poisson'
+        self.rng = random.Random(seed)
+        self.tokens = 0.0
+        self.last = time.time()
+        self.next_arrival = self.last + self.rng.expovariate(self.rate)
+        self.late = 0
 
-def main():
-    eth_kwargs = {
-        'src_mac': '01:02:03:04:05:06',
-        'dst_mac': 'AA:BB:CC:DD:EE:FF'
-    }
+    def take(self, n, at_least=1):
+        # Up to n tokens, none if less than at_least are available
+        now = time.time()
+        if self.poisson:
+            while self.next_arrival <= now:
+                self.tokens += 1
+                self.next_arrival += self.rng.expovariate(self.rate)
+        else:
+            self.tokens += (now - self.last) * self.rate
+        self.last = now
+        if self.tokens > self.burst:
+            self.late += int(self.tokens - self.burst)
+            self.tokens = float(self.burst)
+        n = min(n, int(self.tokens))
+        if n < at_least:
+            return 0
+        self.tokens -= n
+        return n
 
-    _dst_ip = '10.0.2.101'
+    def wait(self, n=1):
+        # Sleeps until about n tokens are available, short waits spin
+        if self.poisson:
+            delay = self.next_arrival - time.time() + (n - 1 - self.tokens) / self.rate
+        else:
+            delay = (n - self.tokens) / self.rate
+        if delay > 0.001:
+            time.sleep(delay)
 
-    for i in range(num_tasks):
-        new_task_packet = make_falcon_task_pkt(dst_ip=_dst_ip, cluster_id=5, local_cluster_id=1, src_id=6, **eth_kwargs)
+def parse_destinations(arg):
+    destinations = []
+    for item in arg.split(','):
+        cluster_id, dst_ip = item.split(':')
+        destinations.append((int(cluster_id), dst_ip))
+    return destinations
 
-        print('>> New Task packet (size = %d bytes):' % len(new_task_packet))
-        #new_task_packet.show()
+def report(label, num_sent, dropped, late, run_time, rps):
+    print ('%s: %d tasks sent in %.2f s (%.0f pps, target %.0f), %d dropped, %d late' % (label, num_sent, run_time,
+           num_sent / max(run_time, 1e-9), rps, dropped, late))
+    sys.stdout.flush()
 
-        send(new_task_packet)
+def send_tasks(rps, num_tasks, distribution, destinations, iface):
+    src_mac = interface_mac(iface)
+    src_ip = interface_ip(iface) or '0.0.0.0'
+    templates = [encode_frame(src_mac, DST_MAC, src_ip, dst_ip,
+                              (PKT_TYPE_NEW_TASK, cluster_id, LOCAL_CLUSTER_ID, SRC_ID, 0, 0, 0), PKT_LEN)
+                 for cluster_id, dst_ip in destinations]
+    frame_len = len(templates[0])
+    sender = BatchSender(iface, frame_len, BATCH_SIZE)
+    bucket = TokenBucket(rps, 2 * BATCH_SIZE, distribution)
+    min_batch = max(1, min(BATCH_SIZE, int(rps * MAX_BATCH_DELAY)))
+    buf = sender.buf
+    num_sent = 0
+    dropped = 0
+    task = 0
+    start_time = time.time()
+    next_report = start_time + REPORT_INTERVAL
+    while task < num_tasks:
+        want = min(BATCH_SIZE, num_tasks - task)
+        n = bucket.take(want, min(min_batch, want))
+        if n == 0:
+            bucket.wait(min(min_batch, want))
+            continue
+        for i in range(n):
+            offset = i * frame_len
+            buf[offset:offset + frame_len] = templates[(task + i) % len(templates)]
+            stamp_seq_num(buf, offset, FIRST_SEQ_NUM + task + i)
+        sent = sender.send(n)
+        num_sent += sent
+        dropped += n - sent
+        task += n
+        now = time.time()
+        if now >= next_report:
+            report('%.0f s' % (now - start_time), num_sent, dropped, bucket.late, now - start_time, rps)
+            next_report += REPORT_INTERVAL
+    report('Total', num_sent, dropped, bucket.late, time.time() - start_time, rps)
+    print ('%d system calls (%.1f tasks per call)' % (sender.num_syscalls, task / float(max(1, sender.num_syscalls))))
+    sender.close()
+
+def main():
+    rps = float(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    tasks = int(sys.argv[2]) if len(sys.argv) > 2 else num_tasks
+    distribution = sys.argv[3] if len(sys.argv) > 3 else 'constant'
+    destinations = parse_destinations(sys.argv[4]) if len(sys.argv) > 4 else [(5, '10.0.2.101')]
+    iface = sys.argv[5] if len(sys.argv) > 5 else default_interface()
+    if distribution not in ('constant', 'poisson'):
+        print ('Usage: %s [rps] [num_tasks] [constant|poisson] [cluster_id:dst_ip,...] [iface]' % sys.argv[0])
+        sys.exit(1)
+    send_tasks(rps, tasks, distribution, destinations, iface)
 
 
 if __name__ == '__main__':
@@ -11,78 +11,110 @@ import random
 import collections
 import math
 import numpy as np
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..'))
+from switch_ctrl.registers import register_snapshot, register_read, pipe_view, print_register_snapshot, print_counter_snapshot
+from switch_ctrl.latency import TstampHarvester
+from switch_ctrl.poller import Poller
+from switch_ctrl.tables import TableRegistry
+from switch_ctrl.instrument import enable_bfrt_stats
+from switch_ctrl.recorder import open_recorder
+from switch_ctrl.topology import Plan, diff_plans, apply_plan_diff, read_installed_plan
 
 DEBUG_DUMP_REGS = False
 
+# Poll periods (seconds) for each register group, see switch_ctrl/poller.py
+COUNTERS_POLL_PERIOD = 0.1 # Only feeds the recorders
+COUNTERS_PRINT_PERIOD = 2 # Counter totals of the last poll, also printed at exit
+QUEUE_LEN_POLL_PERIOD = 1
+LATENCY_POLL_PERIOD = 2
+
+# Polled counter snapshots are appended to binary recordings in this directory
+# (see switch_ctrl/recorder.py), None disables recording. Set with --stats-dir <dir>
+STATS_DIR = None
+RECORD_QUEUE_LEN = False # Also record the full queue_len_list_1 on every queue length poll
+
+# Per table/operation BFRT call stats, printed on SIGUSR1 and at exit (see switch_ctrl/instrument.py).
+# Off by default, enabled with --bfrt-stats
+BFRT_STATS = False
+
+# How the per-pipe stat_count_* values are combined into the reported totals:
+# 'sum' (all pipes, e.g. leaf and spine on different pipes), 'max' or a pipe id
+COUNTER_VIEW = 'sum'
+# The latency samples are harvested from every pipe, or only from the pipe of COUNTER_VIEW
+LATENCY_PIPE = COUNTER_VIEW if isinstance(COUNTER_VIEW, int) else None
+
 TEST_VCLUSTER_ID = 0
 MAX_VCLUSTER_WORKERS = 32
 INVALID_VALUE_8bit = 0x7F
 INVALID_VALUE_16bit = 0x7FFF
 
-def register_write(target, register_object, register_name, index, register_value):
-        print("Inserting entry in %s[%d] register with value = %s " %(str(register_name), index, str(register_value)))
-
-        register_object.entry_add(
-            target,
-            [register_object.make_key([client.KeyTuple('$REGISTER_INDEX', index)])],
-            [register_object.make_data([client.DataTuple(register_name, register_value)])])
-
-def test_register_read(target, register_object, register_name, pipe_id, index, print_reg=True):    
-    resp = register_object.entry_get(
-            target,
-            [register_object.make_key([client.KeyTuple('$REGISTER_INDEX', index)])],
-            {"from_hw": True})
-    
-    data_dict = next(resp)[0].to_dict()
-    res = data_dict[register_name][0]
+def test_register_read(target, register_object, register_name, pipe_id, index, print_reg=True):
+    # pipe_id: a pipe id or a view over all pipes ('sum', 'max'), see switch_ctrl/registers.py
+    res = int(register_read(target, register_object, register_name, index, pipe_id))
     if print_reg:
         print("Reading Register: %s [%d] = %d" %(str(register_name), index, res))
     return res
 
 class LeafController():
-    def __init__(self, target, bfrt_info, setup):
+    def __init__(self, target, bfrt_info, setup, stats_dir=STATS_DIR):
         self.target = target
         self.bfrt_info = bfrt_info
+        self.stats_dir = stats_dir
+        self.table_registry = TableRegistry(bfrt_info) # Table handles and cached key/data builders
         self.tables = []
         self.setup = setup
+        self.installed_plan = Plan() # What has been pushed to the switch so far
+        self.stat_count_resub = None # Last counter snapshots, see print_counters()
+        self.stat_count_signals = None # (load, idle)
         self.init_tables()
         self.init_data()
         
 
     def init_tables(self):
-        bfrt_info = self.bfrt_info
-        self.register_idle_count = bfrt_info.table_get("LeafIngress.idle_count")
-        self.register_idle_list = bfrt_info.table_get("LeafIngress.idle_list")
-        self.register_aggregate_queue_len = bfrt_info.table_get("LeafIngress.aggregate_queue_len_list")
-        self.register_linked_sq_sched = bfrt_info.table_get("LeafIngress.linked_sq_sched")
-        self.register_linked_iq_sched = bfrt_info.table_get("LeafIngress.linked_iq_sched")
-        self.register_queue_len_list_1 = bfrt_info.table_get("LeafIngress.queue_len_list_1")
-        self.register_queue_len_list_2 = bfrt_info.table_get("LeafIngress.queue_len_list_2")
-        self.register_deferred_list_1 = bfrt_info.table_get("LeafIngress.deferred_queue_len_list_1")
-        self.register_deferred_list_2 = bfrt_info.table_get("LeafIngress.deferred_queue_len_list_2")
-        self.register_stat_count_resub = bfrt_info.table_get("LeafIngress.stat_count_resub")
-        self.register_stat_count_idle_signal = bfrt_info.table_get("LeafIngress.stat_count_idle_signal")
-        self.register_stat_count_load_signal = bfrt_info.table_get("LeafIngress.stat_count_load_signal")
-        self.register_stat_count_task = bfrt_info.table_get("LeafIngress.stat_count_task")
-        self.register_ingress_tstamp = bfrt_info.table_get("LeafIngress.ingress_tstamp")
-        self.register_egress_tstamp = bfrt_info.table_get("SaqrEgress.egress_tstamp")
+        table_registry = self.table_registry
+        self.register_idle_count = table_registry.table_get("LeafIngress.idle_count")
+        self.register_idle_list = table_registry.table_get("LeafIngress.idle_list")
+        self.register_aggregate_queue_len = table_registry.table_get("LeafIngress.aggregate_queue_len_list")
+        self.register_linked_sq_sched = table_registry.table_get("LeafIngress.linked_sq_sched")
+        self.register_linked_iq_sched = table_registry.table_get("LeafIngress.linked_iq_sched")
+        self.register_queue_len_list_1 = table_registry.table_get("LeafIngress.queue_len_list_1")
+        self.register_queue_len_list_2 = table_registry.table_get("LeafIngress.queue_len_list_2")
+        self.register_deferred_list_1 = table_registry.table_get("LeafIngress.deferred_queue_len_list_1")
+        self.register_deferred_list_2 = table_registry.table_get("LeafIngress.deferred_queue_len_list_2")
+        self.register_stat_count_resub = table_registry.table_get("LeafIngress.stat_count_resub")
+        self.register_stat_count_idle_signal = table_registry.table_get("LeafIngress.stat_count_idle_signal")
+        self.register_stat_count_load_signal = table_registry.table_get("LeafIngress.stat_count_load_signal")
+        self.register_stat_count_task = table_registry.table_get("LeafIngress.stat_count_task")
+        self.register_ingress_tstamp = table_registry.table_get("LeafIngress.ingress_tstamp")
+        self.register_egress_tstamp = table_registry.table_get("SaqrEgress.egress_tstamp")
+        # Per-task processing latency is streamed to leaf_latency.bin (uint32 ns per task)
+        self.latency_harvester = TstampHarvester(self.target,
+            self.register_stat_count_task, 'LeafIngress.stat_count_task.f1',
+            self.register_ingress_tstamp, 'LeafIngress.ingress_tstamp.f1',
+            self.register_egress_tstamp, 'SaqrEgress.egress_tstamp.f1',
+            pipe_id=LATENCY_PIPE, output_file='leaf_latency.bin')
+        self.recorder_resub = open_recorder(self.stats_dir, 'LeafIngress.stat_count_resub.f1')
+        self.recorder_load_signal = open_recorder(self.stats_dir, 'LeafIngress.stat_count_load_signal.f1')
+        self.recorder_idle_signal = open_recorder(self.stats_dir, 'LeafIngress.stat_count_idle_signal.f1')
+        self.recorder_task = open_recorder(self.stats_dir, 'LeafIngress.stat_count_task.f1')
+        self.recorder_queue_len = open_recorder(self.stats_dir if RECORD_QUEUE_LEN else None, 'LeafIngress.queue_len_list_1.f1')
 
         # MA Tables
-        self.forward_saqr_switch_dst = bfrt_info.table_get("LeafIngress.forward_saqr_switch_dst")
+        self.forward_saqr_switch_dst = table_registry.table_get("LeafIngress.forward_saqr_switch_dst")
         self.forward_saqr_switch_dst.info.key_field_annotation_add("hdr.saqr.dst_id", "wid")
-        self.set_queue_len_unit = bfrt_info.table_get("LeafIngress.set_queue_len_unit")
+        self.set_queue_len_unit = table_registry.table_get("LeafIngress.set_queue_len_unit")
         self.set_queue_len_unit.info.key_field_annotation_add("hdr.saqr.cluster_id", "vcid")
-        self.get_cluster_num_valid = bfrt_info.table_get("LeafIngress.get_cluster_num_valid")
+        self.get_cluster_num_valid = table_registry.table_get("LeafIngress.get_cluster_num_valid")
         self.get_cluster_num_valid.info.key_field_annotation_add("hdr.saqr.cluster_id", "vcid")
-        self.adjust_random_range_ds = bfrt_info.table_get("LeafIngress.adjust_random_range_ds")
+        self.adjust_random_range_ds = table_registry.table_get("LeafIngress.adjust_random_range_ds")
         self.adjust_random_range_ds.info.key_field_annotation_add("saqr_md.cluster_num_valid_ds", "num_valid_ds")
-        self.adjust_random_range_us = bfrt_info.table_get("LeafIngress.adjust_random_range_us")
+        self.adjust_random_range_us = table_registry.table_get("LeafIngress.adjust_random_range_us")
         self.adjust_random_range_us.info.key_field_annotation_add("saqr_md.cluster_num_valid_us", "num_valid_us")
-        self.get_spine_dst_id = bfrt_info.table_get("LeafIngress.get_spine_dst_id")
+        self.get_spine_dst_id = table_registry.table_get("LeafIngress.get_spine_dst_id")
         self.get_spine_dst_id.info.key_field_annotation_add("saqr_md.random_id_1", "random_id")
 
         # HW config tables (Mirror and multicast)
-        self.mirror_cfg_table = bfrt_info.table_get("$mirror.cfg")
+        self.mirror_cfg_table = table_registry.table_get("$mirror.cfg")
 
     def init_data(self):
         self.pipe_id = 0
@@ -151,294 +183,231 @@ class LeafController():
         for leaf_id in range(self.NUM_LEAVES):
             self.workers_start_idx.append(leaf_id * self.MAX_VCLUSTER_WORKERS)
 
-    def set_tables(self):
+    def compile_plan(self):
+        # Desired table entries and initial register values, see switch_ctrl/topology.py
+        plan = Plan()
         for leaf_id in range(self.NUM_LEAVES):
-            print(" *********  Virtual Leaf: " + str(leaf_id) + "  *********  ")
-            print("********* Inserting initial Reg Entires *********")
-            
-            register_write(self.target,
-                    self.register_linked_iq_sched,
-                    register_name='LeafIngress.linked_iq_sched.f1',
-                    index=leaf_id,
-                    register_value=self.initial_linked_iq_spine)
-
-            register_write(self.target,
-                    self.register_linked_sq_sched,
-                    register_name='LeafIngress.linked_sq_sched.f1',
-                    index=leaf_id,
-                    register_value=self.initial_linked_sq_spine)
-
-            register_write(self.target,
-                self.register_idle_count,
-                register_name='LeafIngress.idle_count.f1',
-                index=leaf_id,
-                register_value=self.initial_idle_count[leaf_id])
-        
-            register_write(self.target,
-                    self.register_aggregate_queue_len,
-                    register_name='LeafIngress.aggregate_queue_len_list.f1',
-                    index=leaf_id,
-                    register_value=self.initial_agg_qlen)
+            plan.set_register('LeafIngress.linked_iq_sched.f1', leaf_id, self.initial_linked_iq_spine)
+            plan.set_register('LeafIngress.linked_sq_sched.f1', leaf_id, self.initial_linked_sq_spine)
+            plan.set_register('LeafIngress.idle_count.f1', leaf_id, self.initial_idle_count[leaf_id])
+            plan.set_register('LeafIngress.aggregate_queue_len_list.f1', leaf_id, self.initial_agg_qlen)
+            # Insert idle_list values (wid of idle workers)
+            plan.set_register_range('LeafIngress.idle_list.f1',
+                    self.workers_start_idx[leaf_id],
+                    [self.workers_start_idx[leaf_id] + wid for wid in self.initial_idle_list[leaf_id]])
+            plan.set_register_range('LeafIngress.queue_len_list_1.f1', self.workers_start_idx[leaf_id], self.intitial_qlen_state)
+            plan.set_register_range('LeafIngress.queue_len_list_2.f1', self.workers_start_idx[leaf_id], self.intitial_qlen_state)
+            plan.set_register_range('LeafIngress.deferred_queue_len_list_1.f1', self.workers_start_idx[leaf_id], self.intitial_deferred_state)
 
+            for i in range(self.num_valid_us_elements): # TODO: Make number of spines dynamic
+                plan.add_entry('LeafIngress.get_spine_dst_id',
+                    [('saqr_md.random_id_1', i), ('hdr.saqr.cluster_id', leaf_id)],
+                    'LeafIngress.act_get_spine_dst_id',
+                    [('spine_dst_id', 100)])
+
+            for wid, port in self.wid_port_mapping[leaf_id].items():
+                plan.add_entry('LeafIngress.forward_saqr_switch_dst',
+                    [('hdr.saqr.dst_id', self.workers_start_idx[leaf_id] + wid)],
+                    'LeafIngress.act_forward_saqr',
+                    [('port', port), ('dst_mac', self.port_mac_mapping[port])])
+            plan.add_entry('LeafIngress.get_cluster_num_valid',
+                [('hdr.saqr.cluster_id', leaf_id)],
+                'LeafIngress.act_get_cluster_num_valid',
+                [('num_ds_elements', self.num_valid_ds_elements[leaf_id]), ('num_us_elements', self.num_valid_us_elements)])
+            # Insert qlen unit entries
+            plan.add_entry('LeafIngress.set_queue_len_unit',
+                [('hdr.saqr.cluster_id', leaf_id)],
+                'LeafIngress.act_set_queue_len_unit',
+                [('cluster_unit', self.qlen_unit[leaf_id])])
+
+        plan.add_entry('LeafIngress.forward_saqr_switch_dst',
+            [('hdr.saqr.dst_id', self.CPU_PORT_ID)],
+            'LeafIngress.act_forward_saqr',
+            [('port', self.CPU_PORT_ID), ('dst_mac', self.port_mac_mapping[self.CPU_PORT_ID])])
+
+        for sid, port in self.spine_port_mapping.items():
+            plan.add_entry('LeafIngress.forward_saqr_switch_dst',
+                [('hdr.saqr.dst_id', sid)],
+                'LeafIngress.act_forward_saqr',
+                [('port', port), ('dst_mac', self.port_mac_mapping[port])])
+            plan.add_entry('$mirror.cfg',
+                [('$sid', sid)],
+                '$normal',
+                [('$direction', 'INGRESS'), ('$ucast_egress_port', port), ('$ucast_egress_port_valid', True), ('$session_enable', True)])
+
+        for num_valid_ds, action_name in ((2, 'LeafIngress.adjust_random_worker_range_1'),
+                                          (4, 'LeafIngress.adjust_random_worker_range_2'),
+                                          (8, 'LeafIngress.adjust_random_worker_range_3'),
+                                          (16, 'LeafIngress.adjust_random_worker_range_4'),
+                                          (32, 'LeafIngress.adjust_random_worker_range_5'),
+                                          (256, 'LeafIngress.adjust_random_worker_range_8')):
+            plan.add_entry('LeafIngress.adjust_random_range_ds', [('saqr_md.cluster_num_valid_ds', num_valid_ds)], action_name)
+        for num_valid_us, action_name in ((2, 'LeafIngress.adjust_random_worker_range_1'),
+                                          (4, 'LeafIngress.adjust_random_worker_range_2'),
+                                          (8, 'LeafIngress.adjust_random_worker_range_3'),
+                                          (16, 'LeafIngress.adjust_random_worker_range_4'),
+                                          (256, 'LeafIngress.adjust_random_worker_range_8')):
+            plan.add_entry('LeafIngress.adjust_random_range_us', [('saqr_md.cluster_num_valid_us', num_valid_us)], action_name)
+        return plan
+
+    def set_tables(self, warm_start=False):
+        # warm_start: reconcile with the entries already on the switch and keep the live register state
+        print("********* Populating Table Entires *********")
+        desired_plan = self.compile_plan()
+        if warm_start:
+            self.installed_plan = read_installed_plan(self.target, self.table_registry, desired_plan)
+        apply_plan_diff(self.target, self.table_registry, diff_plans(self.installed_plan, desired_plan))
+        self.installed_plan = desired_plan
+        for leaf_id in range(self.NUM_LEAVES):
             test_register_read(self.target,
                 self.register_idle_count,
                 'LeafIngress.idle_count.f1',
                 self.pipe_id,
                 leaf_id)
 
-            # Insert idle_list values (wid of idle workers)
-            for i in range(self.initial_idle_count[leaf_id]):
-                register_write(self.target,
-                    self.register_idle_list,
-                    register_name='LeafIngress.idle_list.f1',
-                    index= self.workers_start_idx[leaf_id] + i,
-                    register_value=self.workers_start_idx[leaf_id] + self.initial_idle_list[leaf_id][i])
-
-            for i, qlen in enumerate(self.intitial_qlen_state):
-                register_write(self.target,
-                        self.register_queue_len_list_1,
-                        register_name='LeafIngress.queue_len_list_1.f1',
-                        index=self.workers_start_idx[leaf_id] + i,
-                        register_value=qlen)
-                register_write(self.target,
-                        self.register_queue_len_list_2,
-                        register_name='LeafIngress.queue_len_list_2.f1',
-                        index=self.workers_start_idx[leaf_id] + i,
-                        register_value=qlen)
-                register_write(self.target,
-                        self.register_deferred_list_1,
-                        register_name='LeafIngress.deferred_queue_len_list_1.f1',
-                        index=self.workers_start_idx[leaf_id] + i,
-                        register_value=self.intitial_deferred_state[i])
-
-            for i in range(self.num_valid_us_elements): # TODO: Make number of spines dynamic
-                self.get_spine_dst_id.entry_add(
-                    self.target,
-                    [self.get_spine_dst_id.make_key([client.KeyTuple('saqr_md.random_id_1', i), client.KeyTuple('hdr.saqr.cluster_id', leaf_id)])],
-                    [self.get_spine_dst_id.make_data([client.DataTuple('spine_dst_id', 100)],
-                                                 'LeafIngress.act_get_spine_dst_id')]
-                )
-
-            print("********* Populating Table Entires *********")
-            for wid in self.wid_port_mapping[leaf_id].keys():
-                self.forward_saqr_switch_dst.entry_add(
-                    self.target,
-                    [self.forward_saqr_switch_dst.make_key([client.KeyTuple('hdr.saqr.dst_id', self.workers_start_idx[leaf_id] + wid)])],
-                    [self.forward_saqr_switch_dst.make_data([client.DataTuple('port', self.wid_port_mapping[leaf_id][wid]), client.DataTuple('dst_mac', client.mac_to_bytes(self.port_mac_mapping[self.wid_port_mapping[leaf_id][wid]]))],
-                                                 'LeafIngress.act_forward_saqr')]
-                )
-                #print("Inserted entries in forward_saqr_switch_dst table with key-values = " + str(self.wid_port_mapping[leaf_id]))
-            
-            
-            self.get_cluster_num_valid.entry_add(
-                self.target,
-                [self.get_cluster_num_valid.make_key([client.KeyTuple('hdr.saqr.cluster_id', leaf_id)])],
-                [self.get_cluster_num_valid.make_data([client.DataTuple('num_ds_elements', self.num_valid_ds_elements[leaf_id]), client.DataTuple('num_us_elements', self.num_valid_us_elements)],
-                                             'LeafIngress.act_get_cluster_num_valid')]
-            )
-            # Insert qlen unit entries
-            self.set_queue_len_unit.entry_add(
-                    self.target,
-                    [self.set_queue_len_unit.make_key([client.KeyTuple('hdr.saqr.cluster_id', leaf_id)])],
-                    [self.set_queue_len_unit.make_data([client.DataTuple('cluster_unit', self.qlen_unit[leaf_id])],
-                                                 'LeafIngress.act_set_queue_len_unit')]
-                )
-
-        self.forward_saqr_switch_dst.entry_add(
-                self.target,
-                [self.forward_saqr_switch_dst.make_key([client.KeyTuple('hdr.saqr.dst_id', self.CPU_PORT_ID)])],
-                [self.forward_saqr_switch_dst.make_data([client.DataTuple('port', self.CPU_PORT_ID), client.DataTuple('dst_mac', client.mac_to_bytes(self.port_mac_mapping[self.CPU_PORT_ID]))],
-                                             'LeafIngress.act_forward_saqr')]
-            )
-
-        for sid in self.spine_port_mapping.keys():
-            self.forward_saqr_switch_dst.entry_add(
-                self.target,
-                [self.forward_saqr_switch_dst.make_key([client.KeyTuple('hdr.saqr.dst_id', sid)])],
-                [self.forward_saqr_switch_dst.make_data([client.DataTuple('port', self.spine_port_mapping[sid]), client.DataTuple('dst_mac', client.mac_to_bytes(self.port_mac_mapping[self.spine_port_mapping[sid]]))],
-                                             'LeafIngress.act_forward_saqr')]
-            )
-            mirror_cfg_bfrt_key  = self.mirror_cfg_table.make_key([client.KeyTuple('$sid', sid)])
-            mirror_cfg_bfrt_data = self.mirror_cfg_table.make_data([
-                client.DataTuple('$direction', str_val="INGRESS"),
-                client.DataTuple('$ucast_egress_port', self.spine_port_mapping[sid]),
-                client.DataTuple('$ucast_egress_port_valid', bool_val=True),
-                client.DataTuple('$session_enable', bool_val=True),
-            ], "$normal")
-            self.mirror_cfg_table.entry_add(self.target, [ mirror_cfg_bfrt_key ], [ mirror_cfg_bfrt_data ])
-
-        self.adjust_random_range_ds.entry_add(
-                self.target,
-                [self.adjust_random_range_ds.make_key([client.KeyTuple('saqr_md.cluster_num_valid_ds', 2)])],
-                [self.adjust_random_range_ds.make_data([], 'LeafIngress.adjust_random_worker_range_1')]
-            )
-        self.adjust_random_range_ds.entry_add(
-                self.target,
-                [self.adjust_random_range_ds.make_key([client.KeyTuple('saqr_md.cluster_num_valid_ds', 4)])],
-                [self.adjust_random_range_ds.make_data([], 'LeafIngress.adjust_random_worker_range_2')]
-            )
-        self.adjust_random_range_ds.entry_add(
-                self.target,
-                [self.adjust_random_range_ds.make_key([client.KeyTuple('saqr_md.cluster_num_valid_ds', 8)])],
-                [self.adjust_random_range_ds.make_data([], 'LeafIngress.adjust_random_worker_range_3')]
-            )
-        self.adjust_random_range_ds.entry_add(
-                self.target,
-                [self.adjust_random_range_ds.make_key([client.KeyTuple('saqr_md.cluster_num_valid_ds', 16)])],
-                [self.adjust_random_range_ds.make_data([], 'LeafIngress.adjust_random_worker_range_4')]
-            )
-        self.adjust_random_range_ds.entry_add(
-                self.target,
-                [self.adjust_random_range_ds.make_key([client.KeyTuple('saqr_md.cluster_num_valid_ds', 32)])],
-                [self.adjust_random_range_ds.make_data([], 'LeafIngress.adjust_random_worker_range_5')]
-            )
-        self.adjust_random_range_ds.entry_add(
-                self.target,
-                [self.adjust_random_range_ds.make_key([client.KeyTuple('saqr_md.cluster_num_valid_ds', 256)])],
-                [self.adjust_random_range_ds.make_data([], 'LeafIngress.adjust_random_worker_range_8')]
-            )
-
-        self.adjust_random_range_us.entry_add(
-                self.target,
-                [self.adjust_random_range_us.make_key([client.KeyTuple('saqr_md.cluster_num_valid_us', 2)])],
-                [self.adjust_random_range_ds.make_data([], 'LeafIngress.adjust_random_worker_range_1')]
-            )
-        self.adjust_random_range_us.entry_add(
-                self.target,
-                [self.adjust_random_range_us.make_key([client.KeyTuple('saqr_md.cluster_num_valid_us', 4)])],
-                [self.adjust_random_range_us.make_data([], 'LeafIngress.adjust_random_worker_range_2')]
-            )
-        self.adjust_random_range_us.entry_add(
-                self.target,
-                [self.adjust_random_range_us.make_key([client.KeyTuple('saqr_md.cluster_num_valid_us', 8)])],
-                [self.adjust_random_range_us.make_data([], 'LeafIngress.adjust_random_worker_range_3')]
-            )
-        self.adjust_random_range_us.entry_add(
-                self.target,
-                [self.adjust_random_range_us.make_key([client.KeyTuple('saqr_md.cluster_num_valid_us', 16)])],
-                [self.adjust_random_range_us.make_data([], 'LeafIngress.adjust_random_worker_range_4')]
-            )
-        self.adjust_random_range_us.entry_add(
-                self.target,
-                [self.adjust_random_range_us.make_key([client.KeyTuple('saqr_md.cluster_num_valid_us', 256)])],
-                [self.adjust_random_range_us.make_data([], 'LeafIngress.adjust_random_worker_range_8')]
-            )
+    def read_queue_len_lists(self):
+        num_vclusters = len(self.initial_idle_list)
+        num_entries = max(self.workers_start_idx[k] + len(self.initial_idle_list[k]) for k in range(num_vclusters))
+        idle_list = register_snapshot(self.target,
+            self.register_idle_list,
+            'LeafIngress.idle_list.f1',
+            0,
+            num_entries)
+        queue_len_list_1 = register_snapshot(self.target,
+            self.register_queue_len_list_1,
+            'LeafIngress.queue_len_list_1.f1',
+            0,
+            num_entries)
+        deferred_list_1 = register_snapshot(self.target,
+            self.register_deferred_list_1,
+            'LeafIngress.deferred_queue_len_list_1.f1',
+            0,
+            num_entries)
+        if self.recorder_queue_len is not None:
+            self.recorder_queue_len.append(queue_len_list_1)
+        for k in range(num_vclusters):
+            start_idx = self.workers_start_idx[k]
+            end_idx = start_idx + len(self.initial_idle_list[k])
+            print_register_snapshot('LeafIngress.idle_list.f1', start_idx, idle_list[:, start_idx:end_idx], self.pipe_id)
+        for k in range(num_vclusters):
+            start_idx = self.workers_start_idx[k]
+            end_idx = start_idx + len(self.initial_idle_list[k])
+            print_register_snapshot('LeafIngress.queue_len_list_1.f1', start_idx, queue_len_list_1[:, start_idx:end_idx], self.pipe_id)
+            print_register_snapshot('LeafIngress.deferred_queue_len_list_1.f1', start_idx, deferred_list_1[:, start_idx:end_idx], self.pipe_id)
+        print_register_snapshot('LeafIngress.idle_count.f1',
+            0,
+            register_snapshot(self.target, self.register_idle_count, 'LeafIngress.idle_count.f1', 0, num_vclusters),
+            self.pipe_id)
+
+    def read_resub_counters(self):
+        stat_count_resub = register_snapshot(self.target,
+            self.register_stat_count_resub,
+            'LeafIngress.stat_count_resub.f1',
+            0,
+            len(self.initial_idle_list))
+        if self.recorder_resub is not None:
+            self.recorder_resub.append(stat_count_resub)
+        self.stat_count_resub = stat_count_resub
+        return int(pipe_view(stat_count_resub, COUNTER_VIEW).sum())
+
+    def read_signal_counters(self):
+        num_vclusters = len(self.initial_idle_list)
+        stat_count_load_signal = register_snapshot(self.target,
+            self.register_stat_count_load_signal,
+            'LeafIngress.stat_count_load_signal.f1',
+            0,
+            num_vclusters)
+        stat_count_idle_signal = register_snapshot(self.target,
+            self.register_stat_count_idle_signal,
+            'LeafIngress.stat_count_idle_signal.f1',
+            0,
+            num_vclusters)
+        if self.recorder_load_signal is not None:
+            self.recorder_load_signal.append(stat_count_load_signal)
+            self.recorder_idle_signal.append(stat_count_idle_signal)
+        self.stat_count_signals = (stat_count_load_signal, stat_count_idle_signal)
+        return int(pipe_view(stat_count_load_signal, COUNTER_VIEW).sum()), int(pipe_view(stat_count_idle_signal, COUNTER_VIEW).sum())
+
+    def print_counters(self):
+        # Totals of the last snapshots of read_resub_counters() and read_signal_counters()
+        stat_count_resub = self.stat_count_resub
+        if stat_count_resub is not None:
+            print_counter_snapshot('LeafIngress.stat_count_resub.f1', 0, stat_count_resub)
+            print ("Leaf Total Resubmission: %d" %(int(pipe_view(stat_count_resub, COUNTER_VIEW).sum())))
+        if self.stat_count_signals is not None:
+            stat_count_load_signal, stat_count_idle_signal = self.stat_count_signals
+            print_counter_snapshot('LeafIngress.stat_count_load_signal.f1', 0, stat_count_load_signal)
+            print_counter_snapshot('LeafIngress.stat_count_idle_signal.f1', 0, stat_count_idle_signal)
+            total_msg_load = int(pipe_view(stat_count_load_signal, COUNTER_VIEW).sum())
+            total_msg_idle = int(pipe_view(stat_count_idle_signal, COUNTER_VIEW).sum())
+            print ("Total Msgs for Load Signals: %d" %(total_msg_load))
+            print ("Total Msgs for Idle Signals: %d" %(total_msg_idle))
+            print ("Sum Total State Update Msgs: %d" %(total_msg_load+total_msg_idle))
+
+    def read_latency(self):
+        self.latency_harvester.poll()
+        if self.recorder_task is not None:
+            self.recorder_task.append(self.latency_harvester.task_count_snapshot)
+        print ("Total tasks arrived at Leaf: %d" %(pipe_view(self.latency_harvester.task_count_snapshot, COUNTER_VIEW)[0]))
+        self.latency_harvester.print_stats('Leaf')
 
     def read_reg_stats(self):
         if DEBUG_DUMP_REGS:
-            for k in range(4):
-                for i in range(len(self.initial_idle_list[k])):
-                    test_register_read(self.target,
-                        self.register_idle_list,
-                        'LeafIngress.idle_list.f1',
-                        self.pipe_id,
-                        self.workers_start_idx[k] + i)
-            for k in range(4):
-                for i in range(len(self.initial_idle_list[k])):
-                    test_register_read(self.target,
-                        self.register_queue_len_list_1,
-                        'LeafIngress.queue_len_list_1.f1',
-                        self.pipe_id,
-                        self.workers_start_idx[k] + i)
-                    test_register_read(self.target,
-                        self.register_deferred_list_1,
-                        'LeafIngress.deferred_queue_len_list_1.f1',
-                        self.pipe_id,
-                        self.workers_start_idx[k] + i)
-        total_resub_leaf = 0
-        total_msg_load = 0
-        total_msg_idle = 0
-        for i in range(len(self.initial_idle_list)):
-            if DEBUG_DUMP_REGS:
-                test_register_read(self.target,
-                    self.register_idle_count,
-                    'LeafIngress.idle_count.f1',
-                    self.pipe_id,
-                    i)
-            total_resub_leaf += test_register_read(self.target,
-                self.register_stat_count_resub,
-                'LeafIngress.stat_count_resub.f1',
-                self.pipe_id,
-                i)
-            total_msg_load += test_register_read(self.target,
-                self.register_stat_count_load_signal,
-                'LeafIngress.stat_count_load_signal.f1',
-                self.pipe_id,
-                i)
-            total_msg_idle += test_register_read(self.target,
-                self.register_stat_count_idle_signal,
-                'LeafIngress.stat_count_idle_signal.f1',
-                self.pipe_id,
-                i)
-        
-        task_tot = test_register_read(self.target,
-            self.register_stat_count_task,
-            'LeafIngress.stat_count_task.f1',
-            self.pipe_id,
-            0)
-        print ("Total tasks arrived at Leaf: %d" %(task_tot))
-        delay_list = []
-        if task_tot >= 10000:
-            for i in range(10000):
-                ingress_tstamp = test_register_read(self.target,
-                self.register_ingress_tstamp,
-                'LeafIngress.ingress_tstamp.f1',
-                self.pipe_id,
-                i, 
-                print_reg=False)
-                egress_tstamp = test_register_read(self.target,
-                self.register_egress_tstamp,
-                'SaqrEgress.egress_tstamp.f1',
-                self.pipe_id,
-                i,
-                print_reg=False)
-                delay_list.append(egress_tstamp - ingress_tstamp)
-            print (delay_list)
-            np.savetxt('leaf_latency.csv', [np.array(delay_list)], delimiter=', ', fmt='%d')
-
-        print ("Leaf Total Resubmission: %d" %(total_resub_leaf))
-        print ("Total Msgs for Load Signals: %d" %(total_msg_load))
-        print ("Total Msgs for Idle Signals: %d" %(total_msg_idle))
-        print ("Sum Total State Update Msgs: %d" %(total_msg_load+total_msg_idle))
-        if task_tot >= 10000:
-            exit(0)
+            self.read_queue_len_lists()
+        self.read_latency()
+        self.read_resub_counters()
+        self.read_signal_counters()
+        self.print_counters()
+
 class SpineController():
-    def __init__(self, target, bfrt_info, setup):
+    def __init__(self, target, bfrt_info, setup, stats_dir=STATS_DIR):
         self.target = target
         self.bfrt_info = bfrt_info
+        self.stats_dir = stats_dir
+        self.table_registry = TableRegistry(bfrt_info) # Table handles and cached key/data builders
         self.tables = []
         self.setup = setup
+        self.installed_plan = Plan() # What has been pushed to the switch so far
+        self.stat_count_resub = None # Last counter snapshot, see print_counters()
         self.init_tables()
         self.init_data()
 
     def init_tables(self):
-        bfrt_info = self.bfrt_info
-        self.register_idle_count = bfrt_info.table_get("SpineIngress.idle_count")
-        self.register_idle_list = bfrt_info.table_get("SpineIngress.idle_list")
-        self.register_queue_len_list_1 = bfrt_info.table_get("SpineIngress.queue_len_list_1")
-        self.register_queue_len_list_2 = bfrt_info.table_get("SpineIngress.queue_len_list_2")
-        self.register_deferred_list_1 = bfrt_info.table_get("SpineIngress.deferred_queue_len_list_1")
-        self.register_deferred_list_2 = bfrt_info.table_get("SpineIngress.deferred_queue_len_list_2")
-        self.register_idle_list_idx_mapping = bfrt_info.table_get("SpineIngress.idle_list_idx_mapping")
-        self.register_stat_count_resub = bfrt_info.table_get("SpineIngress.stat_count_resub")
-        self.register_stat_count_task = bfrt_info.table_get("SpineIngress.stat_count_task")
-        self.register_ingress_tstamp = bfrt_info.table_get("SpineIngress.ingress_tstamp")
-        self.register_egress_tstamp = bfrt_info.table_get("SpineEgress.egress_tstamp")
+        table_registry = self.table_registry
+        self.register_idle_count = table_registry.table_get("SpineIngress.idle_count")
+        self.register_idle_list = table_registry.table_get("SpineIngress.idle_list")
+        self.register_queue_len_list_1 = table_registry.table_get("SpineIngress.queue_len_list_1")
+        self.register_queue_len_list_2 = table_registry.table_get("SpineIngress.queue_len_list_2")
+        self.register_deferred_list_1 = table_registry.table_get("SpineIngress.deferred_queue_len_list_1")
+        self.register_deferred_list_2 = table_registry.table_get("SpineIngress.deferred_queue_len_list_2")
+        self.register_idle_list_idx_mapping = table_registry.table_get("SpineIngress.idle_list_idx_mapping")
+        self.register_stat_count_resub = table_registry.table_get("SpineIngress.stat_count_resub")
+        self.register_stat_count_task = table_registry.table_get("SpineIngress.stat_count_task")
+        self.register_ingress_tstamp = table_registry.table_get("SpineIngress.ingress_tstamp")
+        self.register_egress_tstamp = table_registry.table_get("SpineEgress.egress_tstamp")
+        # Per-task processing latency is streamed to spine_latency.bin (uint32 ns per task)
+        self.latency_harvester = TstampHarvester(self.target,
+            self.register_stat_count_task, 'SpineIngress.stat_count_task.f1',
+            self.register_ingress_tstamp, 'SpineIngress.ingress_tstamp.f1',
+            self.register_egress_tstamp, 'SpineEgress.egress_tstamp.f1',
+            pipe_id=LATENCY_PIPE, output_file='spine_latency.bin')
+        self.recorder_resub = open_recorder(self.stats_dir, 'SpineIngress.stat_count_resub.f1')
+        self.recorder_task = open_recorder(self.stats_dir, 'SpineIngress.stat_count_task.f1')
         
         # # MA Tables
-        self.forward_saqr_switch_dst = bfrt_info.table_get("SpineIngress.forward_saqr_switch_dst")
+        self.forward_saqr_switch_dst = table_registry.table_get("SpineIngress.forward_saqr_switch_dst")
         self.forward_saqr_switch_dst.info.key_field_annotation_add("hdr.saqr.dst_id", "id")
-        self.set_queue_len_unit_1 = bfrt_info.table_get("SpineIngress.set_queue_len_unit_1")
+        self.set_queue_len_unit_1 = table_registry.table_get("SpineIngress.set_queue_len_unit_1")
         self.set_queue_len_unit_1.info.key_field_annotation_add("hdr.saqr.cluster_id", "vcid")
-        self.set_queue_len_unit_2 = bfrt_info.table_get("SpineIngress.set_queue_len_unit_2")
+        self.set_queue_len_unit_2 = table_registry.table_get("SpineIngress.set_queue_len_unit_2")
         self.set_queue_len_unit_2.info.key_field_annotation_add("hdr.saqr.cluster_id", "vcid")
-        self.get_cluster_num_valid = bfrt_info.table_get("SpineIngress.get_cluster_num_valid_leafs")
+        self.get_cluster_num_valid = table_registry.table_get("SpineIngress.get_cluster_num_valid_leafs")
         self.get_cluster_num_valid.info.key_field_annotation_add("hdr.saqr.cluster_id", "vcid")
-        self.adjust_random_range_ds = bfrt_info.table_get("SpineIngress.adjust_random_range_sq_leafs")
+        self.adjust_random_range_ds = table_registry.table_get("SpineIngress.adjust_random_range_sq_leafs")
         self.adjust_random_range_ds.info.key_field_annotation_add("saqr_md.cluster_num_valid_queue_signals", "num_valid_ds")
-        self.get_rand_leaf_id_1 = bfrt_info.table_get("SpineIngress.get_rand_leaf_id_1")
+        self.get_rand_leaf_id_1 = table_registry.table_get("SpineIngress.get_rand_leaf_id_1")
         self.get_rand_leaf_id_1.info.key_field_annotation_add("saqr_md.random_ds_index_1", "rand_idx_1")
-        self.get_rand_leaf_id_2 = bfrt_info.table_get("SpineIngress.get_rand_leaf_id_2")
+        self.get_rand_leaf_id_2 = table_registry.table_get("SpineIngress.get_rand_leaf_id_2")
         self.get_rand_leaf_id_2.info.key_field_annotation_add("saqr_md.random_ds_index_2", "rand_idx_2")
 
     def init_data(self):
@@ -461,176 +430,115 @@ class SpineController():
 
         self.leaf_start_idx = self.TEST_VCLUSTER_ID * self.MAX_VCLUSTER_LEAVES
     
-    def set_tables(self):
+    def compile_plan(self):
+        plan = Plan()
         # Insert idle_list values (wid of idle workers)
+        plan.set_register_range('SpineIngress.idle_list.f1',
+            self.leaf_start_idx,
+            self.initial_idle_list[:self.initial_idle_count])
         for i in range(self.initial_idle_count):
-            register_write(self.target,
-                self.register_idle_list,
-                register_name='SpineIngress.idle_list.f1',
-                index=self.leaf_start_idx + i,
-                register_value=self.initial_idle_list[i])
-            
-            register_write(self.target,
-                self.register_idle_list_idx_mapping,
-                register_name="SpineIngress.idle_list_idx_mapping.f1",
-                index=self.initial_idle_list[i],
-                register_value=self.leaf_start_idx + i)
-
-        register_write(self.target,
-            self.register_idle_count,
-            register_name='SpineIngress.idle_count.f1',
-            index=self.TEST_VCLUSTER_ID,
-            register_value=self.initial_idle_count)
+            plan.set_register("SpineIngress.idle_list_idx_mapping.f1", self.initial_idle_list[i], self.leaf_start_idx + i)
+        plan.set_register('SpineIngress.idle_count.f1', self.TEST_VCLUSTER_ID, self.initial_idle_count)
+        plan.set_register_range('SpineIngress.queue_len_list_1.f1', self.leaf_start_idx, self.intitial_qlen_state)
+        plan.set_register_range('SpineIngress.queue_len_list_2.f1', self.leaf_start_idx, self.intitial_qlen_state)
+        plan.set_register_range('SpineIngress.deferred_queue_len_list_1.f1', self.leaf_start_idx, self.intitial_deferred_state)
+        plan.set_register_range('SpineIngress.deferred_queue_len_list_2.f1', self.leaf_start_idx, self.intitial_deferred_state)
+
+        for wid, port in self.wid_port_mapping.items():
+            plan.add_entry('SpineIngress.forward_saqr_switch_dst',
+                [('hdr.saqr.dst_id', wid)],
+                'SpineIngress.act_forward_saqr',
+                [('port', port)])
+        
+        for idx, leaf_id in enumerate(self.initial_idle_list):
+            plan.add_entry('SpineIngress.set_queue_len_unit_1',
+                [('saqr_md.random_id_1', leaf_id), ('hdr.saqr.cluster_id', TEST_VCLUSTER_ID)],
+                'SpineIngress.act_set_queue_len_unit_1',
+                [('cluster_unit', self.qlen_unit[idx])])
+            plan.add_entry('SpineIngress.set_queue_len_unit_2',
+                [('saqr_md.random_id_2', leaf_id), ('hdr.saqr.cluster_id', TEST_VCLUSTER_ID)],
+                'SpineIngress.act_set_queue_len_unit_2',
+                [('cluster_unit', self.qlen_unit[idx])])
+            plan.add_entry('SpineIngress.get_rand_leaf_id_1',
+                [('saqr_md.random_ds_index_1', idx), ('hdr.saqr.cluster_id', TEST_VCLUSTER_ID)],
+                'SpineIngress.act_get_rand_leaf_id_1',
+                [('leaf_id', leaf_id)])
+            plan.add_entry('SpineIngress.get_rand_leaf_id_2',
+                [('saqr_md.random_ds_index_2', idx), ('hdr.saqr.cluster_id', TEST_VCLUSTER_ID)],
+                'SpineIngress.act_get_rand_leaf_id_2',
+                [('leaf_id', leaf_id)])
+
+        plan.add_entry('SpineIngress.get_cluster_num_valid_leafs',
+            [('hdr.saqr.cluster_id', self.TEST_VCLUSTER_ID)],
+            'SpineIngress.act_get_cluster_num_valid_leafs',
+            [('num_leafs', self.num_valid_ds_elements)])
+        for num_valid_ds, action_name in ((2, 'SpineIngress.adjust_random_leaf_index_1'),
+                                          (4, 'SpineIngress.adjust_random_leaf_index_2'),
+                                          (5, 'SpineIngress.adjust_random_leaf_index_2'),
+                                          (16, 'SpineIngress.adjust_random_leaf_index_4'),
+                                          (256, 'SpineIngress.adjust_random_leaf_index_8')):
+            plan.add_entry('SpineIngress.adjust_random_range_sq_leafs', [('saqr_md.cluster_num_valid_queue_signals', num_valid_ds)], action_name)
+        return plan
+
+    def set_tables(self, warm_start=False):
+        print("********* Populating Table Entires *********")
+        desired_plan = self.compile_plan()
+        if warm_start:
+            self.installed_plan = read_installed_plan(self.target, self.table_registry, desired_plan)
+        apply_plan_diff(self.target, self.table_registry, diff_plans(self.installed_plan, desired_plan))
+        self.installed_plan = desired_plan
         test_register_read(self.target,
             self.register_idle_count,
             'SpineIngress.idle_count.f1',
             self.pipe_id,
             self.TEST_VCLUSTER_ID)
-        
-        
-        for i, qlen in enumerate(self.intitial_qlen_state):
-            register_write(self.target,
-                    self.register_queue_len_list_1,
-                    register_name='SpineIngress.queue_len_list_1.f1',
-                    index=self.leaf_start_idx + i,
-                    register_value=qlen)
-            register_write(self.target,
-                    self.register_queue_len_list_2,
-                    register_name='SpineIngress.queue_len_list_2.f1',
-                    index=self.leaf_start_idx + i,
-                    register_value=qlen)
-            register_write(self.target,
-                    self.register_deferred_list_1,
-                    register_name='SpineIngress.deferred_queue_len_list_1.f1',
-                    index=self.leaf_start_idx + i,
-                    register_value=self.intitial_deferred_state[i])
-            register_write(self.target,
-                    self.register_deferred_list_2,
-                    register_name='SpineIngress.deferred_queue_len_list_2.f1',
-                    index=self.leaf_start_idx + i,
-                    register_value=self.intitial_deferred_state[i])
-
-        # Table entries
-        print("********* Populating Table Entires *********")
-        for wid in self.wid_port_mapping.keys():
-            self.forward_saqr_switch_dst.entry_add(
-                self.target,
-                [self.forward_saqr_switch_dst.make_key([client.KeyTuple('hdr.saqr.dst_id', wid)])],
-                [self.forward_saqr_switch_dst.make_data([client.DataTuple('port', self.wid_port_mapping[wid])],
-                                             'SpineIngress.act_forward_saqr')]
-            )
-        
-        for idx, leaf_id in enumerate(self.initial_idle_list):
-            self.set_queue_len_unit_1.entry_add(
-                self.target,
-                [self.set_queue_len_unit_1.make_key([client.KeyTuple('saqr_md.random_id_1', leaf_id), client.KeyTuple('hdr.saqr.cluster_id', TEST_VCLUSTER_ID)])],
-                [self.set_queue_len_unit_1.make_data([client.DataTuple('cluster_unit', self.qlen_unit[idx])],
-                                             'SpineIngress.act_set_queue_len_unit_1')]
-            )
-            self.set_queue_len_unit_2.entry_add(
-                self.target,
-                [self.set_queue_len_unit_2.make_key([client.KeyTuple('saqr_md.random_id_2', leaf_id), client.KeyTuple('hdr.saqr.cluster_id', TEST_VCLUSTER_ID)])],
-                [self.set_queue_len_unit_2.make_data([client.DataTuple('cluster_unit', self.qlen_unit[idx])],
-                                             'SpineIngress.act_set_queue_len_unit_2')]
-            )
-            self.get_rand_leaf_id_1.entry_add(
-                self.target,
-                [self.get_rand_leaf_id_1.make_key([client.KeyTuple('saqr_md.random_ds_index_1', idx), client.KeyTuple('hdr.saqr.cluster_id', TEST_VCLUSTER_ID)])],
-                [self.get_rand_leaf_id_1.make_data([client.DataTuple('leaf_id', leaf_id)],
-                                             'SpineIngress.act_get_rand_leaf_id_1')]
-            )
-            self.get_rand_leaf_id_2.entry_add(
-                self.target,
-                [self.get_rand_leaf_id_2.make_key([client.KeyTuple('saqr_md.random_ds_index_2', idx), client.KeyTuple('hdr.saqr.cluster_id', TEST_VCLUSTER_ID)])],
-                [self.get_rand_leaf_id_2.make_data([client.DataTuple('leaf_id', leaf_id)],
-                                             'SpineIngress.act_get_rand_leaf_id_2')]
-            )
-
-        self.get_cluster_num_valid.entry_add(
-                self.target,
-                [self.get_cluster_num_valid.make_key([client.KeyTuple('hdr.saqr.cluster_id', self.TEST_VCLUSTER_ID)])],
-                [self.get_cluster_num_valid.make_data([client.DataTuple('num_leafs', self.num_valid_ds_elements)],
-                                             'SpineIngress.act_get_cluster_num_valid_leafs')]
-            )
-        self.adjust_random_range_ds.entry_add(
-            self.target,
-            [self.adjust_random_range_ds.make_key([client.KeyTuple('saqr_md.cluster_num_valid_queue_signals', 2)])],
-            [self.adjust_random_range_ds.make_data([], 'SpineIngress.adjust_random_leaf_index_1')]
-        )
-        self.adjust_random_range_ds.entry_add(
-            self.target,
-            [self.adjust_random_range_ds.make_key([client.KeyTuple('saqr_md.cluster_num_valid_queue_signals', 4)])],
-            [self.adjust_random_range_ds.make_data([], 'SpineIngress.adjust_random_leaf_index_2')]
-        )
-        self.adjust_random_range_ds.entry_add(
-            self.target,
-            [self.adjust_random_range_ds.make_key([client.KeyTuple('saqr_md.cluster_num_valid_queue_signals', 5)])],
-            [self.adjust_random_range_ds.make_data([], 'SpineIngress.adjust_random_leaf_index_2')]
-        )
-        self.adjust_random_range_ds.entry_add(
-            self.target,
-            [self.adjust_random_range_ds.make_key([client.KeyTuple('saqr_md.cluster_num_valid_queue_signals', 16)])],
-            [self.adjust_random_range_ds.make_data([], 'SpineIngress.adjust_random_leaf_index_4')]
-        )
-        self.adjust_random_range_ds.entry_add(
-            self.target,
-            [self.adjust_random_range_ds.make_key([client.KeyTuple('saqr_md.cluster_num_valid_queue_signals', 256)])],
-            [self.adjust_random_range_ds.make_data([], 'SpineIngress.adjust_random_leaf_index_8')]
-        )
 
-    def read_reg_stats(self):
-        if DEBUG_DUMP_REGS:
-            for i in range(4):
-                test_register_read(self.target,
-                    self.register_idle_list,
-                    'SpineIngress.idle_list.f1',
-                    self.pipe_id,
-                    i)
-            for i in range(1):
-                test_register_read(self.target,
-                    self.register_idle_count,
-                    'SpineIngress.idle_count.f1',
-                    self.pipe_id,
-                    i)
-            for i in range(4):
-                test_register_read(self.target,
-                    self.register_idle_list_idx_mapping,
-                    "SpineIngress.idle_list_idx_mapping.f1",
-                    self.pipe_id,
-                    i)
-            print("\n")
-
-        resub_tot = test_register_read(self.target,
+    def read_idle_lists(self):
+        print_register_snapshot('SpineIngress.idle_list.f1',
+            0,
+            register_snapshot(self.target, self.register_idle_list, 'SpineIngress.idle_list.f1', 0, 4),
+            self.pipe_id)
+        print_register_snapshot('SpineIngress.idle_count.f1',
+            0,
+            register_snapshot(self.target, self.register_idle_count, 'SpineIngress.idle_count.f1', 0, 1),
+            self.pipe_id)
+        print_register_snapshot("SpineIngress.idle_list_idx_mapping.f1",
+            0,
+            register_snapshot(self.target, self.register_idle_list_idx_mapping, "SpineIngress.idle_list_idx_mapping.f1", 0, 4),
+            self.pipe_id)
+        print("\n")
+
+    def read_resub_counters(self):
+        stat_count_resub = register_snapshot(self.target,
             self.register_stat_count_resub,
             'SpineIngress.stat_count_resub.f1',
-            self.pipe_id,
-            TEST_VCLUSTER_ID)
-        print ("Total resubmissions at Spine (Task resub + Idle remove resub): %d" %(resub_tot))
+            0,
+            TEST_VCLUSTER_ID + 1)
+        if self.recorder_resub is not None:
+            self.recorder_resub.append(stat_count_resub)
+        self.stat_count_resub = stat_count_resub
+        return int(pipe_view(stat_count_resub, COUNTER_VIEW)[TEST_VCLUSTER_ID])
+
+    def print_counters(self):
+        # Totals of the last snapshot of read_resub_counters()
+        stat_count_resub = self.stat_count_resub
+        if stat_count_resub is not None:
+            print_counter_snapshot('SpineIngress.stat_count_resub.f1', TEST_VCLUSTER_ID, stat_count_resub[:, TEST_VCLUSTER_ID:])
+            print ("Total resubmissions at Spine (Task resub + Idle remove resub): %d" %(int(pipe_view(stat_count_resub, COUNTER_VIEW)[TEST_VCLUSTER_ID])))
+
+    def read_latency(self):
+        self.latency_harvester.poll()
+        if self.recorder_task is not None:
+            self.recorder_task.append(self.latency_harvester.task_count_snapshot)
+        print ("Total tasks arrived at Spine: %d" %(pipe_view(self.latency_harvester.task_count_snapshot, COUNTER_VIEW)[0]))
+        self.latency_harvester.print_stats('Spine')
 
-        task_tot = test_register_read(self.target,
-            self.register_stat_count_task,
-            'SpineIngress.stat_count_task.f1',
-            self.pipe_id,
-            0)
-        print ("Total tasks arrived at Spine: %d" %(task_tot))
-        delay_list = []
-        if (task_tot >= 10000):
-            for i in range(10000):
-                ingress_tstamp = test_register_read(self.target,
-                self.register_ingress_tstamp,
-                'SpineIngress.ingress_tstamp.f1',
-                self.pipe_id,
-                i, 
-                print_reg=False)
-                egress_tstamp = test_register_read(self.target,
-                self.register_egress_tstamp,
-                'SpineEgress.egress_tstamp.f1',
-                self.pipe_id,
-                i,
-                print_reg=False)
-                delay_list.append(egress_tstamp - ingress_tstamp)
-            print (delay_list)
-            np.savetxt('spine_latency.csv', [np.array(delay_list)], delimiter=', ', fmt='%d')
+    def read_reg_stats(self):
+        if DEBUG_DUMP_REGS:
+            self.read_idle_lists()
+        self.read_resub_counters()
+        self.print_counters()
+        self.read_latency()
 
         # for i in range(2):
         #     test_register_read(self.target,
@@ -665,12 +573,26 @@ if __name__ == "__main__":
     else:
         print("Argument required for placement setup: use \"s\"(skewed) or \"b\"(balanced)")
         exit(1)
+    # After a controller restart, only fix up the table entries and keep the scheduler state
+    warm_start = '--warm-start' in sys.argv[2:]
+    # Record the polled counters to binary files in this directory (off by default)
+    stats_dir = STATS_DIR
+    if '--stats-dir' in sys.argv[2:]:
+        stats_dir_index = sys.argv.index('--stats-dir') + 1
+        if stats_dir_index >= len(sys.argv):
+            print("Usage: %s <b|s> [--warm-start] [--stats-dir <dir>] [--bfrt-stats]" %(sys.argv[0]))
+            exit(1)
+        stats_dir = sys.argv[stats_dir_index]
+    # Record the per table BFRT call stats
+    bfrt_stats = BFRT_STATS or '--bfrt-stats' in sys.argv[2:]
 
     # Connect to BF Runtime Server
     interface = client.ClientInterface(grpc_addr = "localhost:50052",
                                     client_id = 0,
                                     device_id = 0)
     print("Connected to BF Runtime Server")
+    if bfrt_stats:
+        enable_bfrt_stats(interface)
 
     # Get the information about the running program on the bfrt server.
     bfrt_info = interface.bfrt_info_get()
@@ -682,18 +604,25 @@ if __name__ == "__main__":
     ####### You can now use BFRT CLIENT #######
     target = client.Target(device_id=0, pipe_id=0xffff)
 
-    spine_controller = SpineController(target, bfrt_info, setup=setup)
-    spine_controller.set_tables()
+    spine_controller = SpineController(target, bfrt_info, setup=setup, stats_dir=stats_dir)
+    spine_controller.set_tables(warm_start)
 
-    leaf_controller = LeafController(target, bfrt_info, setup=setup)
-    leaf_controller.set_tables()
+    leaf_controller = LeafController(target, bfrt_info, setup=setup, stats_dir=stats_dir)
+    leaf_controller.set_tables(warm_start)
     
-    while(True):
-        spine_controller.read_reg_stats()
-        print ("\n")
-        leaf_controller.read_reg_stats()
-        print("#################")
-        print("\n")
-        time.sleep(2)
+    poller = Poller()
+    poller.add('spine_resub_counters', COUNTERS_POLL_PERIOD, spine_controller.read_resub_counters)
+    poller.add('spine_tstamps', LATENCY_POLL_PERIOD, spine_controller.read_latency)
+    poller.add('leaf_resub_counters', COUNTERS_POLL_PERIOD, leaf_controller.read_resub_counters)
+    poller.add('leaf_signal_counters', COUNTERS_POLL_PERIOD, leaf_controller.read_signal_counters)
+    poller.add('leaf_tstamps', LATENCY_POLL_PERIOD, leaf_controller.read_latency)
+    poller.add('spine_print_counters', COUNTERS_PRINT_PERIOD, spine_controller.print_counters)
+    poller.add('leaf_print_counters', COUNTERS_PRINT_PERIOD, leaf_controller.print_counters)
+    if DEBUG_DUMP_REGS:
+        poller.add('spine_idle_lists', QUEUE_LEN_POLL_PERIOD, spine_controller.read_idle_lists)
+        poller.add('leaf_queue_len_lists', QUEUE_LEN_POLL_PERIOD, leaf_controller.read_queue_len_lists)
+    poller.run()
+    spine_controller.print_counters()
+    leaf_controller.print_counters()
 
 
@@ -1,3 +1,5 @@
+import hashlib
+import os
 from random import randint
 import scapy.all as scapy
 
@@ -60,11 +62,52 @@ def get_random_ip_addresses():
     rand_idx = randint(0, len(ip_list)-1)
     return ip_list[rand_idx]
 
+PAYLOAD_POOL_SIZE = 1 << 20
+
+class PayloadPool():
+    #
+    # Payloads served as slices of one preallocated buffer, instead of one
+    # randint() per byte. The buffer is random (os.urandom), deterministic
+    # random when seed is given (SHA-256 of seed and a counter, the same on
+    # every run and python version) or pattern repeated. Consecutive
+    # payloads are consecutive slices, wrapping around at the end.
+    #
+    def __init__(self, size=PAYLOAD_POOL_SIZE, seed=None, pattern=None):
+        if pattern is not None:
+            pattern = bytes(bytearray(pattern))
+            data = pattern * (size // len(pattern) + 1)
+        elif seed is not None:
+            blocks = []
+            for counter in range(size // 32 + 1):
+                blocks.append(hashlib.sha256(('%s:%d' % (seed, counter)).encode('ascii')).digest())
+            data = b''.join(blocks)
+        else:
+            data = os.urandom(size)
+        self.size = size
+        self.data = data[:size]
+        self.offset = 0
+
+    def get(self, length):
+        if length > self.size:
+            raise ValueError('payload of %d bytes is larger than the pool (%d bytes)' % (length, self.size))
+        if self.offset + length > self.size:
+            self.offset = 0
+        payload = self.data[self.offset:self.offset + length]
+        self.offset += length
+        return payload
+
+payload_pool = None
+
+def set_payload_pool(size=PAYLOAD_POOL_SIZE, seed=None, pattern=None):
+    # Payloads of generate_load(), e.g. set_payload_pool(seed=1) for reproducible packets
+    global payload_pool
+    payload_pool = PayloadPool(size, seed, pattern)
+    return payload_pool
+
 def generate_load(length):
-    load = ''
-    for i in range(length):
-        load += chr(randint(0, 255))
-    return load
+    if payload_pool is None:
+        set_payload_pool()
+    return payload_pool.get(length)
 
 def make_eth_hdr(src_mac=None, dst_mac=None, ip_encap=False, **kwargs):
     hdr = scapy.Ether()
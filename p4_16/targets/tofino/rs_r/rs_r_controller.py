@@ -10,51 +10,46 @@ import bfrt_grpc.client as client
 import random
 import collections
 import math
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from switch_ctrl.registers import register_snapshot, print_register_snapshot
+from switch_ctrl.poller import Poller
+from switch_ctrl.tables import TableRegistry
+from switch_ctrl.instrument import enable_bfrt_stats
+from switch_ctrl.topology import Plan, diff_plans, apply_plan_diff
+
+# Per table/operation BFRT call stats, printed on SIGUSR1 and at exit (see switch_ctrl/instrument.py).
+# Off by default, enabled with --bfrt-stats
+BFRT_STATS = False
 
 TEST_VCLUSTER_ID = 0
 MAX_VCLUSTER_WORKERS = 32
 INVALID_VALUE_8bit = 0x7F
 INVALID_VALUE_16bit = 0x7FFF
 
-def register_write(target, register_object, register_name, index, register_value):
-        print("Inserting entry in %s[%d] register with value = %s " %(str(register_name), index, str(register_value)))
-
-        register_object.entry_add(
-            target,
-            [register_object.make_key([client.KeyTuple('$REGISTER_INDEX', index)])],
-            [register_object.make_data([client.DataTuple(register_name, register_value)])])
-
-def test_register_read(target, register_object, register_name, pipe_id, index):    
-    resp = register_object.entry_get(
-            target,
-            [register_object.make_key([client.KeyTuple('$REGISTER_INDEX', index)])],
-            {"from_hw": True})
-    
-    data_dict = next(resp)[0].to_dict()
-    res = data_dict[register_name][0]
-    print("Reading Register: %s [%d] = %d" %(str(register_name), index, res))
-    return res
+# Poll period (seconds) for the queue length arrays, see switch_ctrl/poller.py
+QUEUE_LEN_POLL_PERIOD = 1
 
 class LeafController():
     def __init__(self, target, bfrt_info, setup):
         self.target = target
         self.bfrt_info = bfrt_info
+        self.table_registry = TableRegistry(bfrt_info) # Table handles and cached key/data builders
         self.tables = []
         self.setup = setup
         self.init_tables()
         self.init_data()
         
     def init_tables(self):
-        bfrt_info = self.bfrt_info
-        self.register_queue_len_list_1 = bfrt_info.table_get("LeafIngress.queue_len_list_1")
-        self.register_queue_len_list_2 = bfrt_info.table_get("LeafIngress.queue_len_list_2")
+        table_registry = self.table_registry
+        self.register_queue_len_list_1 = table_registry.table_get("LeafIngress.queue_len_list_1")
+        self.register_queue_len_list_2 = table_registry.table_get("LeafIngress.queue_len_list_2")
         
         # MA Tables
-        self.forward_horus_switch_dst = bfrt_info.table_get("LeafIngress.forward_horus_switch_dst")
+        self.forward_horus_switch_dst = table_registry.table_get("LeafIngress.forward_horus_switch_dst")
         self.forward_horus_switch_dst.info.key_field_annotation_add("hdr.horus.dst_id", "wid")
-        self.get_cluster_num_valid = bfrt_info.table_get("LeafIngress.get_cluster_num_valid")
+        self.get_cluster_num_valid = table_registry.table_get("LeafIngress.get_cluster_num_valid")
         self.get_cluster_num_valid.info.key_field_annotation_add("hdr.horus.cluster_id", "vcid")
-        self.adjust_random_range_ds = bfrt_info.table_get("LeafIngress.adjust_random_range_ds")
+        self.adjust_random_range_ds = table_registry.table_get("LeafIngress.adjust_random_range_ds")
         self.adjust_random_range_ds.info.key_field_annotation_add("horus_md.cluster_num_valid_ds", "num_valid_ds")
 
     def init_data(self):
@@ -103,111 +98,79 @@ class LeafController():
         for leaf_id in range(self.NUM_LEAVES):
             self.workers_start_idx.append(leaf_id * self.MAX_VCLUSTER_WORKERS)
 
-    def set_tables(self):
+    def compile_plan(self):
+        # Desired table entries and initial register values, see switch_ctrl/topology.py
+        plan = Plan()
         for leaf_id in range(self.NUM_LEAVES):
-            print(" *********  Virtual Leaf: " + str(leaf_id) + "  *********  ")
-            print("********* Inserting initial Reg Entires *********")
-            for i, qlen in enumerate(self.intitial_qlen_state):
-                register_write(self.target,
-                        self.register_queue_len_list_1,
-                        register_name='LeafIngress.queue_len_list_1.f1',
-                        index=self.workers_start_idx[leaf_id] + i,
-                        register_value=qlen)
-                register_write(self.target,
-                        self.register_queue_len_list_2,
-                        register_name='LeafIngress.queue_len_list_2.f1',
-                        index=self.workers_start_idx[leaf_id] + i,
-                        register_value=qlen)
+            plan.set_register_range('LeafIngress.queue_len_list_1.f1', self.workers_start_idx[leaf_id], self.intitial_qlen_state)
+            plan.set_register_range('LeafIngress.queue_len_list_2.f1', self.workers_start_idx[leaf_id], self.intitial_qlen_state)
 
-            print("********* Populating Table Entires *********")
-            for wid in self.wid_port_mapping[leaf_id].keys():
-                self.forward_horus_switch_dst.entry_add(
-                    self.target,
-                    [self.forward_horus_switch_dst.make_key([client.KeyTuple('hdr.horus.dst_id', self.workers_start_idx[leaf_id] + wid)])],
-                    [self.forward_horus_switch_dst.make_data([client.DataTuple('port', self.wid_port_mapping[leaf_id][wid]), client.DataTuple('dst_mac', client.mac_to_bytes(self.port_mac_mapping[self.wid_port_mapping[leaf_id][wid]]))],
-                                                 'LeafIngress.act_forward_horus')]
-                )
-            print("Inserted entries in forward_horus_switch_dst table with key-values = ", str(self.wid_port_mapping[leaf_id]))
-            
-            self.get_cluster_num_valid.entry_add(
-                self.target,
-                [self.get_cluster_num_valid.make_key([client.KeyTuple('hdr.horus.cluster_id', leaf_id)])],
-                [self.get_cluster_num_valid.make_data([client.DataTuple('num_ds_elements', self.num_valid_ds_elements[leaf_id])],
-                                             'LeafIngress.act_get_cluster_num_valid')]
-            )
+            for wid, port in self.wid_port_mapping[leaf_id].items():
+                plan.add_entry('LeafIngress.forward_horus_switch_dst',
+                    [('hdr.horus.dst_id', self.workers_start_idx[leaf_id] + wid)],
+                    'LeafIngress.act_forward_horus',
+                    [('port', port), ('dst_mac', self.port_mac_mapping[port])])
+            plan.add_entry('LeafIngress.get_cluster_num_valid',
+                [('hdr.horus.cluster_id', leaf_id)],
+                'LeafIngress.act_get_cluster_num_valid',
+                [('num_ds_elements', self.num_valid_ds_elements[leaf_id])])
 
-        for sid in self.spine_port_mapping.keys():
-            self.forward_horus_switch_dst.entry_add(
-                self.target,
-                [self.forward_horus_switch_dst.make_key([client.KeyTuple('hdr.horus.dst_id', sid)])],
-                [self.forward_horus_switch_dst.make_data([client.DataTuple('port', self.spine_port_mapping[sid]), client.DataTuple('dst_mac', client.mac_to_bytes(self.port_mac_mapping[self.spine_port_mapping[sid]]))],
-                                             'LeafIngress.act_forward_horus')]
-            )
+        for sid, port in self.spine_port_mapping.items():
+            plan.add_entry('LeafIngress.forward_horus_switch_dst',
+                [('hdr.horus.dst_id', sid)],
+                'LeafIngress.act_forward_horus',
+                [('port', port), ('dst_mac', self.port_mac_mapping[port])])
 
-        self.adjust_random_range_ds.entry_add(
-                self.target,
-                [self.adjust_random_range_ds.make_key([client.KeyTuple('horus_md.cluster_num_valid_ds', 2)])],
-                [self.adjust_random_range_ds.make_data([], 'LeafIngress.adjust_random_worker_range_1')]
-            )
-        self.adjust_random_range_ds.entry_add(
-                self.target,
-                [self.adjust_random_range_ds.make_key([client.KeyTuple('horus_md.cluster_num_valid_ds', 4)])],
-                [self.adjust_random_range_ds.make_data([], 'LeafIngress.adjust_random_worker_range_2')]
-            )
-        self.adjust_random_range_ds.entry_add(
-                self.target,
-                [self.adjust_random_range_ds.make_key([client.KeyTuple('horus_md.cluster_num_valid_ds', 8)])],
-                [self.adjust_random_range_ds.make_data([], 'LeafIngress.adjust_random_worker_range_3')]
-            )
-        self.adjust_random_range_ds.entry_add(
-                self.target,
-                [self.adjust_random_range_ds.make_key([client.KeyTuple('horus_md.cluster_num_valid_ds', 16)])],
-                [self.adjust_random_range_ds.make_data([], 'LeafIngress.adjust_random_worker_range_4')]
-            )
-        self.adjust_random_range_ds.entry_add(
-                self.target,
-                [self.adjust_random_range_ds.make_key([client.KeyTuple('horus_md.cluster_num_valid_ds', 32)])],
-                [self.adjust_random_range_ds.make_data([], 'LeafIngress.adjust_random_worker_range_5')]
-            )
-        self.adjust_random_range_ds.entry_add(
-                self.target,
-                [self.adjust_random_range_ds.make_key([client.KeyTuple('horus_md.cluster_num_valid_ds', 256)])],
-                [self.adjust_random_range_ds.make_data([], 'LeafIngress.adjust_random_worker_range_8')]
-            )
+        for num_valid_ds, action_name in ((2, 'LeafIngress.adjust_random_worker_range_1'),
+                                          (4, 'LeafIngress.adjust_random_worker_range_2'),
+                                          (8, 'LeafIngress.adjust_random_worker_range_3'),
+                                          (16, 'LeafIngress.adjust_random_worker_range_4'),
+                                          (32, 'LeafIngress.adjust_random_worker_range_5'),
+                                          (256, 'LeafIngress.adjust_random_worker_range_8')):
+            plan.add_entry('LeafIngress.adjust_random_range_ds', [('horus_md.cluster_num_valid_ds', num_valid_ds)], action_name)
+        return plan
+
+    def set_tables(self):
+        print("********* Populating Table Entires *********")
+        apply_plan_diff(self.target, self.table_registry, diff_plans(Plan(), self.compile_plan()))
 
     def read_reg_stats(self):
-        for k in range(4):
-            for i in range(len(self.initial_idle_list[k])):
-                test_register_read(self.target,
-                    self.register_queue_len_list_1,
-                    'LeafIngress.queue_len_list_1.f1',
-                    self.pipe_id,
-                    self.workers_start_idx[k] + i)
-            for i in range(len(self.initial_idle_list[k])):
-                test_register_read(self.target,
-                    self.register_queue_len_list_2,
-                    'LeafIngress.queue_len_list_2.f1',
-                    self.pipe_id,
-                    self.workers_start_idx[k] + i)
+        num_entries = max(self.workers_start_idx[k] + len(self.initial_idle_list[k]) for k in range(self.NUM_LEAVES))
+        queue_len_list_1 = register_snapshot(self.target,
+            self.register_queue_len_list_1,
+            'LeafIngress.queue_len_list_1.f1',
+            0,
+            num_entries)
+        queue_len_list_2 = register_snapshot(self.target,
+            self.register_queue_len_list_2,
+            'LeafIngress.queue_len_list_2.f1',
+            0,
+            num_entries)
+        for k in range(self.NUM_LEAVES):
+            start_idx = self.workers_start_idx[k]
+            end_idx = start_idx + len(self.initial_idle_list[k])
+            print_register_snapshot('LeafIngress.queue_len_list_1.f1', start_idx, queue_len_list_1[:, start_idx:end_idx], self.pipe_id)
+            print_register_snapshot('LeafIngress.queue_len_list_2.f1', start_idx, queue_len_list_2[:, start_idx:end_idx], self.pipe_id)
 
 class SpineController():
     def __init__(self, target, bfrt_info):
         self.target = target
         self.bfrt_info = bfrt_info
+        self.table_registry = TableRegistry(bfrt_info) # Table handles and cached key/data builders
         self.tables = []
         self.init_tables()
         self.init_data()
 
     def init_tables(self):
-        bfrt_info = self.bfrt_info
+        table_registry = self.table_registry
         # MA Tables
-        self.forward_horus_switch_dst = bfrt_info.table_get("SpineIngress.forward_horus_switch_dst")
+        self.forward_horus_switch_dst = table_registry.table_get("SpineIngress.forward_horus_switch_dst")
         self.forward_horus_switch_dst.info.key_field_annotation_add("hdr.horus.dst_id", "id")
-        self.get_cluster_num_valid = bfrt_info.table_get("SpineIngress.get_cluster_num_valid_leafs")
+        self.get_cluster_num_valid = table_registry.table_get("SpineIngress.get_cluster_num_valid_leafs")
         self.get_cluster_num_valid.info.key_field_annotation_add("hdr.horus.cluster_id", "vcid")
-        self.adjust_random_range_ds = bfrt_info.table_get("SpineIngress.adjust_random_range_sq_leafs")
+        self.adjust_random_range_ds = table_registry.table_get("SpineIngress.adjust_random_range_sq_leafs")
         self.adjust_random_range_ds.info.key_field_annotation_add("horus_md.cluster_num_valid_queue_signals", "num_valid_ds")
-        self.get_rand_leaf_id_1 = bfrt_info.table_get("SpineIngress.get_rand_leaf_id_1")
+        self.get_rand_leaf_id_1 = table_registry.table_get("SpineIngress.get_rand_leaf_id_1")
         self.get_rand_leaf_id_1.info.key_field_annotation_add("horus_md.random_ds_index_1", "rand_idx_1")
         
     def init_data(self):
@@ -221,57 +184,37 @@ class SpineController():
 
         self.leaf_start_idx = self.TEST_VCLUSTER_ID * self.MAX_VCLUSTER_LEAVES
     
-    def set_tables(self):
-        # Table entries
-        print("********* Populating Table Entires *********")
-        for wid in self.wid_port_mapping.keys():
-            self.forward_horus_switch_dst.entry_add(
-                self.target,
-                [self.forward_horus_switch_dst.make_key([client.KeyTuple('hdr.horus.dst_id', wid)])],
-                [self.forward_horus_switch_dst.make_data([client.DataTuple('port', self.wid_port_mapping[wid])],
-                                             'SpineIngress.act_forward_horus')]
-            )
+    def compile_plan(self):
+        plan = Plan()
+        for wid, port in self.wid_port_mapping.items():
+            plan.add_entry('SpineIngress.forward_horus_switch_dst',
+                [('hdr.horus.dst_id', wid)],
+                'SpineIngress.act_forward_horus',
+                [('port', port)])
         
         for idx, leaf_id in enumerate(self.initial_idle_list):
-            self.get_rand_leaf_id_1.entry_add(
-                self.target,
-                [self.get_rand_leaf_id_1.make_key([client.KeyTuple('horus_md.random_ds_index_1', idx), client.KeyTuple('hdr.horus.cluster_id', TEST_VCLUSTER_ID)])],
-                [self.get_rand_leaf_id_1.make_data([client.DataTuple('leaf_id', leaf_id)],
-                                             'SpineIngress.act_get_rand_leaf_id_1')]
-            )
+            plan.add_entry('SpineIngress.get_rand_leaf_id_1',
+                [('horus_md.random_ds_index_1', idx), ('hdr.horus.cluster_id', TEST_VCLUSTER_ID)],
+                'SpineIngress.act_get_rand_leaf_id_1',
+                [('leaf_id', leaf_id)])
             
-        self.get_cluster_num_valid.entry_add(
-                self.target,
-                [self.get_cluster_num_valid.make_key([client.KeyTuple('hdr.horus.cluster_id', self.TEST_VCLUSTER_ID)])],
-                [self.get_cluster_num_valid.make_data([client.DataTuple('num_leafs', self.num_valid_ds_elements)],
-                                             'SpineIngress.act_get_cluster_num_valid_leafs')]
-            )
+        plan.add_entry('SpineIngress.get_cluster_num_valid_leafs',
+            [('hdr.horus.cluster_id', self.TEST_VCLUSTER_ID)],
+            'SpineIngress.act_get_cluster_num_valid_leafs',
+            [('num_leafs', self.num_valid_ds_elements)])
 
-        self.adjust_random_range_ds.entry_add(
-            self.target,
-            [self.adjust_random_range_ds.make_key([client.KeyTuple('horus_md.cluster_num_valid_queue_signals', 2)])],
-            [self.adjust_random_range_ds.make_data([], 'SpineIngress.adjust_random_leaf_index_1')]
-        )
-        self.adjust_random_range_ds.entry_add(
-            self.target,
-            [self.adjust_random_range_ds.make_key([client.KeyTuple('horus_md.cluster_num_valid_queue_signals', 4)])],
-            [self.adjust_random_range_ds.make_data([], 'SpineIngress.adjust_random_leaf_index_2')]
-        )
-        self.adjust_random_range_ds.entry_add(
-            self.target,
-            [self.adjust_random_range_ds.make_key([client.KeyTuple('horus_md.cluster_num_valid_queue_signals', 5)])],
-            [self.adjust_random_range_ds.make_data([], 'SpineIngress.adjust_random_leaf_index_2')]
-        )
-        self.adjust_random_range_ds.entry_add(
-            self.target,
-            [self.adjust_random_range_ds.make_key([client.KeyTuple('horus_md.cluster_num_valid_queue_signals', 16)])],
-            [self.adjust_random_range_ds.make_data([], 'SpineIngress.adjust_random_leaf_index_4')]
-        )
-        self.adjust_random_range_ds.entry_add(
-            self.target,
-            [self.adjust_random_range_ds.make_key([client.KeyTuple('horus_md.cluster_num_valid_queue_signals', 256)])],
-            [self.adjust_random_range_ds.make_data([], 'SpineIngress.adjust_random_leaf_index_8')]
-        )
+        for num_valid_ds, action_name in ((2, 'SpineIngress.adjust_random_leaf_index_1'),
+                                          (4, 'SpineIngress.adjust_random_leaf_index_2'),
+                                          (5, 'SpineIngress.adjust_random_leaf_index_2'),
+                                          (16, 'SpineIngress.adjust_random_leaf_index_4'),
+                                          (256, 'SpineIngress.adjust_random_leaf_index_8')):
+            plan.add_entry('SpineIngress.adjust_random_range_sq_leafs', [('horus_md.cluster_num_valid_queue_signals', num_valid_ds)], action_name)
+        return plan
+
+    def set_tables(self):
+        # Table entries
+        print("********* Populating Table Entires *********")
+        apply_plan_diff(self.target, self.table_registry, diff_plans(Plan(), self.compile_plan()))
 
 if __name__ == "__main__":
     setup = str(sys.argv[1])
@@ -284,12 +227,16 @@ if __name__ == "__main__":
     else:
         print("Argument required for placement setup: use \"s\"(skewed) or \"b\"(balanced)")
         exit(1)
+    # Record the per table BFRT call stats
+    bfrt_stats = BFRT_STATS or '--bfrt-stats' in sys.argv[2:]
 
     # Connect to BF Runtime Server
     interface = client.ClientInterface(grpc_addr = "localhost:50052",
                                     client_id = 0,
                                     device_id = 0)
     print("Connected to BF Runtime Server")
+    if bfrt_stats:
+        enable_bfrt_stats(interface)
 
     # Get the information about the running program on the bfrt server.
     bfrt_info = interface.bfrt_info_get()
@@ -306,11 +253,8 @@ if __name__ == "__main__":
 
     leaf_controller = LeafController(target, bfrt_info, setup)
     leaf_controller.set_tables()
-    for i in range(100):
-        leaf_controller.read_reg_stats()
-        print("\n")
-        print("#################")
-        print("\n")
-        time.sleep(1)
+    poller = Poller()
+    poller.add('leaf_queue_len_lists', QUEUE_LEN_POLL_PERIOD, leaf_controller.read_reg_stats)
+    poller.run(duration=100)
 
 
@@ -0,0 +1,316 @@
+#
+# Discrete-event simulation of a two-layer cluster (clients -> spine -> leaves
+# -> workers) to compare Horus, RS-H and RS-R without the testbed.
+#
+# Horus runs the behavioral models of its pipelines (spine.py, leaf.py) with
+# the plans spine_plan()/leaf_plan(), RS-H and RS-R are the decisions of
+# ../rs_h and ../rs_r: power-of-two over the queue lengths reported by the
+# workers (leaf) and over the leaf loads sent by the leaves (RS-H spine), or a
+# random leaf (RS-R spine). The RackSched lists are not updated on dispatch,
+# as in the P4 code, and the random indices are drawn uniformly over the rack
+# (the P4 code only supports power of two sizes).
+#
+# Each worker is one FIFO queue served by one core. The task arrivals
+# (Poisson) and service times come from workload.py, the event queue is a
+# heap. Every link adds hop_delay (us), the switches add no delay.
+# The latency of a task is from the client sending it to the client receiving
+# the reply (6 hops).
+#
+# Like on the testbed, leaves are vclusters of one spine (cluster_id = leaf
+# id), and at most 99 leaves with at most 256 workers each are supported.
+#
+# Usage:
+#
+#  python3 sim/cluster.py [workload] [num_leaves] [workers_per_leaf] [num_tasks]
+#
+#  result = run_experiment('horus', load=0.8, workers_per_leaf=[256] * 16)
+#  print (result['p99'])
+#
+import collections
+import heapq
+import itertools
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from sim.headers import *
+from sim.leaf import LeafModel, leaf_plan, queue_len_unit
+from sim.spine import SpineModel, spine_plan, SWITCH_ID
+from sim.pow2 import simulate_racksched
+from sim.workload import WORKLOADS, rps_for_load, workload_trace
+
+SCHEDULERS = ('horus', 'rs_h', 'rs_r')
+
+DEFAULT_LOADS = (0.1, 0.2, 0.3, 0.4, 0.5, 0.6, 0.7, 0.8, 0.9, 0.95)
+HOP_DELAY_US = 2.0
+WARMUP_FRACTION = 0.1 # First tasks not counted in the percentiles
+CLIENT_ID = 200
+
+# Event types
+EV_LEAF_TASK = 0
+EV_WORKER_TASK = 1
+EV_WORKER_DONE = 2
+EV_LEAF_DONE = 3
+EV_SPINE_SIGNAL = 4
+
+class UniformIndex():
+    # Uniform random index in [0, n), from blocks of numpy samples
+    def __init__(self, rng, block_size=65536):
+        self.rng = rng
+        self.block_size = block_size
+        self.block = []
+
+    def get(self, n):
+        if not self.block:
+            self.block = self.rng.random(self.block_size).tolist()
+        return int(self.block.pop() * n)
+
+#
+# Schedulers: spine_task(task) returns the spine decision (passed on to
+# leaf_task() after the link delay) or None to drop the task,
+# leaf_task(decision, task) returns (leaf_id, worker) or None, leaf_done()
+# returns the packets the leaf sends to the spine for a worker reply.
+#
+class HorusScheduler():
+    #
+    # The P4 leaf keeps its idle linkage after sending IDLE_REMOVE until the
+    # spine sends it a task selected by load (qlen == 0), and tasks in flight
+    # that were selected as idle link it again. The replies in between send
+    # duplicate IDLE_REMOVE/IDLE_SIGNAL packets, and the spine then removes
+    # other leaves from its idle list (or adds INVALID entries), which sends
+    # tasks nowhere. Unless strict_p4 is set, the idle signals that do not
+    # match the spine idle list (remove of a leaf that is not in it, add of a
+    # leaf that is) are not given to the spine, and are counted.
+    #
+    def __init__(self, workers_per_leaf, seed=None, strict_p4=False):
+        self.workers_per_leaf = workers_per_leaf
+        self.strict_p4 = strict_p4
+        self.num_stale_signals = 0
+        self.spine = SpineModel(seed)
+        self.spine.apply_plan(spine_plan(dict(enumerate(workers_per_leaf)), routes={CLIENT_ID: CLIENT_ID}))
+        self.leaves = []
+        for leaf_id, num_workers in enumerate(workers_per_leaf):
+            # One leaf switch per model, its vcluster uses the whole register arrays
+            leaf = LeafModel(None if seed is None else seed + 1 + leaf_id, max_workers_per_cluster=MAX_WORKERS_IN_RACK)
+            leaf.apply_plan(leaf_plan({leaf_id: num_workers}, spine_ids=[SWITCH_ID], max_workers_per_cluster=MAX_WORKERS_IN_RACK))
+            self.leaves.append(leaf)
+
+    def spine_task(self, task):
+        # The task as forwarded by the spine (qlen tells the leaf if it was selected as idle)
+        emitted = self.spine.process(HorusPacket(PKT_TYPE_NEW_TASK, 0, CLIENT_ID, SWITCH_ID, 0, task & MASK_16bit))
+        if not emitted or emitted[0][1].dst_id >= len(self.leaves):
+            return None
+        return emitted[0][1]
+
+    def leaf_task(self, pkt, task):
+        leaf_id = pkt.dst_id
+        emitted = self.leaves[leaf_id].process(pkt)
+        worker = emitted[0][1].dst_id & (MAX_WORKERS_IN_RACK - 1)
+        return (leaf_id, worker) if worker < self.workers_per_leaf[leaf_id] else None
+
+    def leaf_done(self, leaf_id, worker, qlen):
+        pkt_type = PKT_TYPE_TASK_DONE_IDLE if qlen == 0 else PKT_TYPE_TASK_DONE
+        emitted = self.leaves[leaf_id].process(HorusPacket(pkt_type, leaf_id, worker, CLIENT_ID, qlen, 0))
+        return [pkt for _, pkt in emitted if pkt.dst_id == SWITCH_ID]
+
+    def spine_signal(self, pkt):
+        if not self.strict_p4 and pkt.pkt_type in (PKT_TYPE_IDLE_SIGNAL, PKT_TYPE_IDLE_REMOVE):
+            # Leaves are vcluster 0 of the spine (start index 0)
+            index = int(self.spine.registers['idle_list_idx_mapping'][pkt.src_id])
+            is_idle = index < self.spine.registers['idle_count'][0] and self.spine.registers['idle_list'][index] == pkt.src_id
+            if is_idle == (pkt.pkt_type == PKT_TYPE_IDLE_SIGNAL):
+                self.num_stale_signals += 1
+                return
+        self.spine.process(pkt)
+
+    def stats(self):
+        return {
+            'spine_resubmissions': self.spine.num_resubmissions,
+            'leaf_resubmissions': sum(leaf.num_resubmissions for leaf in self.leaves),
+            'stale_signals': self.num_stale_signals,
+        }
+
+class RackSchedScheduler():
+    # RS-H (hierarchical=True) and RS-R
+    def __init__(self, workers_per_leaf, hierarchical, seed=None):
+        self.workers_per_leaf = workers_per_leaf
+        self.hierarchical = hierarchical
+        self.random = UniformIndex(np.random.default_rng(seed))
+        self.worker_qlens = [[0] * num_workers for num_workers in workers_per_leaf]
+        self.units = [queue_len_unit(num_workers) for num_workers in workers_per_leaf]
+        self.aggregate_qlens = [0] * len(workers_per_leaf) # Leaf registers
+        self.leaf_qlens = [0] * len(workers_per_leaf) # Spine view
+
+    def spine_task(self, task):
+        num_leaves = len(self.workers_per_leaf)
+        leaf_1 = self.random.get(num_leaves)
+        if not self.hierarchical:
+            return leaf_1
+        leaf_2 = self.random.get(num_leaves)
+        if min(self.leaf_qlens[leaf_1], self.leaf_qlens[leaf_2]) == self.leaf_qlens[leaf_1]:
+            return leaf_1
+        return leaf_2
+
+    def leaf_task(self, leaf_id, task):
+        num_workers = self.workers_per_leaf[leaf_id]
+        qlens = self.worker_qlens[leaf_id]
+        worker_1 = self.random.get(num_workers)
+        worker_2 = self.random.get(num_workers)
+        if self.hierarchical:
+            self.aggregate_qlens[leaf_id] = (self.aggregate_qlens[leaf_id] + self.units[leaf_id]) & MASK_16bit
+        if min(qlens[worker_1], qlens[worker_2]) == qlens[worker_1]:
+            return (leaf_id, worker_1)
+        return (leaf_id, worker_2)
+
+    def leaf_done(self, leaf_id, worker, qlen):
+        self.worker_qlens[leaf_id][worker] = qlen
+        if not self.hierarchical:
+            return []
+        self.aggregate_qlens[leaf_id] = (self.aggregate_qlens[leaf_id] - self.units[leaf_id]) & MASK_16bit
+        return [HorusPacket(PKT_TYPE_QUEUE_SIGNAL, 0, leaf_id, SWITCH_ID, self.aggregate_qlens[leaf_id], 0)]
+
+    def spine_signal(self, pkt):
+        self.leaf_qlens[pkt.src_id] = pkt.qlen
+
+    def stats(self):
+        return {}
+
+def make_scheduler(name, workers_per_leaf, seed=None):
+    if name == 'horus':
+        return HorusScheduler(workers_per_leaf, seed)
+    elif name in ('rs_h', 'rs_r'):
+        return RackSchedScheduler(workers_per_leaf, name == 'rs_h', seed)
+    raise ValueError("Unknown scheduler %s, expected one of %s" %(name, ', '.join(SCHEDULERS)))
+
+class ClusterSimulator():
+    def __init__(self, scheduler, workers_per_leaf, hop_delay=HOP_DELAY_US):
+        if len(workers_per_leaf) >= SWITCH_ID or max(workers_per_leaf) > MAX_WORKERS_IN_RACK:
+            raise ValueError("At most %d leaves with %d workers each" %(SWITCH_ID - 1, MAX_WORKERS_IN_RACK))
+        self.scheduler = scheduler
+        self.workers_per_leaf = workers_per_leaf
+        self.hop_delay = hop_delay
+        self.worker_offsets = np.concatenate(([0], np.cumsum(workers_per_leaf))).tolist()
+        self.num_workers = self.worker_offsets[-1]
+        self.num_signals = 0
+        self.num_dropped = 0
+
+    def run(self, arrival_times, service_times):
+        # Returns the latency of each task (us), nan for the tasks dropped by the scheduler
+        scheduler = self.scheduler
+        hop_delay = self.hop_delay
+        offsets = self.worker_offsets
+        worker_leaf = np.repeat(np.arange(len(self.workers_per_leaf)), self.workers_per_leaf).tolist()
+        arrivals = arrival_times.tolist()
+        services = service_times.tolist()
+        done_times = np.full(len(arrivals), np.nan)
+        queues = [collections.deque() for _ in range(self.num_workers)]
+        events = []
+        counter = itertools.count()
+        heappush, heappop = heapq.heappush, heapq.heappop
+        num_tasks = len(arrivals)
+        next_task = 0
+        while next_task < num_tasks or events:
+            if next_task < num_tasks and (not events or arrivals[next_task] <= events[0][0]):
+                # Task reaches the spine
+                now, task = arrivals[next_task], next_task
+                next_task += 1
+                decision = scheduler.spine_task(task)
+                if decision is None:
+                    self.num_dropped += 1
+                else:
+                    heappush(events, (now + hop_delay, next(counter), EV_LEAF_TASK, decision, task))
+                continue
+            now, _, event, a, b = heappop(events)
+            if event == EV_LEAF_TASK:
+                selected = scheduler.leaf_task(a, b)
+                if selected is None:
+                    self.num_dropped += 1
+                else:
+                    heappush(events, (now + hop_delay, next(counter), EV_WORKER_TASK, offsets[selected[0]] + selected[1], b))
+            elif event == EV_WORKER_TASK:
+                queue = queues[a]
+                queue.append(b)
+                if len(queue) == 1:
+                    heappush(events, (now + services[b], next(counter), EV_WORKER_DONE, a, b))
+            elif event == EV_WORKER_DONE:
+                queue = queues[a]
+                queue.popleft()
+                done_times[b] = now
+                if queue:
+                    heappush(events, (now + services[queue[0]], next(counter), EV_WORKER_DONE, a, queue[0]))
+                heappush(events, (now + hop_delay, next(counter), EV_LEAF_DONE, a, len(queue)))
+            elif event == EV_LEAF_DONE:
+                leaf_id = worker_leaf[a]
+                for pkt in scheduler.leaf_done(leaf_id, a - offsets[leaf_id], b):
+                    self.num_signals += 1
+                    heappush(events, (now + hop_delay, next(counter), EV_SPINE_SIGNAL, pkt, 0))
+            else:
+                scheduler.spine_signal(a)
+        # Arrivals are taken at the spine: + client->spine and worker->leaf->spine->client
+        return done_times - arrival_times + 4 * hop_delay
+
+def run_experiment(scheduler_name, load, workers_per_leaf, workload='bimodal', num_tasks=200000,
+                   hop_delay=HOP_DELAY_US, seed=1, percentiles=(50, 99, 99.9), fast=False):
+    #
+    # One point of the latency vs load curve. load is the fraction of the
+    # total worker capacity. The same seed gives the same tasks for all
+    # schedulers. fast: RS-H/RS-R with the batch engine of pow2.py instead
+    # of the event loop.
+    #
+    num_workers = sum(workers_per_leaf)
+    arrival_times, service_times = workload_trace(workload, rps_for_load(workload, load, num_workers), num_tasks, seed=seed)[:2]
+    start_time = time.time()
+    if fast and scheduler_name in ('rs_h', 'rs_r'):
+        # RS-H sends a QUEUE_SIGNAL for every reply, RS-R none
+        latencies = simulate_racksched(workers_per_leaf, arrival_times, service_times, scheduler_name == 'rs_h',
+                                       hop_delay=hop_delay, seed=seed)
+        num_dropped, num_signals, stats = 0, num_tasks if scheduler_name == 'rs_h' else 0, {}
+    else:
+        scheduler = make_scheduler(scheduler_name, workers_per_leaf, seed)
+        simulator = ClusterSimulator(scheduler, workers_per_leaf, hop_delay)
+        latencies = simulator.run(arrival_times, service_times)
+        num_dropped, num_signals, stats = simulator.num_dropped, simulator.num_signals, scheduler.stats()
+    run_time = time.time() - start_time
+    latencies = latencies[int(num_tasks * WARMUP_FRACTION):]
+    latencies = latencies[~np.isnan(latencies)]
+    result = {
+        'scheduler': scheduler_name,
+        'workload': workload,
+        'load': load,
+        'num_workers': num_workers,
+        'num_leaves': len(workers_per_leaf),
+        'num_tasks': num_tasks,
+        'num_dropped': num_dropped,
+        'num_signals': num_signals,
+        'run_time': run_time,
+    }
+    result.update(stats)
+    for percentile, value in zip(percentiles, np.percentile(latencies, percentiles) if len(latencies) else [np.nan] * len(percentiles)):
+        result['p%g' %(percentile)] = float(value)
+    return result
+
+def run_sweep(workers_per_leaf, workload='bimodal', loads=DEFAULT_LOADS, schedulers=SCHEDULERS, num_tasks=200000, seed=1, fast=False):
+    results = []
+    print ("%-6s %5s %10s %10s %10s %9s %8s %7s" %("sched", "load", "p50 us", "p99 us", "p99.9 us", "signals", "dropped", "time s"))
+    for load in loads:
+        for scheduler_name in schedulers:
+            result = run_experiment(scheduler_name, load, workers_per_leaf, workload, num_tasks, seed=seed, fast=fast)
+            print ("%-6s %5.2f %10.1f %10.1f %10.1f %9d %8d %7.1f" %(scheduler_name, load, result['p50'], result['p99'],
+                   result['p99.9'], result['num_signals'], result['num_dropped'], result['run_time']))
+            results.append(result)
+    return results
+
+if __name__ == "__main__":
+    workload = sys.argv[1] if len(sys.argv) > 1 else 'bimodal'
+    num_leaves = int(sys.argv[2]) if len(sys.argv) > 2 else 16
+    workers_per_leaf = int(sys.argv[3]) if len(sys.argv) > 3 else 64
+    num_tasks = int(sys.argv[4]) if len(sys.argv) > 4 else 200000
+    if workload not in WORKLOADS:
+        print("Usage: %s [%s] [num_leaves] [workers_per_leaf] [num_tasks]" %(sys.argv[0], '|'.join(sorted(WORKLOADS))))
+        sys.exit(1)
+    print ("%s workload, %d leaves x %d workers, %d tasks per point" %(workload, num_leaves, workers_per_leaf, num_tasks))
+    run_sweep([workers_per_leaf] * num_leaves, workload, num_tasks=num_tasks)
@@ -0,0 +1,235 @@
+#
+# Codec of the 11 byte horus_h header (../horus/headers.p4) without scapy.
+#
+# The header is packed and unpacked with one precompiled struct.Struct, in
+# place in any writable buffer (bytearray, memoryview, mmap, numpy array), so
+# emulators and analysis tools can reuse preallocated buffers instead of
+# building a scapy Packet per header. Decoded headers are HorusPacket
+# namedtuples (headers.py), as used by the models.
+#
+# encode_frames() builds whole Ethernet/IPv4/UDP/horus frames for arrays of
+# headers at once with numpy, as one contiguous buffer with the offset and
+# length of each frame (for sendmmsg or write_pcap), e.g. to generate task
+# traces without one scapy stack per packet (make_saqr_task_pkt).
+#
+# The scapy adapter (to_scapy, from_scapy) is for the code that still handles
+# scapy packets (sniff(), PTF tests). scapy is only imported when the adapter
+# is used.
+#
+# Usage:
+#
+#  buf = HeaderBuffer(1024)
+#  buf.set(0, HorusPacket(PKT_TYPE_NEW_TASK, 0, 0, 100, 0, 1))
+#  pkt = buf.get(0)
+#  encode_header_into(frame, 42, pkt)      # after the Ethernet/IPv4/UDP headers
+#  pkts = list(decode_headers(buf.headers(1)))
+#
+#  headers = horus_headers(PKT_TYPE_NEW_TASK, cluster_id=0, src_id=200, dst_id=100, seq_num=np.arange(1000))
+#  buf, offsets, lengths = encode_frames(headers, payload_lens=75)
+#
+import socket
+import struct
+
+import numpy as np
+
+from sim.headers import HorusPacket, MASK_16bit
+
+HORUS_PORT = 1234 # UDP port of the horus packets (parser.p4)
+
+ETHERTYPE_IPV4 = 0x0800
+ETHERTYPE_VLAN = 0x8100
+IP_PROTOCOLS_UDP = 17
+ETHERNET_HDR_SIZE = 14
+VLAN_HDR_SIZE = 4
+IPV4_HDR_SIZE = 20
+UDP_HDR_SIZE = 8
+
+# pkt_type (8), cluster_id, src_id, dst_id, qlen, seq_num (16), network byte order
+HORUS_HDR = struct.Struct('!BHHHHH')
+HORUS_HDR_SIZE = HORUS_HDR.size
+HORUS_HDR_DTYPE = np.dtype([('pkt_type', 'u1'), ('cluster_id', '>u2'), ('src_id', '>u2'), ('dst_id', '>u2'),
+                            ('qlen', '>u2'), ('seq_num', '>u2')])
+
+FRAME_HDR_SIZE = ETHERNET_HDR_SIZE + IPV4_HDR_SIZE + UDP_HDR_SIZE + HORUS_HDR_SIZE
+# Same addresses as the make_saqr_*_pkt helpers (legacy/saqr/pkts.py)
+DEFAULT_SRC_MAC = '00:00:00:00:00:01'
+DEFAULT_DST_MAC = '00:00:00:00:00:02'
+DEFAULT_SRC_IP = '192.168.0.16'
+DEFAULT_DST_IP = '10.0.0.2'
+FRAMES_CHUNK_SIZE = 65536
+
+_make = HorusPacket._make
+
+def encode_header(pkt):
+    # bytes of the header of pkt (HorusPacket or any sequence in wire order)
+    return HORUS_HDR.pack(*pkt)
+
+def encode_header_into(buf, offset, pkt):
+    HORUS_HDR.pack_into(buf, offset, *pkt)
+
+def decode_header(buf, offset=0):
+    return _make(HORUS_HDR.unpack_from(buf, offset))
+
+def decode_headers(buf):
+    # HorusPackets of a buffer of consecutive headers (length a multiple of HORUS_HDR_SIZE)
+    return map(_make, HORUS_HDR.iter_unpack(buf))
+
+class HeaderBuffer():
+    #
+    # Preallocated array of capacity headers. get/set work on header i in
+    # place, headers(n) is a zero-copy view of the first n headers.
+    #
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.data = bytearray(capacity * HORUS_HDR_SIZE)
+        self.view = memoryview(self.data)
+
+    def set(self, i, pkt):
+        HORUS_HDR.pack_into(self.data, i * HORUS_HDR_SIZE, *pkt)
+
+    def get(self, i):
+        return _make(HORUS_HDR.unpack_from(self.data, i * HORUS_HDR_SIZE))
+
+    def fill(self, pkts, start=0):
+        # Encodes pkts from header start on, returns the index after the last one
+        pack_into = HORUS_HDR.pack_into
+        data = self.data
+        i = start
+        for pkt in pkts:
+            pack_into(data, i * HORUS_HDR_SIZE, *pkt)
+            i += 1
+        return i
+
+    def headers(self, n=None, start=0):
+        return self.view[start * HORUS_HDR_SIZE:(self.capacity if n is None else start + n) * HORUS_HDR_SIZE]
+
+def horus_headers(pkt_type, cluster_id=0, src_id=0, dst_id=0, qlen=0, seq_num=0):
+    # Structured array (HORUS_HDR_DTYPE) of the fields, scalars are broadcast to the length of the arrays
+    fields = np.broadcast_arrays(*[np.asarray(value) for value in (pkt_type, cluster_id, src_id, dst_id, qlen, seq_num)])
+    headers = np.empty(fields[0].size, dtype=HORUS_HDR_DTYPE)
+    for name, value in zip(HORUS_HDR_DTYPE.names, fields):
+        headers[name] = value.ravel()
+    return headers
+
+def _mac_bytes(mac):
+    return np.frombuffer(bytes(bytearray(int(byte, 16) for byte in mac.split(':'))), dtype=np.uint8)
+
+def _ip_bytes(ips, n):
+    # (n, 4) bytes of one address or of one address per frame (dotted strings or 32 bit integers)
+    if isinstance(ips, str):
+        ips = [ips]
+    elif not isinstance(ips, np.ndarray) or ips.dtype.kind not in 'iu':
+        ips = [ip if isinstance(ip, str) else socket.inet_ntoa(struct.pack('!I', ip)) for ip in ips]
+    if not isinstance(ips, np.ndarray):
+        ips = np.array([struct.unpack('!I', socket.inet_aton(ip))[0] for ip in ips], dtype=np.uint32)
+    return np.broadcast_to(ips.astype('>u4').view(np.uint8).reshape(-1, 4), (n, 4))
+
+def _put_u16(slots, column, values):
+    slots[:, column] = values >> 8
+    slots[:, column + 1] = values & 0xFF
+
+def _encode_slots(headers, payload_lens, src_mac, dst_mac, src_ip, dst_ip, udp_sport, payload):
+    #
+    # Frames of a chunk in fixed size slots, one row per frame. The IPv4
+    # checksum is the ones' complement sum of the header words (RFC 1071),
+    # computed for all the rows at once.
+    #
+    n = len(headers)
+    frame_lens = FRAME_HDR_SIZE + payload_lens
+    slots = np.zeros((n, int(frame_lens.max())), dtype=np.uint8)
+    slots[:, 0:6] = _mac_bytes(dst_mac)
+    slots[:, 6:12] = _mac_bytes(src_mac)
+    _put_u16(slots, 12, ETHERTYPE_IPV4)
+    ip = ETHERNET_HDR_SIZE
+    slots[:, ip] = 0x45
+    _put_u16(slots, ip + 2, frame_lens - ETHERNET_HDR_SIZE)
+    slots[:, ip + 8] = 64 # ttl
+    slots[:, ip + 9] = IP_PROTOCOLS_UDP
+    slots[:, ip + 12:ip + 16] = _ip_bytes(src_ip, n)
+    slots[:, ip + 16:ip + 20] = _ip_bytes(dst_ip, n)
+    words = np.ascontiguousarray(slots[:, ip:ip + IPV4_HDR_SIZE]).view('>u2').sum(axis=1, dtype=np.int64)
+    words = (words & MASK_16bit) + (words >> 16)
+    words = (words & MASK_16bit) + (words >> 16)
+    _put_u16(slots, ip + 10, ~words & MASK_16bit)
+    udp = ip + IPV4_HDR_SIZE
+    _put_u16(slots, udp, udp_sport)
+    _put_u16(slots, udp + 2, HORUS_PORT)
+    _put_u16(slots, udp + 4, frame_lens - udp)
+    slots[:, FRAME_HDR_SIZE - HORUS_HDR_SIZE:FRAME_HDR_SIZE] = np.ascontiguousarray(headers).view(np.uint8).reshape(n, HORUS_HDR_SIZE)
+    max_payload = slots.shape[1] - FRAME_HDR_SIZE
+    if payload is not None and max_payload > 0:
+        payload = np.frombuffer(payload, dtype=np.uint8) if isinstance(payload, (bytes, bytearray)) else np.asarray(payload, dtype=np.uint8)
+        slots[:, FRAME_HDR_SIZE:] = payload[..., :max_payload]
+    return slots, frame_lens
+
+def encode_frames(headers, payload_lens=0, src_mac=DEFAULT_SRC_MAC, dst_mac=DEFAULT_DST_MAC, src_ip=DEFAULT_SRC_IP,
+                  dst_ip=DEFAULT_DST_IP, udp_sport=HORUS_PORT, payload=None):
+    #
+    # Ethernet/IPv4/UDP/horus frames of the headers (HORUS_HDR_DTYPE array,
+    # see horus_headers) with payload_lens bytes of payload each (scalar or
+    # array). Returns (buf, offsets, lengths): buf is one uint8 array with
+    # the frames back to back. dst_ip can be one address per frame. The
+    # payload is zeros, or payload: bytes used for every frame or a (frames,
+    # max payload len) array with one row per frame. The UDP checksum is 0
+    # like the make_saqr_*_pkt packets.
+    #
+    headers = np.asarray(headers)
+    n = len(headers)
+    payload_lens = np.broadcast_to(np.asarray(payload_lens, dtype=np.int64), (n,))
+    lengths = FRAME_HDR_SIZE + payload_lens
+    offsets = np.zeros(n, dtype=np.int64)
+    np.cumsum(lengths[:-1], out=offsets[1:])
+    buf = np.empty(int(lengths.sum()), dtype=np.uint8)
+    per_frame_ip = not isinstance(dst_ip, str) and len(dst_ip) == n
+    # Chunks bound the memory of the slots to FRAMES_CHUNK_SIZE frames
+    for start in range(0, n, FRAMES_CHUNK_SIZE):
+        end = min(n, start + FRAMES_CHUNK_SIZE)
+        chunk_payload = payload
+        if payload is not None and not isinstance(payload, (bytes, bytearray)) and np.ndim(payload) == 2:
+            chunk_payload = payload[start:end]
+        slots, frame_lens = _encode_slots(headers[start:end], payload_lens[start:end], src_mac, dst_mac, src_ip,
+                                          dst_ip[start:end] if per_frame_ip else dst_ip, udp_sport, chunk_payload)
+        chunk = buf[offsets[start]:offsets[end - 1] + lengths[end - 1]]
+        if (frame_lens == slots.shape[1]).all():
+            chunk[:] = slots.ravel()
+        else:
+            # Row-major boolean indexing drops the unused end of each slot, leaving the frames back to back
+            chunk[:] = slots[np.arange(slots.shape[1]) < frame_lens[:, None]]
+    return buf, offsets, lengths
+
+def frames(buf, offsets, lengths):
+    # Zero-copy views of the frames of encode_frames, e.g. for write_pcap
+    view = memoryview(buf)
+    return [view[offset:offset + length] for offset, length in zip(offsets.tolist(), lengths.tolist())]
+
+_scapy_header_cls = None
+
+def scapy_header_cls():
+    # scapy Packet class with the horus_h fields, bound to UDP port 1234
+    global _scapy_header_cls
+    if _scapy_header_cls is None:
+        import scapy.all as scapy
+
+        class HorusHeader(scapy.Packet):
+            name = 'horusPacket'
+            fields_desc = [scapy.XByteField('pkt_type', 0),
+                           scapy.XShortField('cluster_id', 0),
+                           scapy.XShortField('src_id', 0),
+                           scapy.XShortField('dst_id', 0),
+                           scapy.XShortField('qlen', 0),
+                           scapy.XShortField('seq_num', 0)]
+
+        scapy.bind_layers(scapy.UDP, HorusHeader, dport=HORUS_PORT)
+        _scapy_header_cls = HorusHeader
+    return _scapy_header_cls
+
+def to_scapy(pkt):
+    # scapy layer of a HorusPacket, e.g. Ether() / IP() / UDP() / to_scapy(pkt)
+    return scapy_header_cls()(encode_header(pkt))
+
+def from_scapy(scapy_pkt):
+    # HorusPacket of a scapy packet: the payload of its UDP layer if it has one, else the packet itself
+    import scapy.all as scapy
+    if scapy_pkt.haslayer(scapy.UDP):
+        scapy_pkt = scapy_pkt[scapy.UDP].payload
+    return decode_header(scapy.raw(scapy_pkt))
@@ -0,0 +1,83 @@
+#
+# Constants and packet format of ../headers.p4 for the behavioral models, and
+# the Random<bit<16>> extern used by the P4 programs.
+#
+# The models operate on the horus_h header only (the Ethernet/IP/UDP headers
+# are not needed for scheduling). A packet is a HorusPacket namedtuple with
+# the header fields in wire order, a modified copy is made with _replace().
+#
+# Usage:
+#
+#  pkt = HorusPacket(PKT_TYPE_NEW_TASK, cluster_id=0, src_id=0, dst_id=100, qlen=0, seq_num=1)
+#
+import collections
+
+import numpy as np
+
+PKT_TYPE_NEW_TASK = 0
+PKT_TYPE_NEW_TASK_RANDOM = 1
+PKT_TYPE_TASK_DONE = 2
+PKT_TYPE_TASK_DONE_IDLE = 3
+PKT_TYPE_QUEUE_REMOVE = 4
+PKT_TYPE_SCAN_QUEUE_SIGNAL = 5
+PKT_TYPE_IDLE_SIGNAL = 6
+PKT_TYPE_QUEUE_SIGNAL = 7
+PKT_TYPE_PROBE_IDLE_QUEUE = 8
+PKT_TYPE_PROBE_IDLE_RESPONSE = 9
+PKT_TYPE_IDLE_REMOVE = 10
+PKT_TYPE_KEEP_ALIVE = 11
+PKT_TYPE_WORKER_ID = 12
+PKT_TYPE_WORKER_ID_ACK = 13
+PKT_TYPE_REMOVE_ACK = 14
+PKT_TYPE_QUEUE_SIGNAL_INIT = 15
+
+PKT_TYPE_NAMES = dict((value, name[len('PKT_TYPE_'):]) for name, value in list(globals().items()) if name.startswith('PKT_TYPE_'))
+
+PORT_PCI_CPU = 192
+
+MAX_VCLUSTERS = 32
+MAX_WORKERS_PER_CLUSTER = 16
+MAX_LEAFS_PER_CLUSTER = 16
+MAX_WORKERS_IN_RACK = 256
+MAX_LEAFS = 256
+MAX_TOTAL_LEAFS = 256
+ARRAY_SIZE = 65536
+
+RESUBMIT_TYPE_NEW_TASK = 1
+RESUBMIT_TYPE_IDLE_REMOVE = 2
+
+INVALID_VALUE_8bit = 0x7F
+INVALID_VALUE_16bit = 0x7FFF
+
+MASK_16bit = 0xFFFF
+MASK_32bit = 0xFFFFFFFF
+
+HorusPacket = collections.namedtuple('HorusPacket', ['pkt_type', 'cluster_id', 'src_id', 'dst_id', 'qlen', 'seq_num'])
+
+# Shift of the 16 bit random number applied by the adjust_random_*_range_<N> actions
+RANDOM_RANGE_SHIFTS = {1: 15, 2: 14, 3: 13, 4: 12, 5: 11, 8: 8}
+
+def random_range_shift(action_name):
+    # 'LeafIngress.adjust_random_worker_range_4' -> 12
+    return RANDOM_RANGE_SHIFTS[int(action_name.rsplit('_', 1)[1])]
+
+def field_values(key):
+    # Plan key/data ((field_name, value), ...) -> {short field name: value}, so that
+    # plans using hdr.saqr.* (legacy) and hdr.horus.* field names both work
+    return dict((name.rsplit('.', 1)[-1], value) for name, value in key)
+
+class Random16():
+    #
+    # Random<bit<16>>().get(). The numbers are drawn from a numpy Generator in
+    # blocks so that each get() only pops a Python int from a list.
+    #
+    def __init__(self, seed=None, block_size=65536):
+        self.rng = np.random.default_rng(seed)
+        self.block_size = block_size
+        self.block = []
+
+    def get(self):
+        if not self.block:
+            self.block = self.rng.integers(0, 1 << 16, size=self.block_size, dtype=np.int64).tolist()
+            self.block.reverse()
+        return self.block.pop()
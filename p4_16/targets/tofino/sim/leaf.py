@@ -0,0 +1,422 @@
+#
+# Behavioral model of LeafIngress (../horus/leaf.p4).
+#
+# The registers are preallocated numpy arrays with the sizes of the P4 code
+# and the per-packet logic follows the apply{} block stage by stage, with the
+# same 16/32 bit wrap-around, register index truncation and RegisterAction
+# return values. The tables are dicts filled from a Plan (see
+# switch_ctrl/plan.py), so the model can be programmed with the same
+# entries as the switch, or with leaf_plan() for placements that do not exist
+# on the testbed (e.g. 256 workers in a rack).
+#
+# process() handles one packet and returns the packets that leave the switch
+# as (port, HorusPacket) tuples: the forwarded (possibly rewritten) packet and
+# the mirrored copy of the original packet when the pipeline mirrors it. A
+# NEW_TASK that needs resubmission is run through the resubmit pass right
+# away, as the switch would. port is None if no forwarding entry matched.
+#
+# Usage:
+#
+#  leaf = LeafModel(seed=1)
+#  leaf.apply_plan(leaf_plan({0: 256}, spine_ids=[100]))
+#  for port, pkt in leaf.process(HorusPacket(PKT_TYPE_NEW_TASK, 0, 0, 0, 0, 1)):
+#      ...
+#  leaf.register('stat_count_resub')[0]
+#
+import numpy as np
+
+from switch_ctrl.plan import Plan
+from sim.headers import *
+
+CONTROL_NAME = 'LeafIngress'
+
+# Fixed point scale of set_queue_len_unit (1/#workers, see the saqr controller)
+QUEUE_LEN_UNIT_SCALE = 32
+
+# name -> (size, dtype) of the LeafIngress registers
+LEAF_REGISTERS = {
+    'idle_list': (MAX_WORKERS_IN_RACK, np.uint16),
+    'idle_count': (MAX_VCLUSTERS, np.uint16),
+    'queue_len_list_1': (MAX_WORKERS_IN_RACK, np.uint16),
+    'queue_len_list_2': (MAX_WORKERS_IN_RACK, np.uint16),
+    'deferred_queue_len_list_1': (MAX_WORKERS_IN_RACK, np.uint16),
+    'deferred_queue_len_list_2': (MAX_WORKERS_IN_RACK, np.uint16),
+    'aggregate_queue_len_list': (MAX_VCLUSTERS, np.uint16),
+    'linked_iq_sched': (MAX_VCLUSTERS, np.uint16),
+    'linked_sq_sched': (MAX_VCLUSTERS, np.uint16),
+    'linked_view_drift': (MAX_VCLUSTERS, np.uint16),
+    'idle_link_spine_view': (MAX_VCLUSTERS, np.uint16),
+    'backoff1': (MAX_VCLUSTERS, np.uint16),
+    'backoff3': (MAX_VCLUSTERS, np.uint16),
+    'stat_count_resub': (MAX_VCLUSTERS, np.uint32),
+    'stat_count_idle_signal': (MAX_VCLUSTERS, np.uint32),
+    'stat_count_load_signal': (MAX_VCLUSTERS, np.uint32),
+    'stat_count_task': (1, np.uint32),
+    'ingress_tstamp': (ARRAY_SIZE, np.uint32),
+}
+
+def queue_len_unit(num_workers):
+    # set_queue_len_unit value for a vcluster with num_workers in the rack
+    return max(1, QUEUE_LEN_UNIT_SCALE // num_workers)
+
+def leaf_plan(vcluster_workers, spine_ids, linked_spine=None, max_workers_per_cluster=MAX_WORKERS_PER_CLUSTER,
+              worker_port=None, spine_ports=None):
+    #
+    # Plan with the entries the saqr LeafController programs, for any placement.
+    # vcluster_workers: {cluster_id: number of workers in this rack}, the
+    # workers of cluster k use the absolute ids k * max_workers_per_cluster + i.
+    # spine_ids: spines of each vcluster (get_spine_dst_id), linked_spine is the
+    # initial idle/load linkage (default spine_ids[0]). The model does not need
+    # real ports, by default worker i uses port i and spine s port s.
+    #
+    linked_spine = spine_ids[0] if linked_spine is None else linked_spine
+    spine_range = 1 << max(1, (len(spine_ids) - 1).bit_length())
+    plan = Plan()
+    for cluster_id, num_workers in vcluster_workers.items():
+        start_idx = cluster_id * max_workers_per_cluster
+        plan.set_register('LeafIngress.linked_iq_sched.f1', cluster_id, linked_spine)
+        plan.set_register('LeafIngress.linked_sq_sched.f1', cluster_id, linked_spine)
+        plan.set_register('LeafIngress.idle_count.f1', cluster_id, num_workers)
+        plan.set_register('LeafIngress.aggregate_queue_len_list.f1', cluster_id, 0)
+        plan.set_register_range('LeafIngress.idle_list.f1', start_idx, range(start_idx, start_idx + num_workers))
+        for i in range(spine_range):
+            # The sampled spine index covers a power of two range, so every index maps to a spine
+            plan.add_entry('LeafIngress.get_spine_dst_id',
+                [('horus_md.random_id_1', i), ('hdr.horus.cluster_id', cluster_id)],
+                'LeafIngress.act_get_spine_dst_id',
+                [('spine_dst_id', spine_ids[i % len(spine_ids)])])
+        for wid in range(start_idx, start_idx + num_workers):
+            plan.add_entry('LeafIngress.forward_horus_switch_dst',
+                [('hdr.horus.dst_id', wid), ('hdr.horus.cluster_id', cluster_id)],
+                'LeafIngress.act_forward_horus',
+                [('port', wid if worker_port is None else worker_port(wid))])
+        for spine_id in spine_ids:
+            plan.add_entry('LeafIngress.forward_horus_switch_dst',
+                [('hdr.horus.dst_id', spine_id), ('hdr.horus.cluster_id', cluster_id)],
+                'LeafIngress.act_forward_horus',
+                [('port', (spine_ports or {}).get(spine_id, spine_id))])
+        plan.add_entry('LeafIngress.get_cluster_num_valid',
+            [('hdr.horus.cluster_id', cluster_id)],
+            'LeafIngress.act_get_cluster_num_valid',
+            [('num_ds_elements', num_workers), ('num_us_elements', len(spine_ids))])
+        plan.add_entry('LeafIngress.set_queue_len_unit',
+            [('hdr.horus.cluster_id', cluster_id)],
+            'LeafIngress.act_set_queue_len_unit',
+            [('cluster_unit', queue_len_unit(num_workers))])
+        for spine_id in spine_ids:
+            # Worker replies are mirrored to session dst_id + cluster_id (calc_mirror_dst_id)
+            plan.add_entry('$mirror.cfg', [('$sid', spine_id + cluster_id)], '$normal',
+                [('$ucast_egress_port', (spine_ports or {}).get(spine_id, spine_id))])
+    for num_valid, action_name in ((2, 'LeafIngress.adjust_random_worker_range_1'),
+                                   (4, 'LeafIngress.adjust_random_worker_range_2'),
+                                   (8, 'LeafIngress.adjust_random_worker_range_3'),
+                                   (16, 'LeafIngress.adjust_random_worker_range_4'),
+                                   (32, 'LeafIngress.adjust_random_worker_range_5'),
+                                   (256, 'LeafIngress.adjust_random_worker_range_8')):
+        plan.add_entry('LeafIngress.adjust_random_range_ds', [('horus_md.cluster_num_valid_ds', num_valid)], action_name)
+    plan.add_entry('LeafIngress.adjust_random_range_us', [('horus_md.cluster_num_valid_us', len(spine_ids))],
+        'LeafIngress.adjust_random_worker_range_%d' %(spine_range.bit_length() - 1))
+    return plan
+
+class LeafModel():
+    def __init__(self, seed=None, max_workers_per_cluster=MAX_WORKERS_PER_CLUSTER):
+        self.max_workers_per_cluster = max_workers_per_cluster
+        self.random = Random16(seed)
+        self.registers = {}
+        for name, (size, dtype) in LEAF_REGISTERS.items():
+            self.registers[name] = np.zeros(size, dtype=dtype)
+        # Same initial values as the P4 code expects before the controller runs
+        self.registers['linked_iq_sched'][:] = INVALID_VALUE_16bit
+        self.registers['linked_sq_sched'][:] = INVALID_VALUE_16bit
+        # Tables
+        self.queue_len_units = {} # cluster_id -> cluster_unit
+        self.cluster_num_valid = {} # cluster_id -> (num_ds_elements, num_us_elements)
+        self.random_shift_ds = {} # cluster_num_valid_ds -> shift
+        self.random_shift_us = {} # cluster_num_valid_us -> shift
+        self.spine_dst_ids = {} # (random_id_1, cluster_id) -> spine_dst_id
+        self.forward = {} # (dst_id, cluster_id or None) -> port
+        self.mirror_sessions = {} # mirror session id -> port
+        self.num_packets = 0
+        self.num_resubmissions = 0
+
+    def register(self, name):
+        # Register array by its P4 name (with or without the control/field name)
+        if name.startswith(CONTROL_NAME + '.'):
+            name = name[len(CONTROL_NAME) + 1:]
+        if name.endswith('.f1'):
+            name = name[:-3]
+        return self.registers[name]
+
+    def apply_plan(self, plan):
+        # Programs the tables and registers, same as apply_plan_diff() on the switch
+        for (table_name, key), (action_name, data) in plan.entries.items():
+            self.add_entry(table_name, key, action_name, data)
+        for (register_name, index), register_value in plan.registers.items():
+            register = self.register(register_name)
+            register[index & (len(register) - 1)] = register_value
+
+    def add_entry(self, table_name, key, action_name, data=()):
+        table_name = table_name.rsplit('.', 1)[-1]
+        key = field_values(key)
+        data = field_values(data)
+        if table_name == 'set_queue_len_unit':
+            self.queue_len_units[key['cluster_id']] = data['cluster_unit']
+        elif table_name == 'get_cluster_num_valid':
+            self.cluster_num_valid[key['cluster_id']] = (data['num_ds_elements'], data['num_us_elements'])
+        elif table_name == 'adjust_random_range_ds':
+            self.random_shift_ds[key['cluster_num_valid_ds']] = random_range_shift(action_name)
+        elif table_name == 'adjust_random_range_us':
+            self.random_shift_us[key['cluster_num_valid_us']] = random_range_shift(action_name)
+        elif table_name == 'get_spine_dst_id':
+            self.spine_dst_ids[(key['random_id_1'], key['cluster_id'])] = data['spine_dst_id']
+        elif table_name.startswith('forward_'):
+            self.forward[(key['dst_id'], key.get('cluster_id'))] = data['port']
+        elif table_name == 'cfg': # $mirror.cfg
+            self.mirror_sessions[key['$sid']] = data.get('$ucast_egress_port')
+        else:
+            raise ValueError("LeafModel: unknown table %s" %(table_name))
+
+    def _forward_port(self, dst_id, cluster_id):
+        port = self.forward.get((dst_id, cluster_id))
+        if port is None:
+            port = self.forward.get((dst_id, None))
+        return port
+
+    def process(self, pkt, tstamp=0):
+        # One packet through LeafIngress (and the resubmit pass if triggered)
+        self.num_packets += 1
+        pkt_type, cluster_id, src_id, dst_id, qlen, seq_num = pkt
+        if pkt_type == PKT_TYPE_KEEP_ALIVE or pkt_type == PKT_TYPE_WORKER_ID_ACK:
+            # send_pkt_to_cpu(), the rest of the pipeline does not apply to these types
+            self._update_linked_sq(pkt_type, cluster_id, src_id)
+            return [(PORT_PCI_CPU, pkt)]
+        is_new_task = pkt_type == PKT_TYPE_NEW_TASK
+        is_task_done = pkt_type == PKT_TYPE_TASK_DONE or pkt_type == PKT_TYPE_TASK_DONE_IDLE
+        regs = self.registers
+        cid = cluster_id & (MAX_VCLUSTERS - 1)
+        worker_mask = MAX_WORKERS_IN_RACK - 1
+
+        # Stage 0
+        start_idx = (cluster_id * self.max_workers_per_cluster) & MASK_16bit
+        unit = self.queue_len_units.get(cluster_id, 0)
+        idle_count = regs['idle_count']
+        cluster_idle_count = 0
+        if pkt_type == PKT_TYPE_TASK_DONE_IDLE:
+            cluster_idle_count = int(idle_count[cid])
+            idle_count[cid] = (cluster_idle_count + 1) & MASK_16bit
+        elif is_new_task:
+            cluster_idle_count = int(idle_count[cid])
+            if cluster_idle_count > 0:
+                idle_count[cid] = cluster_idle_count - 1
+        elif pkt_type == PKT_TYPE_TASK_DONE:
+            cluster_idle_count = int(idle_count[cid])
+        linked_sq_id = self._update_linked_sq(pkt_type, cluster_id, src_id)
+
+        # Stage 1
+        idle_ds_index = (start_idx + cluster_idle_count) & MASK_16bit
+        num_valid_ds, num_valid_us = self.cluster_num_valid.get(cluster_id, (0, 0))
+        random_id_1 = self.random.get()
+        random_id_2 = self.random.get()
+        aggregate_queue_len = 0
+        if is_new_task or is_task_done:
+            aggregate = regs['aggregate_queue_len_list']
+            value = int(aggregate[cid])
+            if is_new_task:
+                value = (value + unit) & MASK_16bit
+            elif value >= unit:
+                value = value - unit
+            aggregate[cid] = value
+            aggregate_queue_len = value
+
+        # Stage 2
+        mirror_dst_id = (dst_id + cluster_id) & MASK_16bit
+        num_valid_half = 0
+        if is_new_task:
+            num_valid_half = num_valid_ds >> 1
+            task_count = regs['stat_count_task']
+            task_count[0] = (int(task_count[0]) + 1) & MASK_32bit
+            idle_ds_index = (idle_ds_index - 1) & MASK_16bit
+            shift = self.random_shift_ds.get(num_valid_ds, 0)
+        else:
+            shift = self.random_shift_us.get(num_valid_us, 0)
+        random_id_1 >>= shift
+        random_id_2 >>= shift
+
+        # Stage 3
+        spine_to_link_iq = 0
+        backoff_counter1 = 0
+        idle_ds_id = 0
+        if is_task_done:
+            spine_to_link_iq = self.spine_dst_ids.get((random_id_1, cluster_id), 0)
+            if pkt_type == PKT_TYPE_TASK_DONE_IDLE:
+                regs['idle_list'][idle_ds_index & worker_mask] = src_id
+        elif is_new_task:
+            regs['ingress_tstamp'][seq_num & (ARRAY_SIZE - 1)] = tstamp & MASK_32bit
+            backoff1 = regs['backoff1']
+            if qlen == 1:
+                if int(backoff1[cid]) == num_valid_half:
+                    backoff1[cid] = 0
+                else:
+                    backoff_counter1 = 1
+                    backoff1[cid] = (int(backoff1[cid]) + 1) & MASK_16bit
+            else:
+                backoff1[cid] = 0
+            if cluster_idle_count > 0:
+                idle_ds_id = int(regs['idle_list'][idle_ds_index & worker_mask])
+            elif random_id_1 == random_id_2:
+                if random_id_2 == 0:
+                    random_id_2 = 1
+                else:
+                    random_id_2 -= 1
+
+        # Stage 4
+        backoff_counter3 = 0
+        if is_new_task:
+            if cluster_idle_count == 0:
+                random_id_1 = (random_id_1 + start_idx) & MASK_16bit
+                random_id_2 = (random_id_2 + start_idx) & MASK_16bit
+        elif is_task_done:
+            backoff3 = regs['backoff3']
+            if int(backoff3[cid]) == num_valid_ds:
+                backoff3[cid] = 0
+            else:
+                backoff_counter3 = 1
+                backoff3[cid] = (int(backoff3[cid]) + 1) & MASK_16bit
+
+        # Stage 5
+        queue_len_list_1 = regs['queue_len_list_1']
+        queue_len_list_2 = regs['queue_len_list_2']
+        random_ds_qlen_1 = random_ds_qlen_2 = 0
+        idle_link = 0
+        if is_new_task:
+            random_ds_qlen_1 = int(queue_len_list_1[random_id_1 & worker_mask])
+            random_ds_qlen_2 = int(queue_len_list_2[random_id_2 & worker_mask])
+            if qlen == 1 and backoff_counter1 == 0:
+                regs['linked_iq_sched'][cid] = src_id
+            elif qlen == 0:
+                regs['linked_iq_sched'][cid] = INVALID_VALUE_16bit
+        elif is_task_done:
+            queue_len_list_1[src_id & worker_mask] = qlen
+            queue_len_list_2[src_id & worker_mask] = qlen
+            linked_iq_sched = regs['linked_iq_sched']
+            if cluster_idle_count > 1 and backoff_counter3 == 0:
+                idle_link = int(linked_iq_sched[cid])
+                if idle_link == INVALID_VALUE_16bit:
+                    linked_iq_sched[cid] = spine_to_link_iq
+            elif cluster_idle_count <= 1:
+                idle_link = int(linked_iq_sched[cid])
+
+        # Stage 6
+        out_type, out_src_id, out_dst_id, out_qlen = pkt_type, src_id, dst_id, qlen
+        mirror = False
+        selected_ds_qlen = not_selected_ds_qlen = 0
+        if is_new_task:
+            selected_ds_qlen = min(random_ds_qlen_1, random_ds_qlen_2)
+            not_selected_ds_qlen = max(random_ds_qlen_1, random_ds_qlen_2)
+        elif is_task_done:
+            if cluster_idle_count <= 1:
+                if idle_link != INVALID_VALUE_16bit:
+                    out_type, out_src_id, out_dst_id, out_qlen = PKT_TYPE_IDLE_REMOVE, cluster_id, idle_link, aggregate_queue_len
+                    self._inc_stat('stat_count_idle_signal', cid)
+                    mirror = True
+            elif idle_link == INVALID_VALUE_16bit:
+                out_type, out_src_id, out_dst_id, out_qlen = PKT_TYPE_IDLE_SIGNAL, cluster_id, spine_to_link_iq, aggregate_queue_len
+                self._inc_stat('stat_count_idle_signal', cid)
+                mirror = True
+
+        # Stage 7
+        queue_len_diff = (not_selected_ds_qlen - selected_ds_qlen) & MASK_16bit
+        ds_index_2 = 0
+        spine_view_ok = 1
+        if is_new_task:
+            if cluster_idle_count == 0:
+                if selected_ds_qlen == random_ds_qlen_1:
+                    out_dst_id = random_id_1
+                    ds_index_2 = random_id_2
+                else:
+                    out_dst_id = random_id_2
+                    ds_index_2 = random_id_1
+            else:
+                out_dst_id = idle_ds_id
+        elif is_task_done:
+            drift = regs['linked_view_drift']
+            if int(drift[cid]) == (num_valid_ds - 1) & MASK_16bit:
+                spine_view_ok = 0
+                drift[cid] = 0
+            else:
+                drift[cid] = (int(drift[cid]) + 1) & MASK_16bit
+
+        # Stage 8
+        resub_qlen_1 = 0
+        ds_index_1 = 0
+        deferred_1 = regs['deferred_queue_len_list_1']
+        deferred_2 = regs['deferred_queue_len_list_2']
+        if is_task_done:
+            deferred_1[src_id & worker_mask] = 0
+        elif is_new_task and cluster_idle_count == 0:
+            index = out_dst_id & worker_mask
+            value = int(deferred_1[index])
+            if random_id_2 != random_id_1:
+                if value <= queue_len_diff:
+                    deferred_1[index] = (value + 1) & MASK_16bit
+                else:
+                    resub_qlen_1 = (value + selected_ds_qlen) & MASK_16bit
+                ds_index_1 = out_dst_id
+            else:
+                deferred_1[index] = (value + 1) & MASK_16bit
+
+        # Stage 9
+        if is_task_done:
+            deferred_2[src_id & worker_mask] = 0
+            if spine_view_ok == 0:
+                out_type, out_src_id, out_dst_id, out_qlen = PKT_TYPE_QUEUE_SIGNAL, cluster_id, linked_sq_id, aggregate_queue_len
+                self._inc_stat('stat_count_load_signal', cid)
+                mirror = True
+        elif is_new_task:
+            if cluster_idle_count == 0:
+                if resub_qlen_1 == 0:
+                    index = out_dst_id & worker_mask
+                    deferred_2[index] = (int(deferred_2[index]) + 1) & MASK_16bit
+                else:
+                    resub_qlen_2 = (int(deferred_2[ds_index_2 & worker_mask]) + not_selected_ds_qlen) & MASK_16bit
+                    return self._resubmit(pkt, ds_index_1, ds_index_2, resub_qlen_1, resub_qlen_2)
+                out_qlen = 0
+            else:
+                out_qlen = 1
+
+        out_pkt = HorusPacket(out_type, cluster_id, out_src_id, out_dst_id, out_qlen, seq_num)
+        emitted = [(self._forward_port(out_dst_id, cluster_id), out_pkt)]
+        if mirror:
+            # The deparser mirrors the packet as it was received
+            emitted.append((self.mirror_sessions.get(mirror_dst_id), pkt))
+        return emitted
+
+    def _update_linked_sq(self, pkt_type, cluster_id, src_id):
+        linked_sq_sched = self.registers['linked_sq_sched']
+        cid = cluster_id & (MAX_VCLUSTERS - 1)
+        if pkt_type == PKT_TYPE_QUEUE_REMOVE:
+            linked_sq_sched[cid] = INVALID_VALUE_16bit
+            return INVALID_VALUE_16bit
+        linked_sq_id = int(linked_sq_sched[cid])
+        if linked_sq_id == INVALID_VALUE_16bit and pkt_type == PKT_TYPE_SCAN_QUEUE_SIGNAL:
+            linked_sq_sched[cid] = src_id
+        return linked_sq_id
+
+    def _inc_stat(self, name, index):
+        stat = self.registers[name]
+        stat[index] = (int(stat[index]) + 1) & MASK_32bit
+
+    def _resubmit(self, pkt, ds_index_1, ds_index_2, qlen_1, qlen_2):
+        # Resubmit pass: the original packet comes back with task_resub_hdr
+        self.num_resubmissions += 1
+        cluster_id = pkt.cluster_id
+        self._inc_stat('stat_count_resub', cluster_id & (MAX_VCLUSTERS - 1))
+        if min(qlen_1, qlen_2) == qlen_1:
+            dst_id = ds_index_1
+        else:
+            dst_id = ds_index_2
+        index = dst_id & (MAX_WORKERS_IN_RACK - 1)
+        for register in (self.registers['queue_len_list_1'], self.registers['queue_len_list_2']):
+            register[index] = (int(register[index]) + 1) & MASK_16bit
+        out_pkt = pkt._replace(dst_id=dst_id, qlen=0)
+        return [(self._forward_port(dst_id, cluster_id), out_pkt)]
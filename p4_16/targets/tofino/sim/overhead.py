@@ -0,0 +1,103 @@
+#
+# Offline estimate of the Horus overheads (Fig. 15/16): resubmissions and
+# state update messages vs load, without running the switch.
+#
+# Each load point replays a workload through the cluster simulation
+# (cluster.py) with the Horus leaf and spine models, and reads the same stat
+# registers as the controllers: stat_count_resub, stat_count_load_signal and
+# stat_count_idle_signal of each leaf vcluster, and stat_count_resub of the
+# spine. The load points run in parallel in a process pool.
+#
+# Usage:
+#
+#  python3 sim/overhead.py [workload] [num_leaves] [workers_per_leaf] [num_tasks] [num_processes]
+#
+#  results = overhead_sweep([32] * 4, 'bimodal', loads=(0.5, 0.9))
+#  print_overhead(results)
+#
+import multiprocessing
+import os
+import sys
+import time
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from sim.headers import MAX_VCLUSTERS
+from sim.cluster import ClusterSimulator, HorusScheduler, DEFAULT_LOADS, HOP_DELAY_US
+from sim.workload import WORKLOADS, rps_for_load, workload_trace
+
+LEAF_OVERHEAD_COUNTERS = ('stat_count_resub', 'stat_count_load_signal', 'stat_count_idle_signal')
+SPINE_OVERHEAD_COUNTERS = ('stat_count_resub',)
+
+def estimate_overhead(load, workers_per_leaf, workload='bimodal', num_tasks=100000, hop_delay=HOP_DELAY_US, seed=1,
+                      strict_p4=False):
+    #
+    # Counters after num_tasks tasks at load: {'leaf': {counter: [value per
+    # leaf vcluster]}, 'spine': {counter: [value for vcluster 0]}, ...}
+    #
+    start_time = time.time()
+    scheduler = HorusScheduler(workers_per_leaf, seed, strict_p4)
+    simulator = ClusterSimulator(scheduler, workers_per_leaf, hop_delay)
+    arrival_times, service_times = workload_trace(workload, rps_for_load(workload, load, sum(workers_per_leaf)), num_tasks, seed=seed)[:2]
+    simulator.run(arrival_times, service_times)
+    leaf_counters = {}
+    for name in LEAF_OVERHEAD_COUNTERS:
+        # Leaf i is vcluster i (cluster_id = leaf id, as on the testbed)
+        leaf_counters[name] = [int(leaf.register(name)[leaf_id & (MAX_VCLUSTERS - 1)]) for leaf_id, leaf in enumerate(scheduler.leaves)]
+    spine_counters = dict((name, [int(scheduler.spine.register(name)[0])]) for name in SPINE_OVERHEAD_COUNTERS)
+    return {
+        'load': load,
+        'workload': workload,
+        'num_tasks': num_tasks,
+        'num_dropped': simulator.num_dropped,
+        'stale_signals': scheduler.num_stale_signals,
+        'leaf': leaf_counters,
+        'spine': spine_counters,
+        'run_time': time.time() - start_time,
+    }
+
+def _estimate_overhead(args):
+    # Pool.imap takes one argument
+    load, kwargs = args
+    return estimate_overhead(load, **kwargs)
+
+def overhead_sweep(workers_per_leaf, workload='bimodal', loads=DEFAULT_LOADS, num_tasks=100000, seed=1,
+                   num_processes=None, strict_p4=False):
+    # One estimate_overhead() per load, in load order. num_processes=1 runs them in this process.
+    kwargs = {'workers_per_leaf': workers_per_leaf, 'workload': workload, 'num_tasks': num_tasks, 'seed': seed, 'strict_p4': strict_p4}
+    jobs = [(load, kwargs) for load in loads]
+    if num_processes == 1:
+        return [_estimate_overhead(job) for job in jobs]
+    pool = multiprocessing.Pool(num_processes)
+    try:
+        return list(pool.imap(_estimate_overhead, jobs))
+    finally:
+        pool.close()
+        pool.join()
+
+def print_overhead(results):
+    # Totals and per task, as in the overhead figures, then the per vcluster values
+    print ("%5s %10s %10s %10s %10s %8s %8s %8s %8s" %("load", "leaf resub", "load sig", "idle sig", "spine rsb",
+           "rsb/task", "msg/task", "srb/task", "time s"))
+    for result in results:
+        leaf = result['leaf']
+        resub, load_signals, idle_signals = [sum(leaf[name]) for name in LEAF_OVERHEAD_COUNTERS]
+        spine_resub = sum(result['spine']['stat_count_resub'])
+        num_tasks = float(result['num_tasks'])
+        print ("%5.2f %10d %10d %10d %10d %8.4f %8.4f %8.4f %8.1f" %(result['load'], resub, load_signals, idle_signals, spine_resub,
+               resub / num_tasks, (load_signals + idle_signals) / num_tasks, spine_resub / num_tasks, result['run_time']))
+    for result in results:
+        print ("load %.2f per leaf vcluster: %s" %(result['load'], ', '.join("%s %s" %(name[len('stat_count_'):], str(result['leaf'][name]))
+               for name in LEAF_OVERHEAD_COUNTERS)))
+
+if __name__ == "__main__":
+    workload = sys.argv[1] if len(sys.argv) > 1 else 'bimodal'
+    num_leaves = int(sys.argv[2]) if len(sys.argv) > 2 else 4
+    workers_per_leaf = int(sys.argv[3]) if len(sys.argv) > 3 else 32
+    num_tasks = int(sys.argv[4]) if len(sys.argv) > 4 else 100000
+    num_processes = int(sys.argv[5]) if len(sys.argv) > 5 else None
+    if workload not in WORKLOADS:
+        print("Usage: %s [%s] [num_leaves] [workers_per_leaf] [num_tasks] [num_processes]" %(sys.argv[0], '|'.join(sorted(WORKLOADS))))
+        sys.exit(1)
+    print ("%s workload, %d leaves x %d workers, %d tasks per point" %(workload, num_leaves, workers_per_leaf, num_tasks))
+    print_overhead(overhead_sweep([workers_per_leaf] * num_leaves, workload, num_tasks=num_tasks, num_processes=num_processes))
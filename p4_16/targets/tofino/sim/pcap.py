@@ -0,0 +1,147 @@
+#
+# Streaming reader of the horus packets (UDP port HORUS_PORT) of a pcap file.
+#
+# The file is mapped (mmap) and viewed as one numpy uint8 array, so nothing is
+# copied but the horus headers. The records are walked in chunks of
+# chunk_size packets, the Ethernet (optionally 802.1Q)/IPv4/UDP checks are
+# done on the whole chunk with numpy, and the 11 byte horus_h headers of the
+# matching packets are gathered into a structured array (HORUS_HDR_DTYPE,
+# network byte order). Memory use only depends on chunk_size, not on the size
+# of the capture.
+#
+# Classic pcap files (microsecond or nanosecond timestamps, either byte
+# order) with Ethernet link type are supported, pcapng is not (convert with
+# editcap -F pcap).
+#
+# Usage:
+#
+#  reader = PcapReader('capture.pcap')
+#  for chunk in reader.horus_chunks():
+#      chunk.timestamps                 # ns since the epoch, int64
+#      chunk.headers['dst_id']          # pkt_type, cluster_id, src_id, dst_id, qlen, seq_num
+#  reader.close()
+#
+import collections
+import mmap
+import struct
+
+import numpy as np
+
+from sim.codec import (encode_header, HORUS_PORT, HORUS_HDR_DTYPE, HORUS_HDR_SIZE, ETHERTYPE_IPV4, ETHERTYPE_VLAN,
+                       IP_PROTOCOLS_UDP, ETHERNET_HDR_SIZE, VLAN_HDR_SIZE, IPV4_HDR_SIZE, UDP_HDR_SIZE)
+
+PCAP_MAGIC_US = 0xa1b2c3d4
+PCAP_MAGIC_NS = 0xa1b23c4d
+PCAP_GLOBAL_HEADER_SIZE = 24
+PCAP_RECORD_HEADER_SIZE = 16
+LINKTYPE_ETHERNET = 1
+
+HorusChunk = collections.namedtuple('HorusChunk', ['timestamps', 'headers', 'frame_indices'])
+
+class PcapReader():
+    def __init__(self, path):
+        self.path = path
+        self.f = open(path, 'rb')
+        self.mm = mmap.mmap(self.f.fileno(), 0, access=mmap.ACCESS_READ)
+        self.data = np.frombuffer(self.mm, dtype=np.uint8)
+        if len(self.mm) < PCAP_GLOBAL_HEADER_SIZE:
+            raise ValueError("%s: not a pcap file" %(path))
+        for endian in ('<', '>'):
+            magic = struct.unpack_from(endian + 'I', self.mm, 0)[0]
+            if magic in (PCAP_MAGIC_US, PCAP_MAGIC_NS):
+                break
+        else:
+            raise ValueError("%s: not a pcap file (pcapng is not supported)" %(path))
+        self.endian = endian
+        self.ts_scale = 1 if magic == PCAP_MAGIC_NS else 1000
+        self.snaplen, self.linktype = struct.unpack_from(endian + 'II', self.mm, 16)
+        if self.linktype != LINKTYPE_ETHERNET:
+            raise ValueError("%s: link type %d, only Ethernet (1) is supported" %(path, self.linktype))
+        self.record_header = struct.Struct(endian + 'IIII')
+        self.num_frames = 0
+
+    def records(self, chunk_size=65536):
+        #
+        # Yields (timestamps ns, frame offsets, captured lengths) of up to
+        # chunk_size frames. A record cut at the end of the file ends the walk.
+        #
+        unpack_from = self.record_header.unpack_from
+        size = len(self.mm)
+        position = PCAP_GLOBAL_HEADER_SIZE
+        while position + PCAP_RECORD_HEADER_SIZE <= size:
+            timestamps = []
+            offsets = []
+            lengths = []
+            while len(offsets) < chunk_size and position + PCAP_RECORD_HEADER_SIZE <= size:
+                ts_sec, ts_frac, caplen, _ = unpack_from(self.mm, position)
+                position += PCAP_RECORD_HEADER_SIZE
+                if position + caplen > size:
+                    position = size
+                    break
+                timestamps.append(ts_sec * 1000000000 + ts_frac * self.ts_scale)
+                offsets.append(position)
+                lengths.append(caplen)
+                position += caplen
+            if offsets:
+                self.num_frames += len(offsets)
+                yield np.array(timestamps, dtype=np.int64), np.array(offsets, dtype=np.int64), np.array(lengths, dtype=np.int64)
+
+    def _u16(self, positions):
+        return (self.data[positions].astype(np.int64) << 8) | self.data[positions + 1]
+
+    def horus_chunks(self, chunk_size=65536, port=HORUS_PORT):
+        #
+        # Yields HorusChunk for the frames of each chunk that are IPv4/UDP to
+        # port with a complete horus header. frame_indices are the frame
+        # numbers in the capture (0-based).
+        #
+        first_frame = 0
+        for timestamps, offsets, lengths in self.records(chunk_size):
+            frame_indices = np.arange(first_frame, first_frame + len(offsets))
+            first_frame += len(offsets)
+            end = offsets + lengths
+            # Each check only looks at the frames that passed the previous ones, so every byte read is captured
+            keep = lengths >= ETHERNET_HDR_SIZE + IPV4_HDR_SIZE + UDP_HDR_SIZE + HORUS_HDR_SIZE
+            offsets, end, timestamps, frame_indices = offsets[keep], end[keep], timestamps[keep], frame_indices[keep]
+            ethertype = self._u16(offsets + 12)
+            vlan = ethertype == ETHERTYPE_VLAN
+            ethertype = np.where(vlan, self._u16(offsets + 16), ethertype)
+            l3 = offsets + ETHERNET_HDR_SIZE + vlan * VLAN_HDR_SIZE
+            keep = (ethertype == ETHERTYPE_IPV4) & ((self.data[l3] >> 4) == 4) & (self.data[l3 + 9] == IP_PROTOCOLS_UDP)
+            l3, end, timestamps, frame_indices = l3[keep], end[keep], timestamps[keep], frame_indices[keep]
+            udp = l3 + (self.data[l3] & 0x0F).astype(np.int64) * 4
+            horus = udp + UDP_HDR_SIZE
+            keep = horus + HORUS_HDR_SIZE <= end
+            udp, horus, timestamps, frame_indices = udp[keep], horus[keep], timestamps[keep], frame_indices[keep]
+            keep = self._u16(udp + 2) == port
+            horus, timestamps, frame_indices = horus[keep], timestamps[keep], frame_indices[keep]
+            raw = self.data[horus[:, None] + np.arange(HORUS_HDR_SIZE)]
+            headers = np.ascontiguousarray(raw).view(HORUS_HDR_DTYPE).ravel()
+            yield HorusChunk(timestamps, headers, frame_indices)
+
+    def close(self):
+        del self.data
+        self.mm.close()
+        self.f.close()
+
+def write_pcap(path, frames, timestamps=None, nanoseconds=True):
+    # Writes Ethernet frames (bytes) to a classic pcap file, e.g. to build test captures
+    with open(path, 'wb') as f:
+        f.write(struct.pack('<IHHiIII', PCAP_MAGIC_NS if nanoseconds else PCAP_MAGIC_US, 2, 4, 0, 0, 65535, LINKTYPE_ETHERNET))
+        scale = 1 if nanoseconds else 1000
+        for i, frame in enumerate(frames):
+            ts = i * 1000 if timestamps is None else int(timestamps[i])
+            f.write(struct.pack('<IIII', ts // 1000000000, (ts % 1000000000) // scale, len(frame), len(frame)))
+            f.write(frame)
+
+def horus_frame(pkt, udp_sport=HORUS_PORT, payload=b''):
+    #
+    # Ethernet/IPv4/UDP frame with the horus header of pkt (a HorusPacket or
+    # any (pkt_type, cluster_id, src_id, dst_id, qlen, seq_num) sequence).
+    # The IP checksum is left at 0.
+    #
+    horus = encode_header(pkt) + payload
+    udp = struct.pack('!HHHH', udp_sport, HORUS_PORT, UDP_HDR_SIZE + len(horus), 0) + horus
+    ip = struct.pack('!BBHHHBBH4s4s', 0x45, 0, IPV4_HDR_SIZE + len(udp), 0, 0, 64, IP_PROTOCOLS_UDP, 0,
+                     b'\x0a\x00\x00\x01', b'\x0a\x00\x00\x02') + udp
+    return b'\x00\x00\x00\x00\x00\x02' + b'\x00\x00\x00\x00\x00\x01' + struct.pack('!H', ETHERTYPE_IPV4) + ip
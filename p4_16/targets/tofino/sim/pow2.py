@@ -0,0 +1,170 @@
+#
+# Vectorized power-of-two choices over arrays of queue lengths, for the
+# RackSched policies (../rs_r, ../rs_h) in offline simulations.
+#
+# pow2_choose() decides a whole batch against one view of the queue lengths.
+# This is exact for RS-R and RS-H: their lists (queue_len_list_1/2 at the
+# leaf, the leaf loads at the spine) only change when a reply or a
+# QUEUE_SIGNAL arrives, never when a task is dispatched.
+#
+# pow2_schedule() is for policies that add a unit to the selected queue on
+# dispatch (e.g. aggregate_queue_len_list, or the Horus deferred lists). With
+# max_stale=None every decision sees all the previous increments of the batch
+# (same result as a loop). With max_stale=k the batch is decided in chunks of
+# k tasks against the view at the start of the chunk, so a compared queue
+# length misses at most (k - 1) * unit of in-batch increments.
+#
+# simulate_racksched() uses them for a whole RS-R/RS-H cluster: tasks are
+# decided in batches against the reported queue lengths at the start of the
+# batch, then the FIFO workers are computed with the Lindley recursion
+# (fifo_completion_times) in numpy. It gives the same latencies as
+# sim/cluster.py within the noise, for 10M tasks in seconds.
+#
+# Usage:
+#
+#  selected = pow2_choose(qlens, rng.integers(0, n, size), rng.integers(0, n, size))
+#  selected = pow2_schedule(qlens, index_1, index_2, unit=1)  # qlens is updated in place
+#  latencies = simulate_racksched([256] * 16, arrival_times, service_times, hierarchical=True)
+#
+import numpy as np
+
+from sim.leaf import QUEUE_LEN_UNIT_SCALE
+
+def pow2_choose(qlens, index_1, index_2):
+    # Index with the smaller queue of each pair, the first one on a tie (selected == random_ds_qlen_1 in the P4 code)
+    qlens = np.asarray(qlens)
+    return np.where(qlens[index_1] <= qlens[index_2], index_1, index_2)
+
+def pow2_schedule(qlens, index_1, index_2, unit=1, max_stale=None):
+    #
+    # Power-of-two with qlens[selected] += unit after each decision. qlens is
+    # updated in place, returns the selected indices.
+    #
+    index_1 = np.asarray(index_1)
+    index_2 = np.asarray(index_2)
+    num_tasks = len(index_1)
+    selected = np.empty(num_tasks, dtype=index_1.dtype)
+    if max_stale is not None:
+        for start in range(0, num_tasks, max_stale):
+            end = min(start + max_stale, num_tasks)
+            selected[start:end] = pow2_choose(qlens, index_1[start:end], index_2[start:end])
+            np.add.at(qlens, selected[start:end], unit)
+        return selected
+    # Exact: decide a window with the current view and keep the decisions up
+    # to the first task that compares a queue selected earlier in the window
+    first_selected = np.full(len(qlens), num_tasks, dtype=np.int64)
+    window = max(16, 2 * int(np.sqrt(len(qlens))))
+    start = 0
+    while start < num_tasks:
+        end = min(start + window, num_tasks)
+        chosen = pow2_choose(qlens, index_1[start:end], index_2[start:end])
+        positions = np.arange(len(chosen))
+        np.minimum.at(first_selected, chosen, positions)
+        stale = (first_selected[index_1[start:end]] < positions) | (first_selected[index_2[start:end]] < positions)
+        first_selected[chosen] = num_tasks
+        num_exact = int(np.argmax(stale)) if stale.any() else len(chosen)
+        selected[start:start + num_exact] = chosen[:num_exact]
+        np.add.at(qlens, chosen[:num_exact], unit)
+        start += num_exact
+        # The window ends at the first conflict, grow or shrink it accordingly
+        window = max(16, 2 * num_exact) if num_exact < len(chosen) else 2 * window
+    return selected
+
+def fifo_completion_times(workers, arrivals, services, busy_until):
+    #
+    # Completion times of tasks at single-core FIFO workers, given in arrival
+    # order: c_i = max(a_i, c_(i-1)) + s_i per worker, with c_0 = busy_until.
+    # Uses c_i = S_i + max(busy_until, max_(j <= i) (a_j - S_(j-1))), S the
+    # cumulative service time of the worker's tasks. busy_until is updated.
+    #
+    order = np.argsort(workers, kind='stable')
+    sorted_workers = workers[order]
+    a = arrivals[order]
+    s = services[order]
+    group_start = np.r_[True, sorted_workers[1:] != sorted_workers[:-1]]
+    group = np.cumsum(group_start) - 1
+    cumulative = np.cumsum(s)
+    S = cumulative - (cumulative - s)[group_start][group]
+    x = a - (S - s)
+    # Segmented running max: shift each worker's values above the previous worker's
+    span = 2 * (np.abs(x).max() + 1) if len(x) else 1.0
+    running_max = np.maximum.accumulate(x + group * span) - group * span
+    completions = S + np.maximum(running_max, busy_until[sorted_workers])
+    group_end = np.r_[group_start[1:], True]
+    busy_until[sorted_workers[group_end]] = completions[group_end]
+    result = np.empty_like(completions)
+    result[order] = completions
+    return result
+
+def _last_reports(owners, report_times, arrival_times, done_times, num_owners, now):
+    #
+    # For each owner (worker or leaf): the number of its tasks outstanding
+    # when its last report before now was sent (tasks arrived by then and not
+    # done), None where there was no report. The tasks are the pending ones.
+    #
+    reported = report_times <= now
+    if not reported.any():
+        return None, None
+    last = np.full(num_owners, -np.inf)
+    np.maximum.at(last, owners[reported], report_times[reported])
+    last_of_task = last[owners]
+    outstanding = (arrival_times <= last_of_task) & (done_times > last_of_task)
+    return np.isfinite(last), np.bincount(owners[outstanding], minlength=num_owners)
+
+def simulate_racksched(workers_per_leaf, arrival_times, service_times, hierarchical, batch_size=1024,
+                       hop_delay=2.0, seed=None):
+    #
+    # Latencies (us) of RS-H (hierarchical) or RS-R for tasks reaching the
+    # spine at arrival_times, same timing as sim/cluster.py. As in the P4
+    # code the leaf compares the queue lengths the workers sent in their last
+    # reply, and the RS-H spine the leaf loads sent in the last QUEUE_SIGNAL
+    # (aggregate_queue_len_list, in queue_len_unit). The views are taken at
+    # the start of each batch, so a decision misses at most the reports of
+    # one batch (batch_size tasks).
+    #
+    rng = np.random.default_rng(seed)
+    workers_per_leaf = np.asarray(workers_per_leaf)
+    num_leaves = len(workers_per_leaf)
+    offsets = np.r_[0, np.cumsum(workers_per_leaf)]
+    num_workers = offsets[-1]
+    worker_leaf = np.repeat(np.arange(num_leaves), workers_per_leaf)
+    units = np.maximum(1, QUEUE_LEN_UNIT_SCALE // workers_per_leaf) # queue_len_unit() of leaf.py
+    busy_until = np.zeros(num_workers)
+    worker_view = np.zeros(num_workers, dtype=np.int64)
+    leaf_view = np.zeros(num_leaves, dtype=np.int64)
+    # Tasks that may still be outstanding at a report: worker, arrival at the leaf, completion
+    pending_workers = np.empty(0, dtype=np.int64)
+    pending_arrivals = np.empty(0)
+    pending_done = np.empty(0)
+    done_times = np.empty(len(arrival_times))
+    for start in range(0, len(arrival_times), batch_size):
+        end = min(start + batch_size, len(arrival_times))
+        size = end - start
+        now = arrival_times[start]
+        # Worker replies reach the leaf one hop after completion, the leaf signals the spine one hop later
+        updated, counts = _last_reports(pending_workers, pending_done, pending_arrivals + hop_delay, pending_done,
+                                        num_workers, now - hop_delay)
+        if updated is not None:
+            worker_view[updated] = counts[updated]
+        if hierarchical:
+            pending_leaves = worker_leaf[pending_workers]
+            updated, counts = _last_reports(pending_leaves, pending_done + hop_delay, pending_arrivals,
+                                            pending_done + hop_delay, num_leaves, now - hop_delay)
+            if updated is not None:
+                leaf_view[updated] = counts[updated] * units[updated]
+            leaves = pow2_choose(leaf_view, rng.integers(0, num_leaves, size), rng.integers(0, num_leaves, size))
+        else:
+            leaves = rng.integers(0, num_leaves, size)
+        sizes = workers_per_leaf[leaves]
+        index_1 = offsets[leaves] + (rng.random(size) * sizes).astype(np.int64)
+        index_2 = offsets[leaves] + (rng.random(size) * sizes).astype(np.int64)
+        workers = pow2_choose(worker_view, index_1, index_2)
+        leaf_arrivals = arrival_times[start:end] + hop_delay
+        done = fifo_completion_times(workers, leaf_arrivals + hop_delay, service_times[start:end], busy_until)
+        done_times[start:end] = done
+        # Completed tasks are not needed once their report reached the spine
+        keep = pending_done + 2 * hop_delay > now
+        pending_workers = np.r_[pending_workers[keep], workers]
+        pending_arrivals = np.r_[pending_arrivals[keep], leaf_arrivals]
+        pending_done = np.r_[pending_done[keep], done]
+    return done_times - arrival_times + 4 * hop_delay
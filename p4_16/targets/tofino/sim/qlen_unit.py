@@ -0,0 +1,144 @@
+#
+# Analysis of the fixed point queue_len_unit (set_queue_len_unit) used for the
+# average queue length of a rack (aggregate_queue_len_list).
+#
+# The leaf adds cluster_unit to the 16-bit aggregate for every task sent to a
+# worker of the rack and subtracts it for every reply (if the value is at
+# least one unit), so the register holds outstanding * unit. The controllers
+# use unit = 32 / #workers (8, 4 and 1 for 4, 8 and 32 workers) and install
+# nothing for other rack sizes. The integer updates do not drift by
+# themselves: the error is in the unit. With a scale C (32 in the
+# controllers) a rack of n workers reports its average queue length
+# multiplied by u * n / C, so when u * n differs between racks the spine
+# compares skewed loads. The aggregate wraps after (2^16 - 1) / (u * n) tasks
+# per worker on average (the overflow horizon).
+#
+# best_units() picks the unit of each rack at a given scale, common_scale()
+# the scale (and units) with the smallest skew between the racks of a
+# placement that still leaves min_headroom tasks per worker before overflow.
+# replay_aggregate() runs the P4 register on a sequence of task/reply events
+# to measure the error and the first overflow over long sequences.
+#
+# Usage:
+#
+#  python3 sim/qlen_unit.py <b|s|r|topology file|n1,n2,...> [num_events] [min_headroom]
+#
+#  scale, units = common_scale([12, 32, 6])
+#  plan = queue_len_unit_plan(units)
+#
+import os
+import sys
+
+import numpy as np
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from switch_ctrl.plan import Plan
+from sim.leaf import QUEUE_LEN_UNIT_SCALE
+from sim.sweep import placement_workers
+
+QUEUE_LEN_BITS = 16 # queue_len_t, aggregate_queue_len_list
+UNIT_BITS = 16 # len_fixed_point_t, cluster_unit
+DEFAULT_MIN_HEADROOM = 256 # Average tasks per worker before the aggregate wraps
+
+def best_units(num_workers, scale=QUEUE_LEN_UNIT_SCALE, unit_bits=UNIT_BITS):
+    # Unit closest to scale / n for each rack size, at least 1
+    num_workers = np.asarray(num_workers, dtype=np.int64)
+    units = np.floor(scale / num_workers.astype(np.float64)).astype(np.int64)
+    units = np.where(np.abs((units + 1) * num_workers - scale) < np.abs(units * num_workers - scale), units + 1, units)
+    return np.clip(units, 1, (1 << unit_bits) - 1)
+
+def unit_skew(num_workers, units, scale=QUEUE_LEN_UNIT_SCALE):
+    # Relative error of the reported average queue length: u * n / scale - 1
+    return np.asarray(units, dtype=np.float64) * np.asarray(num_workers) / scale - 1
+
+def overflow_horizon(num_workers, units, queue_len_bits=QUEUE_LEN_BITS):
+    # Average outstanding tasks per worker the aggregate can hold
+    return ((1 << queue_len_bits) - 1) // (np.asarray(units, dtype=np.int64) * np.asarray(num_workers))
+
+def common_scale(num_workers, queue_len_bits=QUEUE_LEN_BITS, unit_bits=UNIT_BITS, min_headroom=DEFAULT_MIN_HEADROOM):
+    #
+    # (scale, units) minimizing max(u * n) / min(u * n) - 1 over the racks,
+    # with an overflow horizon of at least min_headroom for every rack. On a
+    # tie the units with the largest headroom are used. All the candidate
+    # scales are evaluated at once. The returned scale is max(u * n), the
+    # value of an average queue length of 1 (all the racks when there is no
+    # skew).
+    #
+    num_workers = np.asarray(num_workers, dtype=np.int64)
+    max_scale = max(1, ((1 << queue_len_bits) - 1) // min_headroom)
+    scales = np.arange(1, max_scale + 1)
+    units = np.clip(np.rint(scales[:, None] / num_workers[None, :].astype(np.float64)).astype(np.int64), 1, (1 << unit_bits) - 1)
+    products = units * num_workers[None, :]
+    skews = products.max(axis=1) / products.min(axis=1).astype(np.float64) - 1
+    feasible = ((1 << queue_len_bits) - 1) // products.max(axis=1) >= min_headroom
+    if not feasible.any():
+        raise ValueError("No unit leaves %d tasks per worker before overflow for racks %s" %(min_headroom, list(num_workers)))
+    # Smallest skew, then smallest max(u * n) (largest headroom)
+    order = np.lexsort((products.max(axis=1), np.where(feasible, skews, np.inf)))
+    best = order[0]
+    return int(products[best].max()), [int(unit) for unit in units[best]]
+
+def replay_aggregate(events, unit, queue_len_bits=QUEUE_LEN_BITS):
+    #
+    # Values of aggregate_queue_len_list after each event (+1 task, -1 reply)
+    # as in update_read_aggregate_queue_len, and the index of the first event
+    # that makes it wrap (-1 if none). The values are multiples of unit, so the
+    # guarded decrement is a reflection at 0: V_t = S_t - min(0, min_(s <= t) S_s).
+    # The values are not wrapped.
+    #
+    steps = np.asarray(events, dtype=np.int64) * unit
+    sums = np.cumsum(steps)
+    values = sums - np.minimum(0, np.minimum.accumulate(sums))
+    overflow = np.flatnonzero(values > (1 << queue_len_bits) - 1)
+    return values, int(overflow[0]) if len(overflow) else -1
+
+def aggregate_error(events, num_workers, unit, scale=QUEUE_LEN_UNIT_SCALE, queue_len_bits=QUEUE_LEN_BITS):
+    # (error of the reported average queue length after each event, first overflow), before the overflow
+    values, overflow = replay_aggregate(events, unit, queue_len_bits)
+    outstanding, _ = replay_aggregate(events, 1, 63)
+    end = overflow if overflow >= 0 else len(values)
+    return values[:end] / float(scale) - outstanding[:end] / float(num_workers), overflow
+
+def queue_len_unit_plan(units):
+    # set_queue_len_unit entries for vclusters 0..len(units) - 1 (leaf controllers)
+    plan = Plan()
+    for cluster_id, unit in enumerate(units):
+        plan.add_entry('LeafIngress.set_queue_len_unit',
+            [('hdr.horus.cluster_id', cluster_id)],
+            'LeafIngress.act_set_queue_len_unit',
+            [('cluster_unit', int(unit))])
+    return plan
+
+def controller_units(num_workers):
+    # Units the controllers install today (None: no entry)
+    return [{4: 8, 8: 4, 32: 1}.get(n) for n in num_workers]
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print("Usage: %s <b|s|r|topology file|n1,n2,...> [num_events] [min_headroom]" %(sys.argv[0]))
+        sys.exit(1)
+    if sys.argv[1].replace(',', '').isdigit():
+        num_workers = [int(n) for n in sys.argv[1].split(',')]
+    else:
+        num_workers = placement_workers(sys.argv[1])
+    num_events = int(sys.argv[2]) if len(sys.argv) > 2 else 10000000
+    min_headroom = int(sys.argv[3]) if len(sys.argv) > 3 else DEFAULT_MIN_HEADROOM
+
+    rng = np.random.default_rng(1)
+    scale, units = common_scale(num_workers, min_headroom=min_headroom)
+    fixed_units = best_units(num_workers)
+    print ("Scale %d: %d tasks/reply events per rack (random walk)" %(QUEUE_LEN_UNIT_SCALE, num_events))
+    print ("%4s %7s %5s %5s %8s %8s %10s %10s" %("rack", "workers", "ctrl", "unit", "skew %", "horizon", "max err", "overflow"))
+    for leaf_id, n in enumerate(num_workers):
+        events = np.where(rng.random(num_events) < 0.5, 1, -1)
+        errors, overflow = aggregate_error(events, n, fixed_units[leaf_id])
+        print ("%4d %7d %5s %5d %8.2f %8d %10.2f %10d" %(leaf_id, n, controller_units(num_workers)[leaf_id], fixed_units[leaf_id],
+               100 * unit_skew(n, fixed_units[leaf_id]), overflow_horizon(n, fixed_units[leaf_id]),
+               np.abs(errors).max() if len(errors) else 0, overflow))
+    products = np.asarray(units) * np.asarray(num_workers)
+    print ("Best common scale %d (min headroom %d): units %s, skew between racks %.2f %%, horizon %d" %(scale, min_headroom,
+           list(units), 100 * (products.max() / float(products.min()) - 1), overflow_horizon(num_workers, units).min()))
+    for (table_name, key), (action_name, data) in queue_len_unit_plan(units).entries.items():
+        print ("%s %s -> %s %s" %(table_name, dict(key), action_name, dict(data)))
+    print ("Spine topology \"qlen_unit\": %s" %(units))
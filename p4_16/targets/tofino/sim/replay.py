@@ -0,0 +1,210 @@
+#
+# Replays a capture of the horus traffic of a switch through the behavioral
+# model (leaf.py or spine.py) and compares the model's decisions with what
+# the switch sent.
+#
+# ingress.pcap holds the packets received by the switch, egress.pcap the
+# packets it sent (optional, without it only the model's output is counted),
+# both read with pcap.py. The model is programmed from the placement like the
+# controllers ('b', 's', 'r' or a topology file) and processes the ingress
+# packets in timestamp order. Each packet the model emits is matched with an
+# egress packet of the same (pkt_type, seq_num), in either order, within
+# window packets, and then compared on dst_id, qlen and cluster_id.
+#
+# Decisions that only depend on the switch state (idle list pops, forwarding,
+# signals) are compared exactly. Power-of-two decisions depend on the values
+# of the switch's Random<> externs, which are not in the capture: they are
+# counted separately, and a switch target that the model has no forwarding
+# entry for is reported as invalid. The model state may diverge after such a
+# decision until the next reports (TASK_DONE qlen, QUEUE_SIGNAL) overwrite it.
+#
+# Usage:
+#
+#  python3 sim/replay.py <leaf|spine> <b|s|r|topology file> <ingress.pcap> [egress.pcap] [window]
+#
+#  diff = replay(topology_model('leaf', 's'), 'ingress.pcap', 'egress.pcap')
+#  diff.report()
+#
+import collections
+import heapq
+import os
+import sys
+import time
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from sim.headers import *
+from sim.leaf import LeafModel, leaf_plan
+from sim.spine import SpineModel, spine_plan
+from sim.sweep import PLACEMENTS
+from switch_ctrl.topology_file import load_topology
+from sim.pcap import PcapReader
+
+MAX_EXAMPLES = 10
+
+def topology_model(role, placement, seed=None):
+    # LeafModel or SpineModel with the entries the controllers install for the placement
+    topology = load_topology(PLACEMENTS.get(placement, placement))
+    if role == 'leaf':
+        leaf_topology = topology['leaf']
+        max_workers = topology['max_vcluster_workers']
+        worker_ports = {}
+        for leaf_id, vcluster in enumerate(leaf_topology['vclusters']):
+            for wid, port in vcluster['worker_ports'].items():
+                worker_ports[leaf_id * max_workers + wid] = port
+        spine_ports = leaf_topology['spine_ports']
+        linked_spine = leaf_topology['initial_linked_sq_spine']
+        model = LeafModel(seed, max_workers_per_cluster=max_workers)
+        model.apply_plan(leaf_plan(dict((leaf_id, len(vcluster['workers'])) for leaf_id, vcluster in enumerate(leaf_topology['vclusters'])),
+                                   spine_ids=[linked_spine], max_workers_per_cluster=max_workers,
+                                   worker_port=worker_ports.get, spine_ports=spine_ports))
+        return model
+    if role == 'spine':
+        spine_topology = topology['spine']
+        # Leaves without a vcluster in the file (e.g. one_rack.json) have no workers to schedule on
+        leaf_workers = dict((leaf_id, len(vcluster['workers']))
+                            for leaf_id, vcluster in zip(spine_topology['leaves'], topology['leaf']['vclusters']))
+        # The leaves get their forward entries from spine_plan (the ports do not matter to the model)
+        routes = dict((dst_id, port) for dst_id, port in spine_topology['ports'].items() if dst_id not in leaf_workers)
+        model = SpineModel(seed)
+        model.apply_plan(spine_plan(leaf_workers, spine_topology['vcluster_id'], routes))
+        return model
+    raise ValueError("Unknown role %s, expected leaf or spine" %(role))
+
+def _known_target(model, pkt):
+    # The model has a forwarding entry for the packet's dst_id
+    if isinstance(model, LeafModel):
+        return model._forward_port(pkt.dst_id, pkt.cluster_id) is not None
+    return pkt.dst_id in model.forward
+
+class DecisionDiff():
+    #
+    # Streaming match of the model's packets with the switch's. Pending
+    # packets of either side wait for their match for at most window
+    # packets, so memory is bounded by the window.
+    #
+    def __init__(self, model, window=65536, compare=True):
+        self.model = model
+        self.window = window
+        self.compare = compare # False: no switch capture, only count the model's packets
+        self.expected = collections.defaultdict(collections.deque) # key -> (index, pkt, random) from the model
+        self.observed = collections.defaultdict(collections.deque) # key -> (index, pkt) from the switch
+        self.pending = collections.deque() # (index, is_observed, key), in arrival order
+        self.index = 0
+        self.counts = collections.Counter()
+        self.by_type = collections.defaultdict(collections.Counter)
+        self.examples = collections.defaultdict(list)
+
+    def _count(self, what, pkt_type, example=None):
+        self.counts[what] += 1
+        self.by_type[PKT_TYPE_NAMES.get(pkt_type, pkt_type)][what] += 1
+        if example is not None and len(self.examples[what]) < MAX_EXAMPLES:
+            self.examples[what].append(example)
+
+    def _compare(self, model_pkt, switch_pkt, random):
+        if (model_pkt.dst_id, model_pkt.qlen, model_pkt.cluster_id) == (switch_pkt.dst_id, switch_pkt.qlen, switch_pkt.cluster_id):
+            self._count('random_same' if random else 'matched', model_pkt.pkt_type)
+        elif not random:
+            self._count('mismatched', model_pkt.pkt_type, (model_pkt, switch_pkt))
+        elif _known_target(self.model, switch_pkt):
+            self._count('random_other', model_pkt.pkt_type)
+        else:
+            self._count('random_invalid', model_pkt.pkt_type, (model_pkt, switch_pkt))
+
+    def _evict(self):
+        while self.pending and self.pending[0][0] < self.index - self.window:
+            index, is_observed, key = self.pending.popleft()
+            waiting = self.observed if is_observed else self.expected
+            if waiting[key] and waiting[key][0][0] == index:
+                pkt = waiting[key].popleft()[1]
+                self._count('switch_only' if is_observed else 'model_only', key[0], pkt)
+            if not waiting[key]:
+                del waiting[key]
+
+    def ingress(self, pkt, tstamp):
+        # Runs the model on a packet received by the switch
+        self.index += 1
+        random = False
+        if pkt.pkt_type == PKT_TYPE_NEW_TASK:
+            random = int(self.model.register('idle_count')[pkt.cluster_id & (MAX_VCLUSTERS - 1)]) == 0
+            self.counts['random_decisions' if random else 'idle_decisions'] += 1
+        for _, out_pkt in self.model.process(pkt, tstamp & MASK_32bit):
+            key = (out_pkt.pkt_type, out_pkt.seq_num)
+            out_random = random and out_pkt.pkt_type == PKT_TYPE_NEW_TASK
+            if not self.compare:
+                self._count('emitted', out_pkt.pkt_type)
+            elif self.observed.get(key):
+                self._compare(out_pkt, self.observed[key].popleft()[1], out_random)
+            else:
+                self.expected[key].append((self.index, out_pkt, out_random))
+                self.pending.append((self.index, False, key))
+        self._evict()
+
+    def egress(self, pkt):
+        # A packet sent by the switch
+        self.index += 1
+        key = (pkt.pkt_type, pkt.seq_num)
+        if self.expected.get(key):
+            _, model_pkt, random = self.expected[key].popleft()
+            self._compare(model_pkt, pkt, random)
+        else:
+            self.observed[key].append((self.index, pkt))
+            self.pending.append((self.index, True, key))
+        self._evict()
+
+    def finish(self):
+        self.index += self.window + 1
+        self._evict()
+
+    def report(self):
+        counts = self.counts
+        print ("Decisions: %d idle list, %d power-of-two" %(counts['idle_decisions'], counts['random_decisions']))
+        if not self.compare:
+            print ("Model output: %d packets" %(counts['emitted']))
+        print ("Matched: %d, mismatched: %d, model only: %d, switch only: %d" %(counts['matched'], counts['mismatched'],
+               counts['model_only'], counts['switch_only']))
+        print ("Power-of-two: %d same target, %d other valid target, %d invalid target" %(counts['random_same'],
+               counts['random_other'], counts['random_invalid']))
+        for pkt_type, type_counts in sorted(self.by_type.items(), key=lambda item: str(item[0])):
+            print ("  %-20s %s" %(pkt_type, ', '.join("%s %d" %(what, n) for what, n in sorted(type_counts.items()))))
+        for what in ('mismatched', 'random_invalid', 'model_only', 'switch_only'):
+            for example in self.examples[what]:
+                print ("  %s: %s" %(what, example))
+
+def _packets(path, chunk_size, is_egress):
+    # (timestamp, is_egress, frame index, HorusPacket) of a capture, in file order
+    reader = PcapReader(path)
+    try:
+        for chunk in reader.horus_chunks(chunk_size):
+            fields = [chunk.headers[name].tolist() for name in HorusPacket._fields]
+            for ts, frame_index, values in zip(chunk.timestamps.tolist(), chunk.frame_indices.tolist(), zip(*fields)):
+                yield ts, is_egress, frame_index, HorusPacket(*values)
+    finally:
+        reader.close()
+
+def replay(model, ingress_path, egress_path=None, window=65536, chunk_size=65536):
+    # Runs the capture(s) through the model, returns the DecisionDiff
+    diff = DecisionDiff(model, window, compare=bool(egress_path))
+    streams = [_packets(ingress_path, chunk_size, False)]
+    if egress_path:
+        streams.append(_packets(egress_path, chunk_size, True))
+    # Ingress before egress on equal timestamps
+    for ts, is_egress, _, pkt in heapq.merge(*streams, key=lambda item: (item[0], item[1])):
+        if is_egress:
+            diff.egress(pkt)
+        else:
+            diff.ingress(pkt, ts)
+    diff.finish()
+    return diff
+
+if __name__ == "__main__":
+    if len(sys.argv) < 4 or sys.argv[1] not in ('leaf', 'spine'):
+        print("Usage: %s <leaf|spine> <b|s|r|topology file> <ingress.pcap> [egress.pcap] [window]" %(sys.argv[0]))
+        sys.exit(1)
+    egress_path = sys.argv[4] if len(sys.argv) > 4 else None
+    window = int(sys.argv[5]) if len(sys.argv) > 5 else 65536
+    start_time = time.time()
+    diff = replay(topology_model(sys.argv[1], sys.argv[2]), sys.argv[3], egress_path, window)
+    run_time = time.time() - start_time
+    print ("%d packets in %.1f s (%.0f packets/s)" %(diff.index - window - 1, run_time, (diff.index - window - 1) / max(run_time, 1e-9)))
+    diff.report()
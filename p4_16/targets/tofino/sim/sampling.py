@@ -0,0 +1,217 @@
+#
+# Bias of the random sampling of workers (leaf) and leaves (spine) for any
+# number of valid entries and adjust_random_range actions.
+#
+# The pipelines draw Random<bit<16>> values and shift them to a power of two
+# range (adjust_random_range_ds, adjust_random_range_sq_leafs), so for other
+# counts some indices are out of range or never drawn:
+#  - horus_leaf: the Horus leaf (../horus/leaf.p4). Equal indices are split by
+#    inc_repeated_rand/dec_repeated_rand (index 2 + 1 if it is 0, else - 1),
+#    out-of-range indices point past the rack (invalid).
+#  - rs_h_leaf: the RS-H leaf, no tie-break.
+#  - horus_spine: the Horus spine (../horus/spine.p4). Out-of-range samples
+#    are retried once, then index 1 uses rr_counter and index 2 is index 1 >> 1.
+#  - rs_h_spine: the RS-H spine. An out-of-range index misses get_rand_leaf_id
+#    and keeps random_id = 0, i.e. the leaf of id 0 (index 0 here), unless
+#    the table has wrap entries (index i -> leaf i % n). get_rand_leaf_id_1/2
+#    have 16 entries, so only ranges up to 16 can be wrapped.
+#
+# A sampler gives the joint distribution of (index 1, index 2) over the valid
+# indices and an invalid bucket (index n). exact_joint() computes it from the
+# distribution of the shifted values, monte_carlo_joint() draws num_samples
+# packets at once (rr_counter included) to check it. From the joint:
+#  - first: P(index 1 = i), the selection when the queue lengths are equal
+#    (selected_ds_qlen == random_ds_qlen_1)
+#  - share: (P(index 1 = i) + P(index 2 = i)) / 2, the selection when the
+#    order of the queue lengths is random
+#  - bias: total variation distance between share and uniform (the invalid
+#    mass counts as bias)
+# recommend() evaluates every action of the table (and wrap entries for
+# rs_h_spine) and sampling_plan() returns the entries with the least bias.
+#
+# Usage:
+#
+#  python3 sim/sampling.py [horus_leaf|rs_h_leaf|horus_spine|rs_h_spine] [n1,n2,...] [num_samples]
+#
+#  bits, wrap, bias = recommend('rs_h_spine', 5)
+#  plan = sampling_plan('rs_h_spine', {0: 5})
+#
+import os
+import sys
+
+import numpy as np
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from switch_ctrl.plan import Plan
+
+RANDOM_BITS = 16
+GET_RAND_LEAF_ID_SIZE = 16 # rs_h_spine.p4
+
+# sampler -> (table, key field, action name % bits, available bits)
+SAMPLERS = {
+    'horus_leaf': ('LeafIngress.adjust_random_range_ds', 'horus_md.cluster_num_valid_ds',
+                   'LeafIngress.adjust_random_worker_range_%d', (1, 2, 3, 4, 5, 8)),
+    'rs_h_leaf': ('LeafIngress.adjust_random_range_ds', 'horus_md.cluster_num_valid_ds',
+                  'LeafIngress.adjust_random_worker_range_%d', (1, 2, 3, 4, 5, 8)),
+    'horus_spine': ('SpineIngress.adjust_random_range_sq_leafs', 'horus_md.cluster_num_valid_queue_signals',
+                    'SpineIngress.adjust_random_leaf_index_%d', (1, 2, 3, 4, 5)),
+    'rs_h_spine': ('SpineIngress.adjust_random_range_sq_leafs', 'horus_md.cluster_num_valid_queue_signals',
+                   'SpineIngress.adjust_random_leaf_index_%d', (1, 2, 4, 8)),
+}
+
+# num_valid -> bits installed by the controllers (no entry: no shift)
+INSTALLED_BITS = {
+    'horus_leaf': {2: 1, 4: 2, 8: 3, 16: 4, 32: 5, 256: 8},
+    'rs_h_leaf': {2: 1, 4: 2, 8: 3, 16: 4, 32: 5, 256: 8},
+    'horus_spine': {2: 1, 4: 2, 5: 2, 16: 4, 256: 8},
+    'rs_h_spine': {2: 1, 4: 2, 5: 2, 16: 4, 256: 8},
+}
+
+def _draw_values(num_valid, bits):
+    #
+    # Distribution of one shifted draw: (values, probabilities). Values above
+    # num_valid behave the same in every sampler without wrap entries and are
+    # merged into num_valid + 1, unless wrap needs them.
+    #
+    num_values = 1 << (RANDOM_BITS if bits is None else bits)
+    if num_values <= max(num_valid + 1, 256):
+        return np.arange(num_values), np.full(num_values, 1.0 / num_values)
+    values = np.arange(num_valid + 2)
+    probabilities = np.full(num_valid + 2, 1.0 / num_values)
+    probabilities[-1] = (num_values - num_valid - 1) / float(num_values)
+    return values, probabilities
+
+def _to_index(sampler, values, num_valid, wrap):
+    # Sampled value -> index, num_valid for the invalid bucket
+    if sampler == 'rs_h_spine':
+        if wrap:
+            return values % num_valid
+        return np.where(values < num_valid, values, 0)
+    return np.minimum(values, num_valid)
+
+def _tie_break(values_1, values_2):
+    # inc_repeated_rand / dec_repeated_rand of the Horus leaf
+    return np.where(values_1 == values_2, np.where(values_2 == 0, 1, values_2 - 1), values_2)
+
+def exact_joint(sampler, num_valid, bits, wrap=False):
+    # P(index 1 = a, index 2 = b), (num_valid + 1) x (num_valid + 1)
+    values, probabilities = _draw_values(num_valid, bits)
+    joint = np.zeros((num_valid + 1, num_valid + 1))
+    if sampler == 'horus_spine':
+        # Clamped to num_valid (compare_random_idx), one retry, then rr_counter / index 1 >> 1
+        in_range = np.bincount(values[values < num_valid], probabilities[values < num_valid], minlength=num_valid)
+        out = 1 - in_range.sum()
+        first = in_range * (1 + out) + out * out / num_valid
+        joint[:num_valid, :num_valid] = np.outer(first, in_range * (1 + out))
+        joint[np.arange(num_valid), np.arange(num_valid) >> 1] += first * out * out
+        return joint
+    values_1, values_2 = [grid.ravel() for grid in np.meshgrid(values, values, indexing='ij')]
+    weights = np.outer(probabilities, probabilities).ravel()
+    if sampler == 'horus_leaf':
+        values_2 = _tie_break(values_1, values_2)
+    np.add.at(joint, (_to_index(sampler, values_1, num_valid, wrap), _to_index(sampler, values_2, num_valid, wrap)), weights)
+    return joint
+
+def monte_carlo_joint(sampler, num_valid, bits, num_samples=1000000, wrap=False, seed=None):
+    # Same as exact_joint() from num_samples packets, rr_counter starting at 0
+    rng = np.random.default_rng(seed)
+    shift = 0 if bits is None else RANDOM_BITS - bits
+    draws = rng.integers(0, 1 << RANDOM_BITS, size=(4, num_samples)) >> shift
+    if sampler == 'horus_spine':
+        t1_index_1, t1_index_2, t2_index_1, t2_index_2 = np.minimum(num_valid, draws)
+        both_out = (t1_index_1 == num_valid) & (t2_index_1 == num_valid)
+        rr_counter = (np.cumsum(both_out) - 1) % num_valid # inc_rr_counter returns the value before the increment
+        index_1 = np.where(t1_index_1 < num_valid, t1_index_1, np.where(t2_index_1 < num_valid, t2_index_1, rr_counter))
+        index_2 = np.where(t1_index_2 < num_valid, t1_index_2, np.where(t2_index_2 < num_valid, t2_index_2, index_1 >> 1))
+    else:
+        values_1, values_2 = draws[0], draws[1]
+        if sampler == 'horus_leaf':
+            values_2 = _tie_break(values_1, values_2)
+        index_1 = _to_index(sampler, values_1, num_valid, wrap)
+        index_2 = _to_index(sampler, values_2, num_valid, wrap)
+    counts = np.bincount(index_1 * (num_valid + 1) + index_2, minlength=(num_valid + 1) ** 2)
+    return counts.reshape(num_valid + 1, num_valid + 1) / float(num_samples)
+
+def selection_shares(joint):
+    # (first, share, bias), first and share over the valid indices and the invalid bucket (last)
+    num_valid = joint.shape[0] - 1
+    first = joint.sum(axis=1)
+    share = (first + joint.sum(axis=0)) / 2
+    bias = 0.5 * (np.abs(share[:num_valid] - 1.0 / num_valid).sum() + share[num_valid])
+    return first, share, bias
+
+def _options(sampler, num_valid):
+    # (bits, wrap) evaluated by recommend(), None bits is no entry
+    options = [(bits, False) for bits in SAMPLERS[sampler][3]] + [(None, False)]
+    if sampler == 'rs_h_spine':
+        options += [(bits, True) for bits in SAMPLERS[sampler][3] if num_valid < (1 << bits) <= GET_RAND_LEAF_ID_SIZE]
+    return options
+
+def recommend(sampler, num_valid):
+    #
+    # (bits, wrap, bias) with the least bias. On a tie: no wrap entries, then
+    # the smallest range.
+    #
+    best = None
+    for bits, wrap in _options(sampler, num_valid):
+        bias = selection_shares(exact_joint(sampler, num_valid, bits, wrap))[2]
+        rank = (round(bias, 12), wrap, RANDOM_BITS if bits is None else bits)
+        if best is None or rank < best[0]:
+            best = (rank, (bits, wrap, bias))
+    return best[1]
+
+def sampling_plan(sampler, vcluster_counts, leaf_ids=None):
+    #
+    # Recommended adjust_random_range entries for {cluster_id: num_valid},
+    # and for rs_h_spine the get_rand_leaf_id_1/2 wrap entries of each
+    # vcluster (leaf_ids: {cluster_id: leaf id of each index}, default the
+    # index).
+    #
+    table_name, key_name, action_name, _ = SAMPLERS[sampler]
+    plan = Plan()
+    for cluster_id, num_valid in vcluster_counts.items():
+        bits, wrap, _ = recommend(sampler, num_valid)
+        if bits is not None:
+            plan.add_entry(table_name, [(key_name, num_valid)], action_name %(bits))
+        if wrap:
+            ids = list(range(num_valid)) if leaf_ids is None else leaf_ids[cluster_id]
+            for n in (1, 2):
+                for index in range(num_valid, 1 << bits):
+                    plan.add_entry('SpineIngress.get_rand_leaf_id_%d' %(n),
+                        [('horus_md.random_ds_index_%d' %(n), index), ('hdr.horus.cluster_id', cluster_id)],
+                        'SpineIngress.act_get_rand_leaf_id_%d' %(n),
+                        [('leaf_id', ids[index % num_valid])])
+    return plan
+
+def _bits_name(bits, wrap=False):
+    return ("none" if bits is None else "%d bits" %(bits)) + (" wrap" if wrap else "")
+
+if __name__ == "__main__":
+    samplers = [sys.argv[1]] if len(sys.argv) > 1 else sorted(SAMPLERS)
+    counts = [int(n) for n in sys.argv[2].split(',')] if len(sys.argv) > 2 else list(range(2, 33)) + [256]
+    num_samples = int(sys.argv[3]) if len(sys.argv) > 3 else 1000000
+    for sampler in samplers:
+        if sampler not in SAMPLERS:
+            print("Usage: %s [%s] [n1,n2,...] [num_samples]" %(sys.argv[0], '|'.join(sorted(SAMPLERS))))
+            sys.exit(1)
+    for sampler in samplers:
+        print ("%s (bias: total variation distance to uniform, MC: max |Monte Carlo - exact| share, %d samples)" %(sampler, num_samples))
+        print ("%4s %-10s %8s %8s %8s %-12s %8s %8s" %("n", "installed", "bias", "max", "min", "recommended", "bias", "MC err"))
+        for num_valid in counts:
+            installed = INSTALLED_BITS[sampler].get(num_valid)
+            share = selection_shares(exact_joint(sampler, num_valid, installed))[1]
+            bits, wrap, bias = recommend(sampler, num_valid)
+            recommended_share = selection_shares(exact_joint(sampler, num_valid, bits, wrap))[1]
+            mc_share = selection_shares(monte_carlo_joint(sampler, num_valid, bits, num_samples, wrap, seed=num_valid))[1]
+            print ("%4d %-10s %8.4f %8.4f %8.4f %-12s %8.4f %8.5f" %(num_valid, _bits_name(installed),
+                   selection_shares(exact_joint(sampler, num_valid, installed))[2], share[:num_valid].max() * num_valid,
+                   share[:num_valid].min() * num_valid, _bits_name(bits, wrap), bias, np.abs(mc_share - recommended_share).max()))
+        plan = sampling_plan(sampler, dict(enumerate(counts)))
+        print ("Recommended entries, count i in vcluster i (%d):" %(len(plan.entries)))
+        for (table_name, key), (action_name, data) in plan.entries.items():
+            if not table_name.startswith('SpineIngress.get_rand_leaf_id'):
+                print ("  %s %s -> %s" %(table_name, dict(key), action_name))
+        num_wrap = sum(1 for table_name, _ in plan.entries if table_name.startswith('SpineIngress.get_rand_leaf_id'))
+        if num_wrap:
+            print ("  + %d get_rand_leaf_id_1/2 wrap entries (sampling_plan())" %(num_wrap))
@@ -0,0 +1,408 @@
+#
+# Behavioral model of SpineIngress (../horus/spine.p4).
+#
+# Same approach as leaf.py: numpy registers with the P4 sizes, the apply{}
+# block followed stage by stage for both the first pass and the resubmit
+# pass, and tables filled from a Plan (spine_plan() builds one for any number
+# of leaves). Packets addressed to the spine (dst_id == switch_id) run the
+# scheduler, the rest are only forwarded. Resubmissions (NEW_TASK with a
+# stale decision, and the two-pass IDLE_REMOVE) are run right away and
+# counted in stat_count_resub like on the switch.
+#
+# As in the testbed P4 code (TESTBEDONLY), the spine treats every packet as
+# vcluster 0 and rewrites cluster_id to the leaf id when forwarding, so that
+# each emulated leaf uses its own register range. virtual_leaves=False keeps
+# the cluster_id instead (one vcluster per spine entry, no rewrite).
+#
+# Usage:
+#
+#  spine = SpineModel(seed=1)
+#  spine.apply_plan(spine_plan({0: 8, 1: 8, 2: 8, 3: 8}))
+#  emitted = spine.process(HorusPacket(PKT_TYPE_NEW_TASK, 0, 200, SWITCH_ID, 0, 1))
+#  leaf_pkts = [pkt for pkt in leaf.process(...) if pkt.dst_id == SWITCH_ID]  # signals from a LeafModel
+#
+import numpy as np
+
+from switch_ctrl.plan import Plan
+from sim.headers import *
+from sim.leaf import queue_len_unit
+
+CONTROL_NAME = 'SpineIngress'
+
+SWITCH_ID = 100 # SWITCH_ID in spine.p4
+
+# Widths of the adjust_random_leaf_index_<N> actions in spine.p4
+SPINE_RANGE_BITS = (1, 2, 3, 4, 5)
+
+# name -> (size, dtype) of the SpineIngress registers
+SPINE_REGISTERS = {
+    'idle_list': (MAX_LEAFS, np.uint16),
+    'idle_count': (MAX_VCLUSTERS, np.uint16),
+    'queue_len_list_1': (MAX_TOTAL_LEAFS, np.uint16),
+    'queue_len_list_2': (MAX_TOTAL_LEAFS, np.uint16),
+    'deferred_queue_len_list_1': (MAX_TOTAL_LEAFS, np.uint16),
+    'deferred_queue_len_list_2': (MAX_TOTAL_LEAFS, np.uint16),
+    'idle_list_idx_mapping': (MAX_TOTAL_LEAFS, np.uint16),
+    'rr_counter': (MAX_VCLUSTERS, np.uint16),
+    'stat_count_resub': (MAX_VCLUSTERS, np.uint32),
+    'stat_count_task': (1, np.uint32),
+    'ingress_tstamp': (ARRAY_SIZE, np.uint32),
+}
+
+def spine_plan(leaf_workers, cluster_id=0, routes=None, range_bits=SPINE_RANGE_BITS):
+    #
+    # Plan for one spine vcluster with the leaves in leaf_workers
+    # ({leaf_id: number of workers in the rack}), all idle initially. The
+    # queue len lists are indexed by the leaf index in the vcluster (as the
+    # random_ds_index_N in the P4 code), the idle list by start_idx + index.
+    # routes: extra forward_horus_switch_dst entries {dst_id: port} (e.g.
+    # clients), leaf l uses port l by default. range_bits: widths of the
+    # adjust_random_range_sq_leafs actions available (the P4 code has 1-5).
+    #
+    plan = Plan()
+    start_idx = cluster_id * MAX_LEAFS_PER_CLUSTER
+    leaf_ids = list(leaf_workers.keys())
+    plan.set_register('SpineIngress.idle_count.f1', cluster_id, len(leaf_ids))
+    for i, leaf_id in enumerate(leaf_ids):
+        plan.set_register('SpineIngress.idle_list.f1', start_idx + i, leaf_id)
+        plan.set_register('SpineIngress.idle_list_idx_mapping.f1', start_idx + leaf_id, start_idx + i)
+        unit = queue_len_unit(leaf_workers[leaf_id])
+        plan.add_entry('SpineIngress.get_switch_index',
+            [('hdr.horus.cluster_id', cluster_id), ('hdr.horus.src_id', leaf_id)],
+            'SpineIngress.act_get_switch_index',
+            [('switch_index', i)])
+        for n in (1, 2):
+            plan.add_entry('SpineIngress.set_queue_len_unit_%d' %(n),
+                [('hdr.horus.cluster_id', cluster_id), ('horus_md.random_id_%d' %(n), leaf_id)],
+                'SpineIngress.act_set_queue_len_unit_%d' %(n),
+                [('cluster_unit', unit)])
+            plan.add_entry('SpineIngress.get_rand_leaf_id_%d' %(n),
+                [('horus_md.random_ds_index_%d' %(n), i), ('hdr.horus.cluster_id', cluster_id)],
+                'SpineIngress.act_get_rand_leaf_id_%d' %(n),
+                [('leaf_id', leaf_id)])
+        plan.add_entry('SpineIngress.set_queue_len_unit_resub',
+            [('horus_md.selected_ds_index', i), ('hdr.horus.cluster_id', cluster_id)],
+            'SpineIngress.act_set_queue_len_unit_resub',
+            [('cluster_unit', unit)])
+        plan.add_entry('SpineIngress.forward_horus_switch_dst',
+            [('hdr.horus.dst_id', leaf_id)],
+            'SpineIngress.act_forward_horus',
+            [('port', leaf_id)])
+    for dst_id, port in (routes or {}).items():
+        plan.add_entry('SpineIngress.forward_horus_switch_dst',
+            [('hdr.horus.dst_id', dst_id)],
+            'SpineIngress.act_forward_horus',
+            [('port', port)])
+    plan.add_entry('SpineIngress.get_cluster_num_valid_leafs',
+        [('hdr.horus.cluster_id', cluster_id)],
+        'SpineIngress.act_get_cluster_num_valid_leafs',
+        [('num_leafs', len(leaf_ids))])
+    # Shift to the smallest power of two range that covers num_leafs, out-of-range samples are retried
+    for num_leafs in range(2, (1 << max(range_bits)) + 1):
+        bits = (num_leafs - 1).bit_length()
+        if bits in range_bits:
+            plan.add_entry('SpineIngress.adjust_random_range_sq_leafs',
+                [('horus_md.cluster_num_valid_queue_signals', num_leafs)],
+                'SpineIngress.adjust_random_leaf_index_%d' %(bits))
+    return plan
+
+class SpineModel():
+    def __init__(self, seed=None, switch_id=SWITCH_ID, virtual_leaves=True):
+        self.switch_id = switch_id
+        self.virtual_leaves = virtual_leaves
+        self.random = Random16(seed)
+        self.registers = {}
+        for name, (size, dtype) in SPINE_REGISTERS.items():
+            self.registers[name] = np.zeros(size, dtype=dtype)
+        # Tables
+        self.num_valid_leafs = {} # cluster_id -> num_leafs
+        self.random_shift = {} # cluster_num_valid_queue_signals -> shift
+        self.switch_index = {} # (cluster_id, src_id) -> switch_index
+        self.rand_leaf_ids = ({}, {}) # (random_ds_index_N, cluster_id) -> leaf_id, for N = 1, 2
+        self.queue_len_units = ({}, {}) # (cluster_id, random_id_N) -> cluster_unit, for N = 1, 2
+        self.queue_len_units_resub = {} # (selected_ds_index, cluster_id) -> cluster_unit
+        self.forward = {} # dst_id -> port
+        self.num_packets = 0
+        self.num_resubmissions = 0
+        self.num_task_resubmissions = 0
+        self.num_dropped = 0
+
+    def register(self, name):
+        # Register array by its P4 name (with or without the control/field name)
+        if name.startswith(CONTROL_NAME + '.'):
+            name = name[len(CONTROL_NAME) + 1:]
+        if name.endswith('.f1'):
+            name = name[:-3]
+        return self.registers[name]
+
+    def apply_plan(self, plan):
+        for (table_name, key), (action_name, data) in plan.entries.items():
+            self.add_entry(table_name, key, action_name, data)
+        for (register_name, index), register_value in plan.registers.items():
+            register = self.register(register_name)
+            register[index & (len(register) - 1)] = register_value
+
+    def add_entry(self, table_name, key, action_name, data=()):
+        table_name = table_name.rsplit('.', 1)[-1]
+        key = field_values(key)
+        data = field_values(data)
+        if table_name == 'get_cluster_num_valid_leafs':
+            self.num_valid_leafs[key['cluster_id']] = data['num_leafs']
+        elif table_name == 'adjust_random_range_sq_leafs':
+            self.random_shift[key['cluster_num_valid_queue_signals']] = random_range_shift(action_name)
+        elif table_name == 'get_switch_index':
+            self.switch_index[(key['cluster_id'], key['src_id'])] = data['switch_index']
+        elif table_name in ('get_rand_leaf_id_1', 'get_rand_leaf_id_2'):
+            n = int(table_name[-1])
+            self.rand_leaf_ids[n - 1][(key['random_ds_index_%d' %(n)], key['cluster_id'])] = data['leaf_id']
+        elif table_name in ('set_queue_len_unit_1', 'set_queue_len_unit_2'):
+            n = int(table_name[-1])
+            self.queue_len_units[n - 1][(key['cluster_id'], key['random_id_%d' %(n)])] = data['cluster_unit']
+        elif table_name == 'set_queue_len_unit_resub':
+            self.queue_len_units_resub[(key['selected_ds_index'], key['cluster_id'])] = data['cluster_unit']
+        elif table_name.startswith('forward_'):
+            self.forward[key['dst_id']] = data['port']
+        else:
+            raise ValueError("SpineModel: unknown table %s" %(table_name))
+
+    def process(self, pkt, tstamp=0):
+        # One packet through SpineIngress, including its resubmit pass
+        self.num_packets += 1
+        emitted, resub_hdr = self._ingress(pkt, None, tstamp)
+        if resub_hdr is not None:
+            self.num_resubmissions += 1
+            if pkt.pkt_type == PKT_TYPE_NEW_TASK:
+                self.num_task_resubmissions += 1
+            emitted, _ = self._ingress(pkt, resub_hdr, tstamp)
+        return emitted
+
+    def _ingress(self, pkt, resub_hdr, tstamp):
+        # One pass. Returns (emitted, task_resub_hdr if the packet is resubmitted else None)
+        pkt_type, cluster_id, src_id, dst_id, qlen, seq_num = pkt
+        if dst_id != self.switch_id:
+            return self._forward(pkt._replace(src_id=self.switch_id)), None
+        resubmitted = resub_hdr is not None
+        if resubmitted:
+            ds_index_1, ds_index_2, resub_qlen_1, resub_qlen_2 = resub_hdr
+        else:
+            ds_index_1 = ds_index_2 = resub_qlen_1 = resub_qlen_2 = 0
+        is_new_task = pkt_type == PKT_TYPE_NEW_TASK
+        is_idle_remove = pkt_type == PKT_TYPE_IDLE_REMOVE
+        regs = self.registers
+        leaf_mask = MAX_TOTAL_LEAFS - 1
+        drop = False
+        resubmit = False
+        if self.virtual_leaves:
+            cluster_id = 0
+        cid = cluster_id & (MAX_VCLUSTERS - 1)
+        random = self.random
+        t1_random_ds_index_1 = random.get()
+        t1_random_ds_index_2 = random.get()
+
+        # Stage 1
+        start_idx = (cluster_id * MAX_LEAFS_PER_CLUSTER) & MASK_16bit
+        t2_random_ds_index_1 = random.get()
+        t2_random_ds_index_2 = random.get()
+        num_valid = self.num_valid_leafs.get(cluster_id, 0)
+        if resubmitted:
+            min_correct_qlen = min(resub_qlen_1, resub_qlen_2)
+            stat = regs['stat_count_resub']
+            stat[cid] = (int(stat[cid]) + 1) & MASK_32bit
+        idle_count = regs['idle_count']
+        child_switch_index = 0 # Only set for QUEUE_SIGNAL, the other signals write their qlen at index 0 like the P4 code
+        cluster_idle_count = int(idle_count[cid])
+        if pkt_type == PKT_TYPE_IDLE_SIGNAL or (is_idle_remove and ds_index_1 == INVALID_VALUE_16bit):
+            idle_count[cid] = (cluster_idle_count + 1) & MASK_16bit
+        elif is_idle_remove and not resubmitted:
+            if cluster_idle_count > 0:
+                idle_count[cid] = cluster_idle_count - 1
+        elif pkt_type == PKT_TYPE_QUEUE_SIGNAL:
+            child_switch_index = self.switch_index.get((cluster_id, src_id), 0)
+
+        # Stage 2
+        selected_ds_index = 0
+        if resubmitted:
+            if is_new_task:
+                if min_correct_qlen == resub_qlen_1:
+                    selected_ds_index = ds_index_1
+                else:
+                    selected_ds_index = ds_index_2
+        else:
+            shift = self.random_shift.get(num_valid, 0)
+            t1_random_ds_index_1 >>= shift
+            t1_random_ds_index_2 >>= shift
+            t2_random_ds_index_1 >>= shift
+            t2_random_ds_index_2 >>= shift
+            if is_new_task:
+                stat = regs['stat_count_task']
+                stat[0] = (int(stat[0]) + 1) & MASK_32bit
+        idle_ds_index = (start_idx + cluster_idle_count) & MASK_16bit
+        cluster_absolute_leaf_index = (start_idx + src_id) & MASK_16bit
+
+        # Stage 3
+        idx_mapping = regs['idle_list_idx_mapping']
+        if resubmitted:
+            if is_idle_remove and ds_index_1 != INVALID_VALUE_16bit:
+                idx_mapping[ds_index_2 & leaf_mask] = ds_index_1
+        else:
+            t1_random_ds_index_1 = min(num_valid, t1_random_ds_index_1)
+            t1_random_ds_index_2 = min(num_valid, t1_random_ds_index_2)
+            t2_random_ds_index_1 = min(num_valid, t2_random_ds_index_1)
+            t2_random_ds_index_2 = min(num_valid, t2_random_ds_index_2)
+            if is_new_task:
+                idle_ds_index = (idle_ds_index - 1) & MASK_16bit
+            elif pkt_type == PKT_TYPE_IDLE_SIGNAL:
+                idx_mapping[cluster_absolute_leaf_index & leaf_mask] = idle_ds_index
+            elif is_idle_remove:
+                ds_index_1 = int(idx_mapping[cluster_absolute_leaf_index & leaf_mask])
+                idle_ds_index = (idle_ds_index - 1) & MASK_16bit
+
+        # Stage 4
+        idle_list = regs['idle_list']
+        random_ds_index_1 = random_ds_index_2 = 0
+        idle_ds_id = 0
+        selected_ds_qlen_unit = 0
+        if resubmitted:
+            if is_idle_remove:
+                if ds_index_1 != INVALID_VALUE_16bit:
+                    idle_list[ds_index_1 & (MAX_LEAFS - 1)] = ds_index_2
+                drop = True
+            elif is_new_task:
+                selected_ds_qlen_unit = self.queue_len_units_resub.get((selected_ds_index, cluster_id), 0)
+                random_ds_index_1 = selected_ds_index
+        else:
+            if is_new_task:
+                idle_ds_id = int(idle_list[idle_ds_index & (MAX_LEAFS - 1)])
+                if t1_random_ds_index_1 == num_valid:
+                    if t2_random_ds_index_1 == num_valid:
+                        # Both tries out-of-range, round robin sample
+                        rr_counter = regs['rr_counter']
+                        random_ds_index_1 = int(rr_counter[cid])
+                        if random_ds_index_1 >= ((num_valid - 1) & MASK_16bit):
+                            rr_counter[cid] = 0
+                        else:
+                            rr_counter[cid] = random_ds_index_1 + 1
+                    else:
+                        random_ds_index_1 = t2_random_ds_index_1
+                else:
+                    random_ds_index_1 = t1_random_ds_index_1
+            elif is_idle_remove:
+                idle_ds_id = int(idle_list[idle_ds_index & (MAX_LEAFS - 1)])
+                idle_list[idle_ds_index & (MAX_LEAFS - 1)] = INVALID_VALUE_16bit
+            elif pkt_type == PKT_TYPE_IDLE_SIGNAL:
+                idle_list[idle_ds_index & (MAX_LEAFS - 1)] = src_id
+                drop = True
+
+        # Stage 5
+        if is_new_task:
+            if cluster_idle_count == 0:
+                if t1_random_ds_index_2 == num_valid:
+                    if t2_random_ds_index_2 == num_valid:
+                        random_ds_index_2 = random_ds_index_1 >> 1
+                    else:
+                        random_ds_index_2 = t2_random_ds_index_2
+                else:
+                    random_ds_index_2 = t1_random_ds_index_2
+        elif is_idle_remove:
+            ds_index_2 = idle_ds_id
+
+        # Stage 6
+        random_id_1 = self.rand_leaf_ids[0].get((random_ds_index_1, cluster_id), 0)
+        random_id_2 = self.rand_leaf_ids[1].get((random_ds_index_2, cluster_id), 0)
+        queue_len_list_1 = regs['queue_len_list_1']
+        queue_len_list_2 = regs['queue_len_list_2']
+        random_ds_qlen_1 = random_ds_qlen_2 = 0
+        if resubmitted:
+            if is_new_task:
+                index = selected_ds_index & leaf_mask
+                queue_len_list_1[index] = (int(queue_len_list_1[index]) + selected_ds_qlen_unit) & MASK_16bit
+                queue_len_list_2[index] = (int(queue_len_list_2[index]) + selected_ds_qlen_unit) & MASK_16bit
+        elif is_new_task:
+            if cluster_idle_count == 0:
+                random_ds_qlen_1 = int(queue_len_list_1[random_ds_index_1 & leaf_mask])
+                random_ds_qlen_2 = int(queue_len_list_2[random_ds_index_2 & leaf_mask])
+        else:
+            queue_len_list_1[child_switch_index & leaf_mask] = qlen
+            queue_len_list_2[child_switch_index & leaf_mask] = qlen
+            if is_idle_remove:
+                if ds_index_2 == INVALID_VALUE_16bit:
+                    ds_index_1 = INVALID_VALUE_16bit
+                resubmit = True
+
+        # Stage 7
+        selected_ds_qlen = min(random_ds_qlen_1, random_ds_qlen_2)
+        not_selected_ds_qlen = max(random_ds_qlen_1, random_ds_qlen_2)
+        out_dst_id, out_qlen = dst_id, qlen
+        qlen_unit_1 = qlen_unit_2 = 0
+        if resubmitted:
+            if is_new_task:
+                out_dst_id = random_id_1
+        elif is_new_task:
+            regs['ingress_tstamp'][seq_num & (ARRAY_SIZE - 1)] = tstamp & MASK_32bit
+            if cluster_idle_count == 0:
+                qlen_unit_1 = self.queue_len_units[0].get((cluster_id, random_id_1), 0)
+                qlen_unit_2 = self.queue_len_units[1].get((cluster_id, random_id_2), 0)
+
+        # Stage 8
+        queue_len_diff = 0
+        not_selected_ds_qlen_unit = 0
+        if not resubmitted and is_new_task:
+            if random_ds_index_1 == random_ds_index_2 or cluster_idle_count > 0:
+                queue_len_diff = INVALID_VALUE_16bit
+            if cluster_idle_count == 0 and num_valid > 0:
+                if random_ds_index_1 != random_ds_index_2:
+                    queue_len_diff = (not_selected_ds_qlen - selected_ds_qlen) & MASK_16bit
+                if selected_ds_qlen == random_ds_qlen_1:
+                    out_dst_id = random_id_1
+                    selected_ds_index = random_ds_index_1
+                    ds_index_2 = random_ds_index_2
+                    selected_ds_qlen_unit, not_selected_ds_qlen_unit = qlen_unit_1, qlen_unit_2
+                else:
+                    out_dst_id = random_id_2
+                    selected_ds_index = random_ds_index_2
+                    ds_index_2 = random_ds_index_1
+                    selected_ds_qlen_unit, not_selected_ds_qlen_unit = qlen_unit_2, qlen_unit_1
+            else:
+                # Idle selection, qlen=1 tells the leaf that the spine sees it as idle
+                selected_ds_qlen_unit = qlen_unit_1
+                out_dst_id = idle_ds_id
+                out_qlen = 1
+
+        # Stages 9 and 10
+        deferred_1 = regs['deferred_queue_len_list_1']
+        deferred_2 = regs['deferred_queue_len_list_2']
+        if not resubmitted:
+            if is_new_task and cluster_idle_count == 0:
+                index = selected_ds_index & leaf_mask
+                deferred_qlen_1 = int(deferred_1[index])
+                if deferred_qlen_1 <= queue_len_diff:
+                    deferred_1[index] = (deferred_qlen_1 + selected_ds_qlen_unit) & MASK_16bit
+                    deferred_qlen_1 = 0
+                ds_index_1 = selected_ds_index
+                selected_ds_qlen = (selected_ds_qlen + selected_ds_qlen_unit) & MASK_16bit
+                not_selected_ds_qlen = (not_selected_ds_qlen + not_selected_ds_qlen_unit) & MASK_16bit
+                resub_qlen_1 = (deferred_qlen_1 + selected_ds_qlen) & MASK_16bit
+                if deferred_qlen_1 == 0:
+                    deferred_2[index] = (int(deferred_2[index]) + selected_ds_qlen_unit) & MASK_16bit
+                else:
+                    resubmit = True
+                    resub_qlen_2 = (int(deferred_2[ds_index_2 & leaf_mask]) + not_selected_ds_qlen) & MASK_16bit
+            elif not is_new_task:
+                deferred_1[child_switch_index & leaf_mask] = 0
+                deferred_2[child_switch_index & leaf_mask] = 0
+                if pkt_type == PKT_TYPE_QUEUE_SIGNAL:
+                    drop = True
+
+        if resubmit:
+            return [], (ds_index_1, ds_index_2, resub_qlen_1, resub_qlen_2)
+        if drop:
+            self.num_dropped += 1
+            return [], None
+        return self._forward(HorusPacket(pkt_type, cluster_id, self.switch_id, out_dst_id, out_qlen, seq_num)), None
+
+    def _forward(self, pkt):
+        port = self.forward.get(pkt.dst_id)
+        if port is not None and self.virtual_leaves:
+            # act_forward_horus: cluster_id = dst_id (TESTBEDONLY)
+            pkt = pkt._replace(cluster_id=pkt.dst_id)
+        return [(port, pkt)]
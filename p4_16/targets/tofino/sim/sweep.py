@@ -0,0 +1,156 @@
+#
+# Parallel parameter sweeps of the cluster simulation (cluster.py), instead of
+# one switchd/controller restart per data point on the testbed.
+#
+# A sweep is the grid of load x placement x workers per rack x workload x
+# scheduler (x seed). The placement is 'b' (balanced), 's' (skewed), 'r' (one
+# rack) like the controllers, or a topology file (see ../topologies/). The
+# rack sizes of the topology are scaled so that its largest possible rack
+# (max_vcluster_workers) has workers_per_rack workers, e.g. 's' with 32 is
+# the testbed placement (4, 4, 8, 32). Horus needs every rack size to be a
+# power of two up to 32, or 256.
+#
+# The cells run in a process pool. Every cell gets its own seed derived from
+# the sweep seed and the cell, the scheduler excluded, so all the schedulers
+# of a data point see the same tasks. Each result is appended to a ResultStore
+# (JSON lines) as soon as it is computed, and the cells already in the store
+# are skipped: an interrupted sweep continues where it stopped and a grid can
+# be extended without recomputing it.
+#
+# Usage:
+#
+#  python3 sim/sweep.py results.jsonl [workload,...] [placement,...] [workers_per_rack,...] [num_tasks] [num_processes]
+#
+#  cells = sweep_grid(loads=(0.5, 0.9), placements=('b', 's'), workers_per_rack=(32,), workloads=('bimodal',))
+#  run_sweep_cells(cells, ResultStore('results.jsonl'), num_tasks=100000)
+#
+import collections
+import itertools
+import json
+import multiprocessing
+import os
+import sys
+import zlib
+
+import numpy as np
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from sim.cluster import run_experiment, DEFAULT_LOADS, SCHEDULERS
+from sim.workload import WORKLOADS
+from switch_ctrl.topology_file import TOPOLOGY_FILES as PLACEMENTS, load_topology
+
+SweepCell = collections.namedtuple('SweepCell', ['load', 'placement', 'workers_per_rack', 'workload', 'scheduler', 'seed'])
+
+def placement_workers(placement, workers_per_rack=None):
+    # Workers of each rack for a placement ('b', 's', 'r' or a topology file), as in the file by default
+    topology = load_topology(PLACEMENTS.get(placement, placement))
+    sizes = [len(vcluster['workers']) for vcluster in topology['leaf']['vclusters']]
+    if workers_per_rack is None:
+        return sizes
+    scale = float(workers_per_rack) / topology['max_vcluster_workers']
+    return [max(1, int(round(size * scale))) for size in sizes]
+
+def sweep_grid(loads=DEFAULT_LOADS, placements=('b',), workers_per_rack=(32,), workloads=('bimodal',),
+               schedulers=SCHEDULERS, seeds=(1,)):
+    # All the cells, ordered so that the schedulers of a data point are next to each other
+    return [SweepCell(load, placement, workers, workload, scheduler, seed)
+            for seed, workload, placement, workers, load, scheduler
+            in itertools.product(seeds, workloads, placements, workers_per_rack, loads, schedulers)]
+
+def cell_key(cell, num_tasks):
+    # Key of a result in the store
+    return json.dumps(dict(cell._asdict(), num_tasks=num_tasks), sort_keys=True)
+
+def cell_seed(cell):
+    # Seed of the cell's run: same tasks for every scheduler, independent streams otherwise
+    data_point = "%r %s %d %s" %(cell.load, cell.placement, cell.workers_per_rack, cell.workload)
+    return int(np.random.SeedSequence([cell.seed, zlib.crc32(data_point.encode('utf-8'))]).generate_state(1)[0])
+
+class ResultStore():
+    #
+    # Append-only JSON lines file, one {'key', 'cell', 'result'} per computed
+    # cell, indexed by key in memory. A line cut by a crash is ignored.
+    #
+    def __init__(self, path):
+        self.path = path
+        self.results = collections.OrderedDict()
+        if os.path.exists(path):
+            with open(path) as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        continue
+                    self.results[record['key']] = record['result']
+        self.f = open(path, 'a')
+
+    def __contains__(self, key):
+        return key in self.results
+
+    def __len__(self):
+        return len(self.results)
+
+    def get(self, key):
+        return self.results.get(key)
+
+    def put(self, key, cell, result):
+        self.f.write(json.dumps({'key': key, 'cell': cell._asdict(), 'result': result}, sort_keys=True) + '\n')
+        self.f.flush()
+        os.fsync(self.f.fileno())
+        self.results[key] = result
+
+    def close(self):
+        self.f.close()
+
+def _run_cell(args):
+    cell, num_tasks, fast = args
+    result = run_experiment(cell.scheduler, cell.load, placement_workers(cell.placement, cell.workers_per_rack),
+                            cell.workload, num_tasks, seed=cell_seed(cell), fast=fast)
+    return cell, result
+
+def run_sweep_cells(cells, store, num_tasks=200000, num_processes=None, fast=False):
+    #
+    # Runs the cells missing from store, largest first so that the pool is
+    # not left waiting on one long run. Returns the results of all the cells,
+    # in the order of cells.
+    #
+    todo = [cell for cell in cells if cell_key(cell, num_tasks) not in store]
+    todo.sort(key=lambda cell: -cell.load * sum(placement_workers(cell.placement, cell.workers_per_rack)))
+    print ("%d cells, %d in %s, %d to run" %(len(cells), len(cells) - len(todo), store.path, len(todo)))
+    if todo:
+        jobs = [(cell, num_tasks, fast) for cell in todo]
+        pool = multiprocessing.Pool(num_processes) if num_processes != 1 else None
+        try:
+            finished = pool.imap_unordered(_run_cell, jobs) if pool else (_run_cell(job) for job in jobs)
+            for i, (cell, result) in enumerate(finished):
+                store.put(cell_key(cell, num_tasks), cell, result)
+                print ("[%d/%d] %-6s %5.2f %s x%d %s: p99 %.1f us (%.1f s)" %(i + 1, len(todo), cell.scheduler, cell.load,
+                       cell.placement, cell.workers_per_rack, cell.workload, result['p99'], result['run_time']))
+        finally:
+            if pool:
+                pool.close()
+                pool.join()
+    return [store.get(cell_key(cell, num_tasks)) for cell in cells]
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print("Usage: %s <results.jsonl> [workload,...] [placement,...] [workers_per_rack,...] [num_tasks] [num_processes]" %(sys.argv[0]))
+        sys.exit(1)
+    workloads = sys.argv[2].split(',') if len(sys.argv) > 2 else ['bimodal']
+    placements = sys.argv[3].split(',') if len(sys.argv) > 3 else ['b', 's']
+    workers_per_rack = [int(w) for w in sys.argv[4].split(',')] if len(sys.argv) > 4 else [32]
+    num_tasks = int(sys.argv[5]) if len(sys.argv) > 5 else 200000
+    num_processes = int(sys.argv[6]) if len(sys.argv) > 6 else None
+    for workload in workloads:
+        if workload not in WORKLOADS:
+            print("Unknown workload %s, use one of %s" %(workload, '|'.join(sorted(WORKLOADS))))
+            sys.exit(1)
+    store = ResultStore(sys.argv[1])
+    cells = sweep_grid(placements=placements, workers_per_rack=workers_per_rack, workloads=workloads)
+    results = run_sweep_cells(cells, store, num_tasks, num_processes)
+    store.close()
+    print ("%-6s %5s %4s %5s %-10s %10s %10s %10s" %("sched", "load", "plc", "w/r", "workload", "p50 us", "p99 us", "p99.9 us"))
+    for cell, result in zip(cells, results):
+        print ("%-6s %5.2f %4s %5d %-10s %10.1f %10.1f %10.1f" %(cell.scheduler, cell.load, cell.placement, cell.workers_per_rack,
+               cell.workload, result['p50'], result['p99'], result['p99.9']))
@@ -0,0 +1,112 @@
+#
+# Streaming generator of task arrivals and service times for the workloads of
+# the experiments (-d option of the DPDK client), for the simulators, packet
+# senders and pcap writers.
+#
+# A workload is a mix of request types, each with a service time that is
+# either fixed or exponential. The service times are the nominal ones of the
+# paper experiments (us):
+#  - db_bimodal: RocksDB, 90% GET (50) and 10% SCAN (500)
+#  - db_port_bimodal: same mix, the request type also selects the UDP port
+#    (PORT_BASE + type) so that typed requests can be sent to different ports
+#  - tpc: TPC-C transactions on Silo (Payment, OrderStatus, NewOrder,
+#    Delivery, StockLevel)
+#  - exp, bimodal, trimodal: the synthetic workloads
+#
+# workload_chunks() yields WorkloadChunk tuples of numpy arrays, one chunk at
+# a time, so a trace is never materialized. Arrivals are Poisson or at a
+# constant rate for a target RPS, times are in us from start_time. Arrival
+# times, request types and service times use separate streams of the seed,
+# so the trace does not depend on chunk_size.
+#
+# Usage:
+#
+#  for chunk in workload_chunks('db_bimodal', rps=500000, duration=10e6, seed=1):
+#      send(chunk.arrival_times, chunk.service_times, chunk.ports)
+#  arrival_times, service_times = workload_trace('tpc', rps=1e6, num_tasks=100000)[:2]
+#
+import collections
+
+import numpy as np
+
+PORT_BASE = 1234
+
+# name -> [(request type, probability, service time us, 'fixed' or 'exp')]
+WORKLOADS = {
+    'exp': [('task', 1.0, 50.0, 'exp')],
+    'bimodal': [('short', 0.9, 50.0, 'fixed'), ('long', 0.1, 500.0, 'fixed')],
+    'trimodal': [('short', 1.0 / 3, 50.0, 'fixed'), ('medium', 1.0 / 3, 500.0, 'fixed'), ('long', 1.0 / 3, 5000.0, 'fixed')],
+    'db_bimodal': [('get', 0.9, 50.0, 'fixed'), ('scan', 0.1, 500.0, 'fixed')],
+    'db_port_bimodal': [('get', 0.9, 50.0, 'fixed'), ('scan', 0.1, 500.0, 'fixed')],
+    'tpc': [('payment', 0.44, 5.7, 'fixed'), ('order_status', 0.04, 6.0, 'fixed'), ('new_order', 0.44, 20.0, 'fixed'),
+            ('delivery', 0.04, 88.0, 'fixed'), ('stock_level', 0.04, 100.0, 'fixed')],
+}
+
+ARRIVAL_PROCESSES = ('poisson', 'constant')
+
+WorkloadChunk = collections.namedtuple('WorkloadChunk', ['arrival_times', 'service_times', 'task_types', 'ports'])
+
+def workload_modes(name):
+    if name not in WORKLOADS:
+        raise ValueError("Unknown workload %s, expected one of %s" %(name, ', '.join(sorted(WORKLOADS))))
+    return WORKLOADS[name]
+
+def mean_service_time(name):
+    return sum(probability * service_time for _, probability, service_time, _ in workload_modes(name))
+
+def rps_for_load(name, load, num_workers):
+    # RPS that keeps num_workers busy a fraction load of the time
+    return load * num_workers * 1e6 / mean_service_time(name)
+
+def workload_chunks(name, rps, num_tasks=None, duration=None, arrivals='poisson', chunk_size=65536, seed=None,
+                    start_time=0.0):
+    #
+    # Yields WorkloadChunk until num_tasks tasks or duration (us) is reached
+    # (forever if neither is given). ports is None except for
+    # db_port_bimodal.
+    #
+    modes = workload_modes(name)
+    if arrivals not in ARRIVAL_PROCESSES:
+        raise ValueError("Unknown arrival process %s, expected one of %s" %(arrivals, ', '.join(ARRIVAL_PROCESSES)))
+    interval = 1e6 / rps
+    probabilities = np.array([mode[1] for mode in modes])
+    probabilities /= probabilities.sum()
+    service_times = np.array([mode[2] for mode in modes])
+    exponential = np.array([mode[3] == 'exp' for mode in modes])
+    arrival_rng, type_rng, service_rng = [np.random.default_rng(s) for s in np.random.SeedSequence(seed).spawn(3)]
+    last_time = start_time
+    generated = 0
+    while num_tasks is None or generated < num_tasks:
+        size = chunk_size if num_tasks is None else min(chunk_size, num_tasks - generated)
+        if arrivals == 'poisson':
+            times = last_time + np.cumsum(arrival_rng.exponential(interval, size))
+        else:
+            times = start_time + interval * np.arange(generated + 1, generated + size + 1)
+        finished = False
+        if duration is not None and times[-1] > start_time + duration:
+            size = int(np.searchsorted(times, start_time + duration, side='right'))
+            times = times[:size]
+            finished = True
+            if size == 0:
+                return
+        types = type_rng.choice(len(modes), size=size, p=probabilities) if len(modes) > 1 else np.zeros(size, dtype=np.int64)
+        services = service_times[types]
+        if exponential.any():
+            # Exponential modes: scale by a unit exponential, drawn for every task to keep the stream aligned
+            services = np.where(exponential[types], services * service_rng.exponential(1.0, size), services)
+        ports = PORT_BASE + types if name == 'db_port_bimodal' else None
+        yield WorkloadChunk(times, services, types, ports)
+        last_time = times[-1]
+        generated += size
+        if finished:
+            return
+
+def workload_trace(name, rps, num_tasks=None, duration=None, arrivals='poisson', seed=None):
+    # The whole trace as one WorkloadChunk, for simulators that need all tasks up front
+    chunks = list(workload_chunks(name, rps, num_tasks, duration, arrivals, seed=seed))
+    if not chunks:
+        return WorkloadChunk(np.empty(0), np.empty(0), np.empty(0, dtype=np.int64), None)
+    ports = np.concatenate([chunk.ports for chunk in chunks]) if chunks[0].ports is not None else None
+    return WorkloadChunk(np.concatenate([chunk.arrival_times for chunk in chunks]),
+                         np.concatenate([chunk.service_times for chunk in chunks]),
+                         np.concatenate([chunk.task_types for chunk in chunks]), ports)
@@ -0,0 +1,65 @@
+#
+# Streaming latency histogram, used by the tstamp harvester (latency.py) and
+# the BFRT call stats (instrument.py).
+#
+import numpy as np
+
+DEFAULT_PERCENTILES = (50, 90, 99, 99.9)
+
+class LatencyHistogram():
+    #
+    # Log-linear histogram for streaming percentiles over an unbounded number
+    # of samples. Each power of two is split into sub_buckets linear buckets,
+    # so the relative error of a percentile is at most 1/sub_buckets.
+    #
+    def __init__(self, sub_buckets=64, max_exponent=33):
+        self.sub_buckets = sub_buckets
+        self.max_exponent = max_exponent
+        self.counts = np.zeros((max_exponent + 1) * sub_buckets, dtype=np.int64)
+        self.count = 0
+        self.total = 0
+        self.min = None
+        self.max = None
+
+    def _bucket_index(self, values):
+        mantissa, exponent = np.frexp(values.astype(np.float64))
+        index = exponent * self.sub_buckets + ((2 * mantissa - 1) * self.sub_buckets).astype(np.int64)
+        index[values < 1] = 0
+        return np.minimum(index, len(self.counts) - 1)
+
+    def _bucket_value(self, index):
+        exponent = index // self.sub_buckets
+        step = index % self.sub_buckets
+        return np.where(index == 0, 0, np.ldexp(1.0 + (step + 0.5) / self.sub_buckets, exponent - 1))
+
+    def add(self, values):
+        values = np.asarray(values, dtype=np.int64)
+        if values.size == 0:
+            return
+        self.counts += np.bincount(self._bucket_index(values), minlength=len(self.counts))
+        self.count += values.size
+        self.total += int(values.sum())
+        vmin = int(values.min())
+        vmax = int(values.max())
+        self.min = vmin if self.min is None else min(self.min, vmin)
+        self.max = vmax if self.max is None else max(self.max, vmax)
+
+    def merge(self, other):
+        self.counts += other.counts
+        self.count += other.count
+        self.total += other.total
+        for value in (other.min, other.max):
+            if value is not None:
+                self.min = value if self.min is None else min(self.min, value)
+                self.max = value if self.max is None else max(self.max, value)
+
+    def mean(self):
+        return float(self.total) / self.count if self.count else 0.0
+
+    def percentiles(self, percentiles=DEFAULT_PERCENTILES):
+        if self.count == 0:
+            return [0.0] * len(percentiles)
+        cumulative = np.cumsum(self.counts)
+        ranks = np.ceil(np.asarray(percentiles, dtype=np.float64) / 100.0 * self.count).astype(np.int64)
+        indices = np.searchsorted(cumulative, np.maximum(ranks, 1))
+        return list(np.clip(self._bucket_value(indices), self.min, self.max))
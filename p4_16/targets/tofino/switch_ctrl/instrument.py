@@ -0,0 +1,162 @@
+#
+# Opt-in instrumentation of the BFRT calls made by the controllers.
+#
+# When enabled, the tables handed out by TableRegistry.table_get() (see
+# tables.py) are wrapped so that every entry_add/entry_mod/entry_del/
+# entry_get/operations_execute call records, per (table, operation), the
+# number of calls and errors, the number of entries and a latency histogram.
+# If the gRPC stub of the client interface is given, the serialized request
+# and response sizes are attributed to the table operation in progress.
+#
+# A summary is printed on SIGUSR1 (kill -USR1 <controller pid>) and at exit.
+# When not enabled the tables are not wrapped at all, so there is no overhead.
+#
+# Usage (in the controller __main__, before the controllers are created, e.g.
+# with the --bfrt-stats flag of the controllers):
+#
+#  if bfrt_stats:
+#      enable_bfrt_stats(interface)
+#
+import atexit
+import collections
+import signal
+import threading
+import time
+
+from switch_ctrl.histogram import LatencyHistogram
+
+INSTRUMENTED_OPS = ('entry_add', 'entry_mod', 'entry_del', 'entry_get', 'operations_execute', 'default_entry_set')
+SUMMARY_PERCENTILES = (50, 99)
+
+_stats = None
+
+class OpStats():
+    def __init__(self):
+        self.num_calls = 0
+        self.num_errors = 0
+        self.num_entries = 0
+        self.bytes_sent = 0
+        self.bytes_received = 0
+        self.total_time = 0.0
+        self.histogram = LatencyHistogram() # Microseconds
+
+class BfrtStats():
+    def __init__(self):
+        self.lock = threading.RLock() # The SIGUSR1 dump may interrupt a record() on the main thread
+        self.ops = collections.OrderedDict() # (table_name, op) -> OpStats
+        self.local = threading.local() # Operation in progress on this thread, for the byte counts
+        self.start_time = time.time()
+
+    def _op_stats(self, table_name, op):
+        op_stats = self.ops.get((table_name, op))
+        if op_stats is None:
+            op_stats = self.ops[(table_name, op)] = OpStats()
+        return op_stats
+
+    def record(self, table_name, op, elapsed, num_entries, failed):
+        with self.lock:
+            op_stats = self._op_stats(table_name, op)
+            op_stats.num_calls += 1
+            op_stats.num_errors += int(failed)
+            op_stats.num_entries += num_entries
+            op_stats.total_time += elapsed
+            op_stats.histogram.add([int(elapsed * 1e6)])
+
+    def add_bytes(self, bytes_sent, bytes_received):
+        table_name, op = getattr(self.local, 'current', None) or ('(no table)', 'grpc')
+        with self.lock:
+            op_stats = self._op_stats(table_name, op)
+            op_stats.bytes_sent += bytes_sent
+            op_stats.bytes_received += bytes_received
+
+    def print_summary(self):
+        with self.lock:
+            ops = sorted(self.ops.items(), key=lambda item: -item[1].total_time)
+            print("BFRT call stats over %.1f s (sorted by total time):" %(time.time() - self.start_time))
+            print("%-48s %-18s %8s %6s %9s %10s %10s %10s %10s %10s %10s" %("Table", "Operation", "calls", "errors", "entries",
+                  "KB sent", "KB recv", "total ms", "p50 us", "p99 us", "max us"))
+            for (table_name, op), op_stats in ops:
+                p50, p99 = op_stats.histogram.percentiles(SUMMARY_PERCENTILES)
+                print("%-48s %-18s %8d %6d %9d %10.1f %10.1f %10.1f %10.0f %10.0f %10d" %(table_name, op, op_stats.num_calls, op_stats.num_errors,
+                      op_stats.num_entries, op_stats.bytes_sent / 1024.0, op_stats.bytes_received / 1024.0, op_stats.total_time * 1000,
+                      p50, p99, op_stats.histogram.max or 0))
+
+class InstrumentedTable():
+    # Proxy for a bfrt_grpc table object, all other attributes are passed through
+    def __init__(self, table, table_name, stats):
+        self._table = table
+        self._table_name = table_name
+        self._stats = stats
+
+    def __getattr__(self, name):
+        attr = getattr(self._table, name)
+        if name not in INSTRUMENTED_OPS:
+            return attr
+        def instrumented(*args, **kwargs):
+            return self._call(name, attr, args, kwargs)
+        return instrumented
+
+    def _call(self, op, func, args, kwargs):
+        stats = self._stats
+        previous = getattr(stats.local, 'current', None)
+        stats.local.current = (self._table_name, op)
+        num_entries = len(args[1]) if op != 'entry_get' and len(args) > 1 and isinstance(args[1], list) else 0
+        failed = True
+        start_time = time.time()
+        try:
+            result = func(*args, **kwargs)
+            if op == 'entry_get':
+                # The read happens while iterating, so consume it inside the measurement
+                result = list(result)
+                num_entries = len(result)
+                result = iter(result)
+            failed = False
+            return result
+        finally:
+            stats.record(self._table_name, op, time.time() - start_time, num_entries, failed)
+            stats.local.current = previous
+
+class _StubProxy():
+    # Counts the serialized size of the Write/Read requests and responses
+    def __init__(self, stub, stats):
+        self._stub = stub
+        self._stats = stats
+
+    def __getattr__(self, name):
+        return getattr(self._stub, name)
+
+    def Write(self, request, *args, **kwargs):
+        self._stats.add_bytes(request.ByteSize(), 0)
+        return self._stub.Write(request, *args, **kwargs)
+
+    def Read(self, request, *args, **kwargs):
+        self._stats.add_bytes(request.ByteSize(), 0)
+        for response in self._stub.Read(request, *args, **kwargs):
+            self._stats.add_bytes(0, response.ByteSize())
+            yield response
+
+def bfrt_stats_enabled():
+    return _stats is not None
+
+def get_bfrt_stats():
+    return _stats
+
+def enable_bfrt_stats(interface=None, dump_signal=signal.SIGUSR1):
+    global _stats
+    if _stats is not None:
+        return _stats
+    _stats = BfrtStats()
+    if interface is not None:
+        if hasattr(interface, 'bfrt_stub'):
+            interface.bfrt_stub = _StubProxy(interface.bfrt_stub, _stats)
+        else:
+            print("BFRT stats: client interface has no bfrt_stub, request sizes are not counted")
+    atexit.register(_stats.print_summary)
+    if dump_signal is not None:
+        signal.signal(dump_signal, lambda signum, frame: _stats.print_summary())
+    return _stats
+
+def instrument_table(table, table_name):
+    if _stats is None:
+        return table
+    return InstrumentedTable(table, table_name, _stats)
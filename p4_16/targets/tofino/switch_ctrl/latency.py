@@ -0,0 +1,128 @@
+#
+# Streaming harvester for the ingress_tstamp/egress_tstamp registers.
+#
+# The switch writes the clipped 32 bit ingress MAC timestamp and egress global
+# timestamp of every task to ingress_tstamp[seq_num] and egress_tstamp[seq_num]
+# (65536 entry rings) and counts the tasks in stat_count_task. The harvester
+# remembers how many tasks it has already consumed (the watermark) and on every
+# poll() only reads the ring slots that were written since the last poll.
+#
+# Each pipe has its own registers, so its own ring and task count: every pipe
+# is harvested with its own watermark into the same histogram, which matches
+# the totals of the 'sum' counter view. pipe_id restricts the harvest to one pipe.
+#
+# Usage (see LeafController in legacy/saqr/controller.py):
+#
+#  harvester = TstampHarvester(target,
+#      self.register_stat_count_task, 'LeafIngress.stat_count_task.f1',
+#      self.register_ingress_tstamp, 'LeafIngress.ingress_tstamp.f1',
+#      self.register_egress_tstamp, 'SaqrEgress.egress_tstamp.f1',
+#      output_file='leaf_latency.bin')
+#  while True:
+#      harvester.poll()
+#      harvester.print_stats('Leaf')
+#      time.sleep(1)
+#
+import numpy as np
+
+from switch_ctrl.histogram import LatencyHistogram, DEFAULT_PERCENTILES
+from switch_ctrl.registers import register_sync, register_snapshot
+
+TSTAMP_RING_SIZE = 65536 # ARRAY_SIZE in the P4 code
+TSTAMP_MASK = 0xFFFFFFFF # Timestamps are clipped to 32 bits
+MAX_VALID_DELAY_NS = 1000000 # Larger deltas come from slots not yet written by egress
+DEFAULT_GUARD_SLOTS = 16 # Slots behind the counter that may still be in the pipeline
+
+def tstamp_deltas(ingress_tstamps, egress_tstamps):
+    # egress - ingress modulo 2^32, safe when the 32 bit clock wraps between the two
+    return (np.asarray(egress_tstamps, dtype=np.int64) - np.asarray(ingress_tstamps, dtype=np.int64)) & TSTAMP_MASK
+
+class TstampHarvester():
+    def __init__(self, target,
+                 register_task_count, task_count_name,
+                 register_ingress_tstamp, ingress_tstamp_name,
+                 register_egress_tstamp, egress_tstamp_name,
+                 pipe_id=None, ring_size=TSTAMP_RING_SIZE, guard_slots=DEFAULT_GUARD_SLOTS,
+                 max_valid_delay=MAX_VALID_DELAY_NS, output_file=None):
+        self.target = target
+        self.register_task_count = register_task_count
+        self.task_count_name = task_count_name
+        self.register_ingress_tstamp = register_ingress_tstamp
+        self.ingress_tstamp_name = ingress_tstamp_name
+        self.register_egress_tstamp = register_egress_tstamp
+        self.egress_tstamp_name = egress_tstamp_name
+        self.pipe_id = pipe_id # None: all pipes
+        self.ring_size = ring_size
+        self.guard_slots = guard_slots
+        self.max_valid_delay = max_valid_delay
+        self.output_file = output_file
+
+        self.watermarks = None # Per pipe, number of tasks already harvested
+        self.task_count = 0 # Last value read from stat_count_task (sum of the harvested pipes)
+        self.task_count_snapshot = None # Same, for all pipes
+        self.num_lost = 0 # Samples overwritten in the ring before they were read
+        self.num_invalid = 0 # Slots with a missing/stale egress timestamp
+        self.histogram = LatencyHistogram()
+
+    def _read_slots(self, register_object, register_name, pipe, start, num_slots):
+        # Reads num_slots ring entries of pipe starting at start (wrapping around the end of the ring)
+        first = min(num_slots, self.ring_size - start)
+        parts = [register_snapshot(self.target, register_object, register_name, start, first, from_hw=False)[pipe]]
+        if num_slots > first:
+            parts.append(register_snapshot(self.target, register_object, register_name, 0, num_slots - first, from_hw=False)[pipe])
+        return np.concatenate(parts)
+
+    def poll(self):
+        # Harvests the slots written since the last poll on every pipe. Returns the new valid delays (ns)
+        self.task_count_snapshot = register_snapshot(self.target,
+            self.register_task_count,
+            self.task_count_name,
+            0,
+            1)
+        task_counts = self.task_count_snapshot[:, 0].astype(np.int64)
+        pipes = range(len(task_counts)) if self.pipe_id is None else [self.pipe_id]
+        if self.watermarks is None:
+            self.watermarks = np.zeros(len(task_counts), dtype=np.int64)
+        self.task_count = int(sum(task_counts[pipe] for pipe in pipes))
+
+        windows = []
+        for pipe in pipes:
+            if task_counts[pipe] < self.watermarks[pipe]:
+                # Counter was reset (e.g. switchd restarted)
+                self.watermarks[pipe] = 0
+            high = task_counts[pipe] - self.guard_slots
+            if high <= self.watermarks[pipe]:
+                continue
+            num_new = high - self.watermarks[pipe]
+            if num_new > self.ring_size:
+                self.num_lost += int(num_new - self.ring_size)
+                num_new = self.ring_size
+            windows.append((pipe, int((high - num_new) % self.ring_size), int(num_new)))
+            self.watermarks[pipe] = high
+        if not windows:
+            return np.zeros(0, dtype=np.int64)
+
+        # One sync per register, then only the new slots of each pipe are read
+        register_sync(self.target, self.register_ingress_tstamp)
+        register_sync(self.target, self.register_egress_tstamp)
+        ingress_tstamps = np.concatenate([self._read_slots(self.register_ingress_tstamp, self.ingress_tstamp_name, pipe, start, num_new)
+                                          for pipe, start, num_new in windows])
+        egress_tstamps = np.concatenate([self._read_slots(self.register_egress_tstamp, self.egress_tstamp_name, pipe, start, num_new)
+                                         for pipe, start, num_new in windows])
+
+        delays = tstamp_deltas(ingress_tstamps, egress_tstamps)
+        valid = delays <= self.max_valid_delay
+        self.num_invalid += int(np.count_nonzero(~valid))
+        delays = delays[valid]
+        self.histogram.add(delays)
+        if self.output_file is not None and delays.size:
+            with open(self.output_file, 'ab') as f:
+                delays.astype(np.uint32).tofile(f)
+        return delays
+
+    def print_stats(self, label, percentiles=DEFAULT_PERCENTILES):
+        print("%s tasks: %d, latency samples: %d (lost: %d, invalid: %d)" %(label, self.task_count, self.histogram.count, self.num_lost, self.num_invalid))
+        if self.histogram.count:
+            values = self.histogram.percentiles(percentiles)
+            print("%s processing latency (ns): min %d, mean %.1f, max %d, " %(label, self.histogram.min, self.histogram.mean(), self.histogram.max)
+                  + ", ".join("p%s %.0f" %(str(p), v) for p, v in zip(percentiles, values)))
@@ -0,0 +1,57 @@
+#
+# Desired switch state (table entries and register values) and the diff
+# between two states, see topology.py. Kept free of BFRT imports so that the
+# behavioral models in ../sim can be programmed with the same plans.
+#
+# Plan entries are keyed by (table_name, key) where key is a tuple of
+# (key_field_name, value) pairs. The data is (action_name, data) where data is
+# a tuple of (data_field_name, value) pairs. Registers are keyed by
+# (register_field_name, index), e.g. ('LeafIngress.queue_len_list_1.f1', 3).
+# Key and data fields are kept sorted by name so that plans compiled by the
+# controller compare equal to plans read back from the switch. Adding an entry
+# whose key is already in the plan with a different action or data raises
+# ValueError, as entry_add() fails on the switch.
+#
+import collections
+
+PlanDiff = collections.namedtuple('PlanDiff', ['entries_add', 'entries_mod', 'entries_del', 'registers'])
+
+class Plan():
+    def __init__(self):
+        self.entries = collections.OrderedDict()
+        self.registers = collections.OrderedDict()
+
+    def add_entry(self, table_name, key, action_name, data=()):
+        table_key = (table_name, tuple(sorted(key)))
+        action_data = (action_name, tuple(sorted(data)))
+        if table_key in self.entries and self.entries[table_key] != action_data:
+            raise ValueError("Conflicting entries for key %s in %s: %s and %s" %(str(table_key[1]), table_name,
+                             str(self.entries[table_key]), str(action_data)))
+        self.entries[table_key] = action_data
+
+    def set_register(self, register_name, index, register_value):
+        self.registers[(register_name, index)] = register_value
+
+    def set_register_range(self, register_name, start_index, register_values):
+        for i, register_value in enumerate(register_values):
+            self.set_register(register_name, start_index + i, register_value)
+
+def diff_plans(installed, desired):
+    entries_add = []
+    entries_mod = []
+    entries_del = []
+    for table_key, action_data in desired.entries.items():
+        if table_key not in installed.entries:
+            entries_add.append((table_key, action_data))
+        elif installed.entries[table_key] != action_data:
+            entries_mod.append((table_key, action_data))
+    for table_key, action_data in installed.entries.items():
+        if table_key not in desired.entries:
+            entries_del.append((table_key, action_data))
+    # Registers can not be removed, only (re)written when the intended value changes
+    registers = [(reg_key, value) for reg_key, value in desired.registers.items()
+                 if installed.registers.get(reg_key) != value]
+    return PlanDiff(entries_add, entries_mod, entries_del, registers)
+
+def plan_diff_size(plan_diff):
+    return sum(len(changes) for changes in plan_diff)
@@ -0,0 +1,152 @@
+#
+# Periodic register polling with an independent cadence per register group.
+#
+# The controllers used to read every register group back to back and then
+# sleep, so a slow leaf dump delayed the spine stats and the sampling period
+# drifted with the dump time. The Poller releases each group at fixed times
+# (start + k * period), runs the reads concurrently on a small pool of worker
+# threads (gRPC channels are thread safe) and reports missed deadlines.
+#
+# Usage:
+#
+#  poller = Poller(num_workers=4)
+#  poller.add('leaf_counters', 0.1, leaf_controller.read_stat_counters)
+#  poller.add('leaf_qlen', 1, leaf_controller.read_queue_len_lists, deadline=0.5)
+#  poller.run()   # Until Ctrl-C, then prints a summary
+#
+import heapq
+import threading
+import time
+
+try:
+    import queue
+except ImportError: # python2
+    import Queue as queue
+
+class PollTask():
+    def __init__(self, name, period, func, deadline=None):
+        if period <= 0:
+            raise ValueError("period must be positive")
+        self.name = name
+        self.period = period
+        self.func = func
+        self.deadline = period if deadline is None else deadline # Relative to the release time
+        self.running = False
+
+        self.num_runs = 0
+        self.num_errors = 0
+        self.num_missed_deadlines = 0
+        self.num_skipped = 0 # Releases dropped because the previous run was still going
+        self.total_time = 0.0
+        self.max_time = 0.0
+        self.max_lateness = 0.0
+
+class Poller():
+    def __init__(self, num_workers=4, verbose=True):
+        self.num_workers = num_workers
+        self.verbose = verbose
+        self.tasks = []
+        self.lock = threading.Lock()
+        self.stop_event = threading.Event()
+        self.work_queue = queue.Queue()
+        self.workers = []
+        self.scheduler = None
+
+    def add(self, name, period, func, deadline=None):
+        task = PollTask(name, period, func, deadline)
+        self.tasks.append(task)
+        return task
+
+    def _worker(self):
+        while True:
+            item = self.work_queue.get()
+            if item is None:
+                return
+            task, release_time = item
+            start_time = time.time()
+            try:
+                task.func()
+                failed = False
+            except Exception as e:
+                failed = True
+                print("Poller: %s failed: %s" %(task.name, str(e)))
+            end_time = time.time()
+            with self.lock:
+                task.running = False
+                task.num_runs += 1
+                task.num_errors += int(failed)
+                run_time = end_time - start_time
+                task.total_time += run_time
+                task.max_time = max(task.max_time, run_time)
+                lateness = end_time - release_time
+                task.max_lateness = max(task.max_lateness, lateness)
+                if lateness > task.deadline:
+                    task.num_missed_deadlines += 1
+                    if self.verbose:
+                        print("Poller: %s missed its deadline (%.1f ms > %.1f ms)" %(task.name, lateness * 1000, task.deadline * 1000))
+
+    def _scheduler(self, start_time):
+        releases = [(start_time, i) for i in range(len(self.tasks))]
+        heapq.heapify(releases)
+        while not self.stop_event.is_set():
+            release_time, i = releases[0]
+            now = time.time()
+            if release_time > now:
+                self.stop_event.wait(release_time - now)
+                continue
+            task = self.tasks[i]
+            with self.lock:
+                if task.running:
+                    task.num_skipped += 1
+                else:
+                    task.running = True
+                    self.work_queue.put((task, release_time))
+            # Stay on the start + k * period grid; drop releases we are already past
+            next_release = release_time + task.period
+            if next_release <= now:
+                with self.lock:
+                    task.num_skipped += int((now - next_release) // task.period) + 1
+                next_release += (int((now - next_release) // task.period) + 1) * task.period
+            heapq.heapreplace(releases, (next_release, i))
+
+    def start(self):
+        if not self.tasks:
+            raise ValueError("No poll tasks were added")
+        self.stop_event.clear()
+        self.workers = [threading.Thread(target=self._worker) for _ in range(self.num_workers)]
+        self.scheduler = threading.Thread(target=self._scheduler, args=(time.time(),))
+        for thread in self.workers + [self.scheduler]:
+            thread.daemon = True
+            thread.start()
+
+    def stop(self):
+        self.stop_event.set()
+        if self.scheduler is not None:
+            self.scheduler.join()
+        for _ in self.workers:
+            self.work_queue.put(None)
+        for thread in self.workers:
+            thread.join()
+        self.workers = []
+        self.scheduler = None
+
+    def run(self, duration=None):
+        # Blocks until duration seconds passed (forever if None) or Ctrl-C
+        self.start()
+        try:
+            end_time = None if duration is None else time.time() + duration
+            while end_time is None or time.time() < end_time:
+                time.sleep(0.1)
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self.stop()
+            self.print_stats()
+
+    def print_stats(self):
+        print("%-24s %8s %8s %8s %8s %8s %10s %10s" %("Poll task", "period", "runs", "errors", "missed", "skipped", "avg (ms)", "max (ms)"))
+        with self.lock:
+            for task in self.tasks:
+                avg_time = task.total_time / task.num_runs if task.num_runs else 0.0
+                print("%-24s %8.3f %8d %8d %8d %8d %10.2f %10.2f" %(task.name, task.period, task.num_runs, task.num_errors,
+                      task.num_missed_deadlines, task.num_skipped, avg_time * 1000, task.max_time * 1000))
@@ -0,0 +1,193 @@
+#
+# Compact binary time series of register snapshots.
+#
+# Each recorded register (e.g. the per-vcluster stat_count_resub) goes to its
+# own file: a fixed size header (JSON description padded to HEADER_SIZE bytes)
+# followed by fixed size records:
+#
+#   time    float64          wall-clock time of the snapshot (time.time())
+#   values  uint32[shape]    delta to the previous record modulo 2^32
+#
+# Every keyframe_interval-th record (index % keyframe_interval == 0) stores
+# the absolute values instead of a delta, so any slice can be decoded by
+# starting at the keyframe before it. Registers are at most 32 bits wide and
+# the deltas are taken modulo 2^32, so decoding is exact and counters that wrap
+# can be unwrapped into monotonic totals.
+#
+# The records are read back with np.memmap (no parsing) and the time column
+# is the index: SnapshotReader.index(t) is a binary search over the mapped file.
+#
+# Usage:
+#
+#  recorder = SnapshotRecorder('stats/leaf_stat_count_resub.rec', 'LeafIngress.stat_count_resub.f1')
+#  recorder.append(register_snapshot(...))  # on every poll
+#
+#  reader = SnapshotReader('stats/leaf_stat_count_resub.rec')
+#  times, values = reader.between(t_start, t_end, unwrap=True)  # values[:, pipe, vcluster]
+#
+import json
+import os
+import threading
+import time
+
+import numpy as np
+
+RECORDER_MAGIC = b'HRSREC01'
+HEADER_SIZE = 4096 # Records start page aligned
+KEYFRAME_INTERVAL = 1024
+VALUE_MASK = 0xFFFFFFFF
+
+def _record_dtype(shape):
+    return np.dtype([('time', '<f8'), ('values', '<u4', tuple(shape))])
+
+def _read_header(path):
+    with open(path, 'rb') as f:
+        header = f.read(HEADER_SIZE)
+    if len(header) < HEADER_SIZE or header[:len(RECORDER_MAGIC)] != RECORDER_MAGIC:
+        raise ValueError("%s is not a snapshot recording" %(path))
+    return json.loads(header[len(RECORDER_MAGIC):].rstrip(b'\0').decode('utf-8'))
+
+def _decode(raw_values, keyframe_interval):
+    # raw_values[0] must be a keyframe
+    deltas = raw_values.astype(np.int64)
+    sums = np.cumsum(deltas, axis=0)
+    keyframes = np.arange(0, len(deltas), keyframe_interval)
+    # Restart the running sum at every keyframe
+    segment_base = np.concatenate([np.zeros((1,) + sums.shape[1:], dtype=np.int64), sums[keyframes[1:] - 1]])
+    offsets = np.repeat(segment_base, np.diff(np.append(keyframes, len(deltas))), axis=0)
+    return (sums - offsets) & VALUE_MASK
+
+def unwrap_counters(values):
+    # Turns 32 bit counter values (that may wrap) into monotonic totals
+    values = np.asarray(values, dtype=np.int64)
+    if len(values) == 0:
+        return values
+    steps = np.diff(values, axis=0) & VALUE_MASK
+    return np.concatenate([values[:1], values[:1] + np.cumsum(steps, axis=0)])
+
+def open_recorder(stats_dir, register_name):
+    # One file per register in stats_dir, e.g. stats/LeafIngress.stat_count_resub.rec
+    if stats_dir is None:
+        return None
+    return SnapshotRecorder(os.path.join(stats_dir, register_name.rsplit('.', 1)[0] + '.rec'), register_name)
+
+class SnapshotRecorder():
+    def __init__(self, path, register_name, keyframe_interval=KEYFRAME_INTERVAL):
+        self.path = path
+        self.register_name = register_name
+        self.keyframe_interval = keyframe_interval
+        self.lock = threading.Lock()
+        self.file = None
+        self.dtype = None
+        self.num_records = 0
+        self.last_values = None
+        if os.path.exists(path) and os.path.getsize(path) >= HEADER_SIZE:
+            self._reopen()
+
+    def _reopen(self):
+        # Continue an existing recording, e.g. after a controller restart
+        header = _read_header(self.path)
+        if header['register_name'] != self.register_name:
+            raise ValueError("%s records %s, not %s" %(self.path, header['register_name'], self.register_name))
+        self.keyframe_interval = header['keyframe_interval']
+        self.dtype = _record_dtype(header['shape'])
+        reader = SnapshotReader(self.path)
+        self.num_records = len(reader)
+        if self.num_records:
+            self.last_values = reader.values(self.num_records - 1)[0]
+        reader.close()
+        # Drop a partially written record at the end
+        self.file = open(self.path, 'r+b')
+        self.file.truncate(HEADER_SIZE + self.num_records * self.dtype.itemsize)
+        self.file.seek(0, os.SEEK_END)
+
+    def _create(self, shape):
+        directory = os.path.dirname(self.path)
+        if directory and not os.path.isdir(directory):
+            os.makedirs(directory)
+        header = {'register_name': self.register_name,
+                  'shape': list(shape),
+                  'keyframe_interval': self.keyframe_interval}
+        header_bytes = RECORDER_MAGIC + json.dumps(header).encode('utf-8')
+        if len(header_bytes) > HEADER_SIZE:
+            raise ValueError("Recorder header too large")
+        self.dtype = _record_dtype(shape)
+        self.file = open(self.path, 'wb')
+        self.file.write(header_bytes + b'\0' * (HEADER_SIZE - len(header_bytes)))
+
+    def append(self, snapshot, timestamp=None):
+        values = np.asarray(snapshot, dtype=np.int64) & VALUE_MASK
+        with self.lock:
+            if self.file is None:
+                self._create(values.shape)
+            if values.shape != self.dtype['values'].shape:
+                raise ValueError("Snapshot shape %s does not match the recording %s" %(str(values.shape), str(self.dtype['values'].shape)))
+            record = np.zeros(1, dtype=self.dtype)
+            record['time'] = time.time() if timestamp is None else timestamp
+            if self.num_records % self.keyframe_interval == 0:
+                record['values'] = values
+            else:
+                record['values'] = (values - self.last_values) & VALUE_MASK
+            self.file.write(record.tobytes())
+            self.file.flush()
+            self.last_values = values
+            self.num_records += 1
+
+    def close(self):
+        with self.lock:
+            if self.file is not None:
+                self.file.close()
+                self.file = None
+
+class SnapshotReader():
+    def __init__(self, path):
+        self.path = path
+        header = _read_header(path)
+        self.register_name = header['register_name']
+        self.shape = tuple(header['shape'])
+        self.keyframe_interval = header['keyframe_interval']
+        self.dtype = _record_dtype(self.shape)
+        num_records = (os.path.getsize(path) - HEADER_SIZE) // self.dtype.itemsize
+        if num_records:
+            self.records = np.memmap(path, dtype=self.dtype, mode='r', offset=HEADER_SIZE, shape=(num_records,))
+        else:
+            self.records = np.zeros(0, dtype=self.dtype)
+        self.times = self.records['time']
+
+    def __len__(self):
+        return len(self.records)
+
+    def index(self, timestamp):
+        # Index of the first record taken at or after timestamp
+        return int(np.searchsorted(self.times, timestamp, side='left'))
+
+    def values(self, start=0, stop=None, unwrap=False):
+        # Decoded values of records [start, stop), shape (stop - start,) + shape
+        stop = len(self) if stop is None else min(stop, len(self))
+        if start >= stop:
+            return np.zeros((0,) + self.shape, dtype=np.int64)
+        first = start - start % self.keyframe_interval
+        decoded = _decode(self.records['values'][first:stop], self.keyframe_interval)[start - first:]
+        return unwrap_counters(decoded) if unwrap else decoded
+
+    def between(self, start_time, end_time, unwrap=False):
+        # Records with start_time <= time < end_time
+        start = self.index(start_time)
+        stop = self.index(end_time)
+        return np.asarray(self.times[start:stop]), self.values(start, stop, unwrap)
+
+    def close(self):
+        # Drops the mapping (it is unmapped once no decoded slice refers to it)
+        self.records = None
+        self.times = None
+
+if __name__ == "__main__":
+    # python -m switch_ctrl.recorder stats/*.rec : summary of each recording
+    import sys
+    for path in sys.argv[1:]:
+        reader = SnapshotReader(path)
+        print("%s: %s %s, %d records" %(path, reader.register_name, str(reader.shape), len(reader)))
+        if len(reader):
+            print("  %.3f .. %.3f (%.1f s), last values (pipe 0): %s" %(reader.times[0], reader.times[-1],
+                  reader.times[-1] - reader.times[0], str(reader.values(len(reader) - 1)[0][0].tolist())))
+        reader.close()
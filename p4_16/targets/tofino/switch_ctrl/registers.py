@@ -0,0 +1,167 @@
+#
+# Register helpers shared by the rs_h, rs_r and saqr controllers.
+#
+# The controllers used to call register_write()/test_register_read() once per
+# register index which costs one blocking gRPC round-trip (and for reads one
+# hardware sync) per entry. The helpers in this module pack many register
+# indices into a single BFRT request instead.
+#
+# To import this module from a controller directory:
+#
+# sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+# from switch_ctrl.registers import *
+#
+import collections
+
+import numpy as np
+
+from switch_ctrl.tables import register_index_key, register_data
+
+# Max number of register indices packed in a single BFRT read or write request.
+# A whole MAX_WORKERS_IN_RACK (256) array fits in one request, and the limit
+# keeps the gRPC message well below the default 4MB size.
+MAX_BATCH_SIZE = 4096
+
+# Views of per-pipe register values, see pipe_view(). With the target set to
+# all pipes (pipe_id=0xffff) every read returns one value per pipe, and a
+# stat_count_* counter only counts the packets processed by its own pipe.
+PIPE_VIEWS = ('sum', 'max', 'pipes')
+
+class RegisterBatch():
+    #
+    # Collects register writes and sends them with one entry_add() per
+    # register (and per MAX_BATCH_SIZE indices) on flush().
+    #
+    # Usage:
+    #
+    #  reg_batch = RegisterBatch(target)
+    #  reg_batch.add(self.register_queue_len_list_1, 'LeafIngress.queue_len_list_1.f1', 0, 0)
+    #  reg_batch.add_range(self.register_idle_list, 'LeafIngress.idle_list.f1', 32, [32, 33, 34])
+    #  reg_batch.flush()
+    #
+    # Writing the same index twice before flush() keeps the last value.
+    #
+    def __init__(self, target, batch_size=MAX_BATCH_SIZE, verbose=True):
+        if batch_size <= 0:
+            raise ValueError("batch_size must be positive")
+        self.target = target
+        self.batch_size = batch_size
+        self.verbose = verbose
+        # register_name -> (register_object, OrderedDict(index -> value))
+        self.pending = collections.OrderedDict()
+
+    def add(self, register_object, register_name, index, register_value):
+        if register_name not in self.pending:
+            self.pending[register_name] = (register_object, collections.OrderedDict())
+        self.pending[register_name][1][index] = register_value
+
+    def add_range(self, register_object, register_name, start_index, register_values):
+        for i, register_value in enumerate(register_values):
+            self.add(register_object, register_name, start_index + i, register_value)
+
+    def __len__(self):
+        return sum(len(entries) for _, entries in self.pending.values())
+
+    def flush(self):
+        # Returns the number of BFRT write requests that were sent
+        num_requests = 0
+        for register_name, (register_object, entries) in self.pending.items():
+            indices = list(entries.keys())
+            for start in range(0, len(indices), self.batch_size):
+                chunk = indices[start:start + self.batch_size]
+                register_object.entry_add(
+                    self.target,
+                    [register_index_key(register_object, index) for index in chunk],
+                    [register_data(register_object, register_name, entries[index]) for index in chunk])
+                num_requests += 1
+            if self.verbose:
+                print("Inserted %d entries in %s register (indices %d..%d)" %(len(indices), str(register_name), min(indices), max(indices)))
+        self.pending.clear()
+        return num_requests
+
+def register_write_batch(target, register_object, register_name, start_index, register_values, batch_size=MAX_BATCH_SIZE):
+    # Writes register_values to consecutive indices starting at start_index
+    reg_batch = RegisterBatch(target, batch_size=batch_size)
+    reg_batch.add_range(register_object, register_name, start_index, register_values)
+    return reg_batch.flush()
+
+def register_sync(target, register_object):
+    # Copies the register values of all pipes from the hardware into the
+    # driver shadow so that the following reads can use from_hw=False
+    register_object.operations_execute(target, 'Sync')
+
+def register_snapshot(target, register_object, register_name, start_index=0, num_entries=None, from_hw=True, batch_size=MAX_BATCH_SIZE):
+    #
+    # Reads register_name[start_index:start_index+num_entries] with a single
+    # hardware sync and returns a numpy array of shape (num_pipes, num_entries):
+    # snapshot[pipe] holds the values of that pipe. If num_entries is None the
+    # whole register (from start_index) is read using one wildcard request.
+    #
+    if from_hw:
+        register_sync(target, register_object)
+    if num_entries is None:
+        responses = [register_object.entry_get(target, None, {"from_hw": False})]
+    else:
+        responses = []
+        for start in range(start_index, start_index + num_entries, batch_size):
+            end = min(start + batch_size, start_index + num_entries)
+            responses.append(register_object.entry_get(
+                target,
+                [register_index_key(register_object, index) for index in range(start, end)],
+                {"from_hw": False}))
+
+    offsets = []
+    values = []
+    for resp in responses:
+        for data, key in resp:
+            index = key.to_dict()['$REGISTER_INDEX']['value']
+            if index < start_index or (num_entries is not None and index >= start_index + num_entries):
+                continue
+            offsets.append(index - start_index)
+            values.append(data.to_dict()[register_name])
+
+    if num_entries is None:
+        num_entries = (max(offsets) + 1) if offsets else 0
+    num_pipes = len(values[0]) if values else 1
+    snapshot = np.zeros((num_pipes, num_entries), dtype=np.int64)
+    if offsets:
+        snapshot[:, offsets] = np.array(values, dtype=np.int64).T
+    return snapshot
+
+def pipe_view(snapshot, view='sum'):
+    #
+    # snapshot[pipe] holds the values of one pipe (as returned by
+    # register_snapshot()). 'sum' and 'max' reduce over the pipes (the sum is
+    # the switch-wide count for counters), 'pipes' returns the per-pipe values
+    # unchanged and an int selects a single pipe.
+    #
+    snapshot = np.asarray(snapshot)
+    if view == 'sum':
+        return snapshot.sum(axis=0)
+    if view == 'max':
+        return snapshot.max(axis=0)
+    if view == 'pipes':
+        return snapshot
+    if isinstance(view, int) and not isinstance(view, bool):
+        return snapshot[view]
+    raise ValueError("Unknown pipe view %s, use one of %s or a pipe id" %(str(view), str(PIPE_VIEWS)))
+
+def register_read(target, register_object, register_name, index, view='sum', from_hw=True):
+    # Reads one register index of all pipes with a single request
+    resp = register_object.entry_get(
+            target,
+            [register_index_key(register_object, index)],
+            {"from_hw": from_hw})
+    values = next(resp)[0].to_dict()[register_name]
+    return pipe_view(np.array(values, dtype=np.int64).reshape(-1, 1), view)[..., 0]
+
+def print_counter_snapshot(register_name, start_index, snapshot):
+    # One line per index with the sum, max and per-pipe values
+    for i, values in enumerate(np.asarray(snapshot).T):
+        print("Reading Register: %s [%d] = %d (max %d, per pipe: %s)" %(str(register_name), start_index + i,
+              values.sum(), values.max(), ", ".join(str(value) for value in values)))
+
+def print_register_snapshot(register_name, start_index, snapshot, pipe_id=0):
+    # Same output format as test_register_read() in the controllers
+    for i, value in enumerate(snapshot[pipe_id]):
+        print("Reading Register: %s [%d] = %d" %(str(register_name), start_index + i, value))
@@ -0,0 +1,131 @@
+#
+# Table handle registry and cached key/data builders for the controllers.
+#
+# Building an entry with make_key([client.KeyTuple(...)]) /
+# make_data([client.DataTuple(...)], action) allocates new tuples, converts
+# MAC strings and looks up the table by name every time. When programming
+# thousands of forward_horus_switch_dst or get_rand_leaf_id_* entries (or
+# reading every index of a register on each poll) that Python object churn
+# dominates. The registry resolves each table once, and the templates fix
+# the field names and action of a key/data so that only the varying values
+# are passed in. Field tuples, MAC bytes and (for keys) the built key objects
+# are cached and reused, the BFRT client only reads them when it serializes
+# a request.
+#
+# Usage:
+#
+#  table_registry = TableRegistry(bfrt_info)
+#  forward = table_registry.table_get('LeafIngress.forward_horus_switch_dst')
+#  key = table_registry.key_template('LeafIngress.forward_horus_switch_dst', ['hdr.horus.dst_id'])
+#  data = table_registry.data_template('LeafIngress.forward_horus_switch_dst', 'LeafIngress.act_forward_horus', ['dst_mac', 'port'])
+#  forward.entry_add(target, [key.make(wid) for wid in wids], [data.make(mac, port) for mac, port in ...])
+#
+import bfrt_grpc.client as client
+
+from switch_ctrl.instrument import instrument_table
+
+# Max number of built keys (and data values per field) kept per template, a whole 65536 entry register fits
+MAX_CACHED_KEYS = 65536
+
+_mac_bytes_cache = {}
+
+def mac_bytes(mac):
+    # Memoized client.mac_to_bytes()
+    if mac not in _mac_bytes_cache:
+        _mac_bytes_cache[mac] = client.mac_to_bytes(mac)
+    return _mac_bytes_cache[mac]
+
+def _data_tuple(name, value):
+    if isinstance(value, bool):
+        return client.DataTuple(name, bool_val=value)
+    if isinstance(value, str):
+        if name.endswith('mac'):
+            return client.DataTuple(name, mac_bytes(value))
+        return client.DataTuple(name, str_val=value)
+    return client.DataTuple(name, value)
+
+class KeyTemplate():
+    def __init__(self, table, field_names, max_cached_keys=MAX_CACHED_KEYS):
+        self.table = table
+        self.field_names = tuple(field_names)
+        self.max_cached_keys = max_cached_keys
+        self.keys = {}
+
+    def make(self, *values):
+        key = self.keys.get(values)
+        if key is None:
+            key = self.table.make_key([client.KeyTuple(name, value) for name, value in zip(self.field_names, values)])
+            if len(self.keys) < self.max_cached_keys:
+                self.keys[values] = key
+        return key
+
+class DataTemplate():
+    def __init__(self, table, action_name, field_names, max_cached_values=MAX_CACHED_KEYS):
+        self.table = table
+        self.action_name = action_name
+        self.field_names = tuple(field_names)
+        self.max_cached_values = max_cached_values
+        self.fields = [{} for _ in self.field_names] # value -> DataTuple, per field
+
+    def make(self, *values):
+        data_tuples = []
+        for name, value, cache in zip(self.field_names, values, self.fields):
+            data_tuple = cache.get(value)
+            if data_tuple is None:
+                data_tuple = _data_tuple(name, value)
+                if len(cache) < self.max_cached_values:
+                    cache[value] = data_tuple
+            data_tuples.append(data_tuple)
+        if self.action_name is None:
+            return self.table.make_data(data_tuples)
+        return self.table.make_data(data_tuples, self.action_name)
+
+class TableRegistry():
+    # Same table_get() as bfrt_info, so it can be passed wherever bfrt_info was.
+    # Tables are wrapped for call stats if enable_bfrt_stats() was called first.
+    def __init__(self, bfrt_info):
+        self.bfrt_info = bfrt_info
+        self.tables = {}
+        self.key_templates = {}
+        self.data_templates = {}
+
+    def table_get(self, table_name):
+        table = self.tables.get(table_name)
+        if table is None:
+            table = self.tables[table_name] = instrument_table(self.bfrt_info.table_get(table_name), table_name)
+        return table
+
+    def register_get(self, register_name):
+        # Register table from its data field name, e.g. 'LeafIngress.idle_list.f1'
+        return self.table_get(register_name.rsplit('.', 1)[0])
+
+    def key_template(self, table_name, field_names):
+        template_id = (table_name, tuple(field_names))
+        template = self.key_templates.get(template_id)
+        if template is None:
+            template = self.key_templates[template_id] = KeyTemplate(self.table_get(table_name), field_names)
+        return template
+
+    def data_template(self, table_name, action_name, field_names):
+        template_id = (table_name, action_name, tuple(field_names))
+        template = self.data_templates.get(template_id)
+        if template is None:
+            template = self.data_templates[template_id] = DataTemplate(self.table_get(table_name), action_name, field_names)
+        return template
+
+# Register index keys and data, shared by the register helpers (see registers.py)
+_register_templates = {}
+
+def _register_template(register_object, template_id, make_template):
+    template = _register_templates.get(template_id)
+    if template is None or template.table is not register_object:
+        template = _register_templates[template_id] = make_template()
+    return template
+
+def register_index_key(register_object, index):
+    return _register_template(register_object, id(register_object),
+        lambda: KeyTemplate(register_object, ['$REGISTER_INDEX'])).make(index)
+
+def register_data(register_object, register_name, register_value):
+    return _register_template(register_object, (id(register_object), register_name),
+        lambda: DataTemplate(register_object, None, [register_name])).make(register_value)
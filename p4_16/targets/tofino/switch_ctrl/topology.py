@@ -0,0 +1,138 @@
+#
+# Declarative topology support for the controllers.
+#
+# A topology file (JSON, see ../topologies/) describes the worker placement of
+# every (virtual) leaf and the spine. The controllers compile it into a Plan:
+# the desired table entries and initial register values. Instead of inserting
+# every entry, the controller diffs the new plan against the installed one and
+# only pushes the delta, so moving between placements reprograms a handful of
+# entries without restarting switchd.
+#
+# See plan.py for the Plan format and topology_file.py for the file checks.
+#
+# Warm start: after a controller restart read_installed_plan() bulk reads the
+# entries that are on the switch, so that only missing or different entries
+# are written. The registers hold live scheduler state (queue lengths, idle
+# lists) and are treated as installed, i.e. they are never reset.
+#
+import collections
+import os
+
+from switch_ctrl.plan import PlanDiff, Plan, diff_plans, plan_diff_size
+from switch_ctrl.topology_file import load_topology
+from switch_ctrl.registers import RegisterBatch, MAX_BATCH_SIZE
+from switch_ctrl.tables import TableRegistry
+
+def _normalize_value(name, value):
+    # The switch returns MACs as bytes or lower case strings and ints may come back as bytes
+    if isinstance(value, (bytes, bytearray)):
+        if name.endswith('mac'):
+            return ':'.join('%02x' % b for b in bytearray(value))
+        return int(''.join('%02x' % b for b in bytearray(value)) or '0', 16)
+    if isinstance(value, str):
+        return value.strip().lower()
+    return value
+
+def _read_action_data(data_dict, desired_action_data):
+    # Installed (action, data) of an entry, in the same representation as desired_action_data
+    action_name = data_dict.get('action_name')
+    if desired_action_data is None or action_name != desired_action_data[0]:
+        return (action_name, ())
+    data = []
+    for name, value in desired_action_data[1]:
+        if name not in data_dict:
+            return (action_name, ())
+        installed_value = data_dict[name]
+        if _normalize_value(name, installed_value) == _normalize_value(name, value):
+            installed_value = value
+        data.append((name, installed_value))
+    return (action_name, tuple(data))
+
+def read_installed_plan(target, table_registry, desired):
+    # Plan with the entries currently on the switch for every table used in desired.
+    # Registers are copied from desired so that diff_plans() never rewrites them,
+    # unless the switch is empty (fresh switchd) and they still need initial values.
+    installed = Plan()
+    table_names = []
+    for table_name, _ in desired.entries:
+        if table_name not in table_names:
+            table_names.append(table_name)
+    for table_name in table_names:
+        table = table_registry.table_get(table_name)
+        for data, key in table.entry_get(target, None, {"from_hw": False}):
+            key_dict = key.to_dict()
+            table_key = (table_name, tuple(sorted((name, field['value']) for name, field in key_dict.items())))
+            installed.entries[table_key] = _read_action_data(data.to_dict(), desired.entries.get(table_key))
+    print("Read %d installed entries from %d tables" %(len(installed.entries), len(table_names)))
+    if installed.entries:
+        installed.registers.update(desired.registers)
+    else:
+        print("No entries installed on the switch, initializing the registers (cold start)")
+    return installed
+
+def _group_by_table(changes):
+    tables = collections.OrderedDict()
+    for (table_name, key), action_data in changes:
+        tables.setdefault(table_name, []).append((key, action_data))
+    return tables
+
+def _as_registry(tables):
+    # Accepts a TableRegistry or a plain bfrt_info
+    return tables if isinstance(tables, TableRegistry) else TableRegistry(tables)
+
+def _make_key(table_registry, table_name, key):
+    return table_registry.key_template(table_name, [name for name, _ in key]).make(*[value for _, value in key])
+
+def _make_data(table_registry, table_name, action_data):
+    action_name, data = action_data
+    return table_registry.data_template(table_name, action_name, [name for name, _ in data]).make(*[value for _, value in data])
+
+def apply_plan_diff(target, table_registry, plan_diff, batch_size=MAX_BATCH_SIZE, verbose=True):
+    table_registry = _as_registry(table_registry)
+    # Deletes go first so that re-added keys (e.g. moved workers) never collide
+    for table_name, changes in _group_by_table(plan_diff.entries_del).items():
+        table = table_registry.table_get(table_name)
+        for start in range(0, len(changes), batch_size):
+            table.entry_del(target, [_make_key(table_registry, table_name, key) for key, _ in changes[start:start + batch_size]])
+    for table_name, changes in _group_by_table(plan_diff.entries_mod).items():
+        table = table_registry.table_get(table_name)
+        for start in range(0, len(changes), batch_size):
+            chunk = changes[start:start + batch_size]
+            table.entry_mod(target,
+                [_make_key(table_registry, table_name, key) for key, _ in chunk],
+                [_make_data(table_registry, table_name, action_data) for _, action_data in chunk])
+    for table_name, changes in _group_by_table(plan_diff.entries_add).items():
+        table = table_registry.table_get(table_name)
+        for start in range(0, len(changes), batch_size):
+            chunk = changes[start:start + batch_size]
+            table.entry_add(target,
+                [_make_key(table_registry, table_name, key) for key, _ in chunk],
+                [_make_data(table_registry, table_name, action_data) for _, action_data in chunk])
+
+    reg_batch = RegisterBatch(target, batch_size=batch_size, verbose=verbose)
+    for (register_name, index), register_value in plan_diff.registers:
+        reg_batch.add(table_registry.register_get(register_name), register_name, index, register_value)
+    reg_batch.flush()
+
+    if verbose:
+        print("Applied plan diff: %d added, %d modified, %d deleted entries, %d register writes"
+              %(len(plan_diff.entries_add), len(plan_diff.entries_mod), len(plan_diff.entries_del), len(plan_diff.registers)))
+
+class TopologyWatcher():
+    #
+    # Calls on_change(topology) whenever the topology file is modified. Meant
+    # to be polled periodically, e.g. poller.add('topology', 1, watcher.check)
+    #
+    def __init__(self, path, on_change):
+        self.path = path
+        self.on_change = on_change
+        self.mtime = os.path.getmtime(path)
+
+    def check(self):
+        mtime = os.path.getmtime(self.path)
+        if mtime == self.mtime:
+            return False
+        self.mtime = mtime
+        print("Topology %s changed, reprogramming the switch" %(self.path))
+        self.on_change(load_topology(self.path))
+        return True
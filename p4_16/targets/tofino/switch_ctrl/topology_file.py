@@ -0,0 +1,50 @@
+#
+# Topology files (JSON, see ../topologies/) and their checks, shared by the
+# controllers (topology.py) and the simulator (../sim/), without the bfrt
+# imports of topology.py.
+#
+# Usage:
+#
+#  topology = load_topology(TOPOLOGY_FILES.get('b', 'b'))
+#  topology['leaf']['vclusters'][0]['worker_ports'][0]  # Keys are ints
+#
+import json
+import os
+
+TOPOLOGIES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'topologies')
+# Placement shortcuts of the controllers and the simulator
+TOPOLOGY_FILES = {'s': os.path.join(TOPOLOGIES_DIR, 'skewed.json'),
+                  'b': os.path.join(TOPOLOGIES_DIR, 'balanced.json'),
+                  'r': os.path.join(TOPOLOGIES_DIR, 'one_rack.json')}
+
+def _int_keys(obj):
+    # JSON object keys are strings, the controllers index mappings with ints
+    if isinstance(obj, dict):
+        return dict((int(k) if k.lstrip('-').isdigit() else k, _int_keys(v)) for k, v in obj.items())
+    if isinstance(obj, list):
+        return [_int_keys(v) for v in obj]
+    return obj
+
+def load_topology(path):
+    with open(path) as f:
+        topology = _int_keys(json.load(f))
+    for field in ('max_vcluster_workers', 'port_mac', 'leaf', 'spine'):
+        if field not in topology:
+            raise ValueError("Topology %s is missing '%s'" %(path, field))
+    for leaf_id, leaf in enumerate(topology['leaf']['vclusters']):
+        for wid, port in leaf['worker_ports'].items():
+            if port not in topology['port_mac']:
+                raise ValueError("Topology %s: no MAC address for port %d (worker %d)" %(path, port, wid))
+        for wid in leaf['workers']:
+            if wid not in leaf['worker_ports'] or wid >= topology['max_vcluster_workers']:
+                raise ValueError("Topology %s: worker %d of vcluster %d has no port or is not below max_vcluster_workers" %(path,
+                                 wid, leaf_id))
+    # The leaf forwards on dst_id alone: worker wid of vcluster i is leaf_id i * max_vcluster_workers + wid
+    spine_ids = set(topology['leaf']['spine_ports'].keys())
+    spine_ids.add(topology['leaf']['initial_linked_sq_spine'])
+    for leaf_id, leaf in enumerate(topology['leaf']['vclusters']):
+        dst_ids = set(leaf_id * topology['max_vcluster_workers'] + wid for wid in leaf['worker_ports'])
+        if dst_ids & spine_ids:
+            raise ValueError("Topology %s: worker dst_ids %d..%d of vcluster %d overlap spine ids %s" %(path,
+                             min(dst_ids), max(dst_ids), leaf_id, sorted(dst_ids & spine_ids)))
+    return topology
@@ -0,0 +1,140 @@
+#
+# Register semantics of the leaf model (sim/leaf.py) against ../horus/leaf.p4,
+# with known plans and the Random<> values of each packet given.
+#
+# Usage:
+#
+#  python3 -m pytest tests/
+#
+import os
+import sys
+import unittest
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from sim.headers import *
+from sim.leaf import LeafModel, leaf_plan
+
+SPINE_ID = 200
+NUM_WORKERS = 4 # adjust_random_worker_range_2: worker index = random >> 14
+
+class FixedRandom():
+    # Random<bit<16>>().get() values in the order the pipeline draws them
+    def __init__(self, values):
+        self.values = list(values)
+
+    def get(self):
+        return self.values.pop(0)
+
+def worker_random(index):
+    return index << 14
+
+class LeafModelTest(unittest.TestCase):
+    def setUp(self):
+        self.leaf = LeafModel(seed=1)
+        self.leaf.apply_plan(leaf_plan({0: NUM_WORKERS}, spine_ids=[SPINE_ID]))
+
+    def process(self, pkt, randoms=(0, 0)):
+        self.leaf.random = FixedRandom(randoms)
+        return self.leaf.process(pkt)
+
+    def test_idle_list_pop_and_push(self):
+        leaf = self.leaf
+        # The last idle worker is popped, qlen=1 tells the spine the leaf had idle workers
+        emitted = self.process(HorusPacket(PKT_TYPE_NEW_TASK, 0, SPINE_ID, 0, 0, 1))
+        self.assertEqual(emitted, [(3, HorusPacket(PKT_TYPE_NEW_TASK, 0, SPINE_ID, 3, 1, 1))])
+        self.assertEqual(int(leaf.register('idle_count')[0]), 3)
+        self.assertEqual(int(leaf.register('stat_count_task')[0]), 1)
+        emitted = self.process(HorusPacket(PKT_TYPE_NEW_TASK, 0, SPINE_ID, 0, 0, 2))
+        self.assertEqual(emitted[0][1].dst_id, 2)
+        # A worker that becomes idle is pushed at the old idle count
+        self.process(HorusPacket(PKT_TYPE_TASK_DONE_IDLE, 0, 3, SPINE_ID, 0, 1))
+        self.assertEqual(int(leaf.register('idle_count')[0]), 3)
+        self.assertEqual(leaf.register('idle_list')[:3].tolist(), [0, 1, 3])
+
+    def test_idle_count_wrap(self):
+        idle_count = self.leaf.register('idle_count')
+        # NEW_TASK does not decrement below 0, TASK_DONE_IDLE wraps at 16 bits
+        idle_count[0] = 0
+        self.process(HorusPacket(PKT_TYPE_NEW_TASK, 0, SPINE_ID, 0, 0, 1))
+        self.assertEqual(int(idle_count[0]), 0)
+        idle_count[0] = MASK_16bit
+        self.process(HorusPacket(PKT_TYPE_TASK_DONE_IDLE, 0, 1, SPINE_ID, 0, 1))
+        self.assertEqual(int(idle_count[0]), 0)
+
+    def test_repeated_random_tie_break(self):
+        leaf = self.leaf
+        leaf.register('idle_count')[0] = 0
+        leaf.register('queue_len_list_1')[:NUM_WORKERS] = [5, 5, 5, 5]
+        leaf.register('queue_len_list_2')[:NUM_WORKERS] = [2, 2, 2, 2]
+        # dec_repeated_rand: the second sample moves down (1, 1) -> (1, 0)
+        emitted = self.process(HorusPacket(PKT_TYPE_NEW_TASK, 0, SPINE_ID, 0, 0, 1), (worker_random(1), worker_random(1)))
+        self.assertEqual(emitted, [(0, HorusPacket(PKT_TYPE_NEW_TASK, 0, SPINE_ID, 0, 0, 1))])
+        # inc_repeated_rand: (0, 0) -> (0, 1)
+        emitted = self.process(HorusPacket(PKT_TYPE_NEW_TASK, 0, SPINE_ID, 0, 0, 2), (worker_random(0), worker_random(0)))
+        self.assertEqual(emitted[0][1].dst_id, 1)
+        self.assertEqual(leaf.num_resubmissions, 0)
+
+    def test_deferred_queue_len(self):
+        leaf = self.leaf
+        leaf.register('idle_count')[0] = 0
+        leaf.register('queue_len_list_1')[1] = 3
+        leaf.register('queue_len_list_2')[2] = 5
+        randoms = (worker_random(1), worker_random(2))
+        # Deferred qlen within the difference of the samples: no resubmission
+        emitted = self.process(HorusPacket(PKT_TYPE_NEW_TASK, 0, SPINE_ID, 0, 0, 1), randoms)
+        self.assertEqual(emitted, [(1, HorusPacket(PKT_TYPE_NEW_TASK, 0, SPINE_ID, 1, 0, 1))])
+        self.assertEqual(int(leaf.register('deferred_queue_len_list_1')[1]), 1)
+        self.assertEqual(int(leaf.register('deferred_queue_len_list_2')[1]), 1)
+        # Deferred qlen 4 > 5 - 3: resubmitted, worker 2 has the smaller corrected qlen (0 + 5 < 4 + 3)
+        leaf.register('deferred_queue_len_list_1')[1] = 4
+        emitted = self.process(HorusPacket(PKT_TYPE_NEW_TASK, 0, SPINE_ID, 0, 0, 2), randoms)
+        self.assertEqual(emitted, [(2, HorusPacket(PKT_TYPE_NEW_TASK, 0, SPINE_ID, 2, 0, 2))])
+        self.assertEqual(leaf.num_resubmissions, 1)
+        self.assertEqual(int(leaf.register('stat_count_resub')[0]), 1)
+        self.assertEqual(int(leaf.register('queue_len_list_1')[2]), 1)
+        self.assertEqual(int(leaf.register('queue_len_list_2')[2]), 6)
+        # TASK_DONE resets the deferred qlen of the worker
+        self.process(HorusPacket(PKT_TYPE_TASK_DONE, 0, 1, SPINE_ID, 2, 3))
+        self.assertEqual(int(leaf.register('deferred_queue_len_list_1')[1]), 0)
+        self.assertEqual(int(leaf.register('deferred_queue_len_list_2')[1]), 0)
+        self.assertEqual(int(leaf.register('queue_len_list_1')[1]), 2)
+
+    def test_idle_signal(self):
+        leaf = self.leaf
+        leaf.register('idle_count')[0] = 2
+        leaf.register('linked_iq_sched')[0] = INVALID_VALUE_16bit
+        leaf.register('aggregate_queue_len_list')[0] = 16
+        leaf.register('backoff3')[0] = NUM_WORKERS
+        task_done = HorusPacket(PKT_TYPE_TASK_DONE_IDLE, 0, 1, SPINE_ID, 0, 7)
+        emitted = self.process(task_done)
+        # aggregate 16 - queue_len_unit(4) = 8, the original packet is mirrored to its spine
+        self.assertEqual(emitted, [(SPINE_ID, HorusPacket(PKT_TYPE_IDLE_SIGNAL, 0, 0, SPINE_ID, 8, 7)), (SPINE_ID, task_done)])
+        self.assertEqual(int(leaf.register('linked_iq_sched')[0]), SPINE_ID)
+        self.assertEqual(int(leaf.register('stat_count_idle_signal')[0]), 1)
+        self.assertEqual(int(leaf.register('backoff3')[0]), 0)
+
+    def test_idle_remove(self):
+        leaf = self.leaf
+        leaf.register('idle_count')[0] = 1
+        task_done = HorusPacket(PKT_TYPE_TASK_DONE, 0, 2, SPINE_ID, 3, 7)
+        emitted = self.process(task_done)
+        self.assertEqual(emitted, [(SPINE_ID, HorusPacket(PKT_TYPE_IDLE_REMOVE, 0, 0, SPINE_ID, 0, 7)), (SPINE_ID, task_done)])
+        self.assertEqual(int(leaf.register('stat_count_idle_signal')[0]), 1)
+        self.assertEqual(int(leaf.register('idle_count')[0]), 1)
+
+    def test_queue_signal(self):
+        leaf = self.leaf
+        leaf.register('idle_count')[0] = 3
+        leaf.register('linked_view_drift')[0] = NUM_WORKERS - 1
+        task_done = HorusPacket(PKT_TYPE_TASK_DONE, 0, 2, SPINE_ID, 3, 7)
+        emitted = self.process(task_done)
+        self.assertEqual(emitted, [(SPINE_ID, HorusPacket(PKT_TYPE_QUEUE_SIGNAL, 0, 0, SPINE_ID, 0, 7)), (SPINE_ID, task_done)])
+        self.assertEqual(int(leaf.register('stat_count_load_signal')[0]), 1)
+        self.assertEqual(int(leaf.register('linked_view_drift')[0]), 0)
+        # Without drift the TASK_DONE is only forwarded
+        emitted = self.process(task_done)
+        self.assertEqual(emitted, [(SPINE_ID, task_done)])
+
+if __name__ == '__main__':
+    unittest.main()
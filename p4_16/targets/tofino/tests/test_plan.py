@@ -0,0 +1,71 @@
+#
+# Tests of the Plan entries and diffs (switch_ctrl/plan.py).
+#
+# Usage:
+#
+#  python3 -m pytest tests/
+#
+import os
+import sys
+import unittest
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from switch_ctrl.plan import Plan, diff_plans, plan_diff_size
+
+FORWARD_TABLE = 'LeafIngress.forward_horus_switch_dst'
+FORWARD_ACTION = 'LeafIngress.act_forward_horus'
+
+def forward_plan(worker_ports, spine_ports, max_vcluster_workers=32):
+    # forward_horus_switch_dst entries as the RS-H leaf controller compiles them
+    plan = Plan()
+    for leaf_id, ports in enumerate(worker_ports):
+        for wid, port in ports.items():
+            plan.add_entry(FORWARD_TABLE, [('hdr.horus.dst_id', leaf_id * max_vcluster_workers + wid)], FORWARD_ACTION, [('port', port)])
+    for sid, port in spine_ports.items():
+        plan.add_entry(FORWARD_TABLE, [('hdr.horus.dst_id', sid)], FORWARD_ACTION, [('port', port)])
+    return plan
+
+class PlanTest(unittest.TestCase):
+    def test_same_entry_twice(self):
+        plan = Plan()
+        plan.add_entry(FORWARD_TABLE, [('hdr.horus.dst_id', 1)], FORWARD_ACTION, [('port', 132)])
+        plan.add_entry(FORWARD_TABLE, [('hdr.horus.dst_id', 1)], FORWARD_ACTION, [('port', 132)])
+        self.assertEqual(len(plan.entries), 1)
+
+    def test_conflicting_entry(self):
+        plan = Plan()
+        plan.add_entry(FORWARD_TABLE, [('hdr.horus.dst_id', 1)], FORWARD_ACTION, [('port', 132)])
+        with self.assertRaises(ValueError):
+            plan.add_entry(FORWARD_TABLE, [('hdr.horus.dst_id', 1)], FORWARD_ACTION, [('port', 134)])
+        self.assertEqual(plan.entries[(FORWARD_TABLE, (('hdr.horus.dst_id', 1),))], (FORWARD_ACTION, (('port', 132),)))
+
+    def test_worker_and_spine_dst_id_clash(self):
+        # Balanced placement: workers 0..7 of vcluster 3 are dst_ids 96..103, spine 100 is one of them
+        worker_ports = [dict((wid, port) for wid in range(8)) for port in (132, 134, 140, 142)]
+        with self.assertRaises(ValueError):
+            forward_plan(worker_ports, {100: 152, 110: 144, 111: 160, 150: 144})
+        # Spine ids above the worker dst_ids are fine
+        plan = forward_plan(worker_ports, {200: 152, 210: 144})
+        self.assertEqual(len(plan.entries), 4 * 8 + 2)
+
+    def test_diff_plans(self):
+        installed = Plan()
+        installed.add_entry(FORWARD_TABLE, [('hdr.horus.dst_id', 1)], FORWARD_ACTION, [('port', 132)])
+        installed.add_entry(FORWARD_TABLE, [('hdr.horus.dst_id', 2)], FORWARD_ACTION, [('port', 132)])
+        installed.set_register('LeafIngress.idle_count.f1', 0, 8)
+        desired = Plan()
+        desired.add_entry(FORWARD_TABLE, [('hdr.horus.dst_id', 1)], FORWARD_ACTION, [('port', 134)])
+        desired.add_entry(FORWARD_TABLE, [('hdr.horus.dst_id', 3)], FORWARD_ACTION, [('port', 132)])
+        desired.set_register('LeafIngress.idle_count.f1', 0, 8)
+        desired.set_register('LeafIngress.idle_count.f1', 1, 4)
+        plan_diff = diff_plans(installed, desired)
+        self.assertEqual(plan_diff.entries_add, [((FORWARD_TABLE, (('hdr.horus.dst_id', 3),)), (FORWARD_ACTION, (('port', 132),)))])
+        self.assertEqual(plan_diff.entries_mod, [((FORWARD_TABLE, (('hdr.horus.dst_id', 1),)), (FORWARD_ACTION, (('port', 134),)))])
+        self.assertEqual(plan_diff.entries_del, [((FORWARD_TABLE, (('hdr.horus.dst_id', 2),)), (FORWARD_ACTION, (('port', 132),)))])
+        self.assertEqual(plan_diff.registers, [(('LeafIngress.idle_count.f1', 1), 4)])
+        self.assertEqual(plan_diff_size(plan_diff), 4)
+        self.assertEqual(plan_diff_size(diff_plans(desired, desired)), 0)
+
+if __name__ == '__main__':
+    unittest.main()
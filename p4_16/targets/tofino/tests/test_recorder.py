@@ -0,0 +1,107 @@
+#
+# Round trip of the register snapshot recordings (switch_ctrl/recorder.py).
+#
+# Usage:
+#
+#  python3 -m pytest tests/
+#
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+import numpy as np
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from switch_ctrl.recorder import SnapshotRecorder, SnapshotReader, open_recorder, HEADER_SIZE
+
+REGISTER_NAME = 'LeafIngress.stat_count_resub.f1'
+
+def counter_snapshots(num_records, num_pipes=2, num_vclusters=3):
+    # Increasing counters that wrap around 2^32 halfway through
+    steps = np.arange(num_records * num_pipes * num_vclusters, dtype=np.int64).reshape(num_records, num_pipes, num_vclusters) % 7 + 1
+    totals = 0xFFFFFFFF - num_records * 4 + np.cumsum(steps, axis=0)
+    return totals, totals & 0xFFFFFFFF
+
+class RecorderTest(unittest.TestCase):
+    def setUp(self):
+        self.stats_dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.stats_dir, 'leaf_stat_count_resub.rec')
+
+    def tearDown(self):
+        shutil.rmtree(self.stats_dir)
+
+    def record(self, snapshots, start_time=0.0, keyframe_interval=4):
+        recorder = SnapshotRecorder(self.path, REGISTER_NAME, keyframe_interval=keyframe_interval)
+        for i, snapshot in enumerate(snapshots):
+            recorder.append(snapshot, timestamp=start_time + i)
+        recorder.close()
+
+    def test_keyframes_and_deltas(self):
+        _, snapshots = counter_snapshots(10)
+        self.record(snapshots)
+        reader = SnapshotReader(self.path)
+        self.assertEqual(len(reader), 10)
+        self.assertEqual(reader.shape, (2, 3))
+        self.assertEqual(os.path.getsize(self.path), HEADER_SIZE + 10 * reader.dtype.itemsize)
+        # Records 0, 4 and 8 are keyframes, the others deltas
+        raw = np.asarray(reader.records['values'])
+        for i in (0, 4, 8):
+            np.testing.assert_array_equal(raw[i], snapshots[i])
+        np.testing.assert_array_equal(raw[5], (snapshots[5] - snapshots[4]) & 0xFFFFFFFF)
+        np.testing.assert_array_equal(reader.values(), snapshots)
+        # Slices that do not start on a keyframe
+        np.testing.assert_array_equal(reader.values(5, 7), snapshots[5:7])
+        np.testing.assert_array_equal(reader.values(9), snapshots[9:])
+        self.assertEqual(len(reader.values(10)), 0)
+        reader.close()
+
+    def test_reopen(self):
+        totals, snapshots = counter_snapshots(10)
+        self.record(snapshots[:6])
+        # Continues the recording after a restart, with the deltas to the last record before it
+        self.record(snapshots[6:], start_time=6.0, keyframe_interval=1024)
+        reader = SnapshotReader(self.path)
+        self.assertEqual(reader.keyframe_interval, 4)
+        np.testing.assert_array_equal(reader.times, np.arange(10.0))
+        np.testing.assert_array_equal(reader.values(), snapshots)
+        np.testing.assert_array_equal(reader.values(unwrap=True), totals)
+        reader.close()
+        with self.assertRaises(ValueError):
+            SnapshotRecorder(self.path, 'LeafIngress.stat_count_task.f1')
+
+    def test_partial_record(self):
+        _, snapshots = counter_snapshots(5)
+        self.record(snapshots[:3])
+        with open(self.path, 'ab') as f:
+            f.write(b'\x01' * 5)
+        self.record(snapshots[3:], start_time=3.0)
+        reader = SnapshotReader(self.path)
+        np.testing.assert_array_equal(reader.values(), snapshots)
+        reader.close()
+
+    def test_between(self):
+        totals, snapshots = counter_snapshots(10)
+        self.record(snapshots, start_time=100.0)
+        reader = SnapshotReader(self.path)
+        times, values = reader.between(102.5, 107.0)
+        np.testing.assert_array_equal(times, [103.0, 104.0, 105.0, 106.0])
+        np.testing.assert_array_equal(values, snapshots[3:7])
+        _, values = reader.between(102.5, 107.0, unwrap=True)
+        np.testing.assert_array_equal(values - values[0], totals[3:7] - totals[3])
+        times, values = reader.between(200.0, 300.0)
+        self.assertEqual(len(times), 0)
+        self.assertEqual(values.shape, (0, 2, 3))
+        reader.close()
+
+    def test_open_recorder(self):
+        self.assertIsNone(open_recorder(None, REGISTER_NAME))
+        recorder = open_recorder(os.path.join(self.stats_dir, 'stats'), REGISTER_NAME)
+        recorder.append(np.zeros((2, 3)))
+        recorder.close()
+        self.assertTrue(os.path.exists(os.path.join(self.stats_dir, 'stats', 'LeafIngress.stat_count_resub.rec')))
+
+if __name__ == '__main__':
+    unittest.main()
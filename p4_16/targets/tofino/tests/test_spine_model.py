@@ -0,0 +1,100 @@
+#
+# Register semantics of the spine model (sim/spine.py) against ../horus/spine.p4,
+# with known plans and the Random<> values of each packet given.
+#
+# Usage:
+#
+#  python3 -m pytest tests/
+#
+import os
+import sys
+import unittest
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from sim.headers import *
+from sim.spine import SpineModel, spine_plan, SWITCH_ID
+
+CLIENT_ID = 300
+
+class FixedRandom():
+    # Random<bit<16>>().get() values in the order the pipeline draws them
+    def __init__(self, values):
+        self.values = list(values)
+
+    def get(self):
+        return self.values.pop(0)
+
+def leaf_random(index):
+    # adjust_random_leaf_index_2 (3 or 4 leaves): leaf index = random >> 14
+    return index << 14
+
+class SpineModelTest(unittest.TestCase):
+    def make_spine(self, num_leaves):
+        spine = SpineModel(seed=1)
+        spine.apply_plan(spine_plan(dict((leaf_id, 8) for leaf_id in range(num_leaves)), routes={CLIENT_ID: 30}))
+        return spine
+
+    def process(self, spine, pkt, randoms=(0, 0, 0, 0)):
+        # Each pass draws t1_random_ds_index_1/2 then t2_random_ds_index_1/2
+        spine.random = FixedRandom(randoms)
+        return spine.process(pkt)
+
+    def test_idle_list_pop_and_push(self):
+        spine = self.make_spine(4)
+        # An idle leaf is selected from the end of the list, the leaf removes itself later with IDLE_REMOVE
+        emitted = self.process(spine, HorusPacket(PKT_TYPE_NEW_TASK, 0, CLIENT_ID, SWITCH_ID, 0, 1))
+        self.assertEqual(emitted, [(3, HorusPacket(PKT_TYPE_NEW_TASK, 3, SWITCH_ID, 3, 1, 1))])
+        self.assertEqual(int(spine.register('idle_count')[0]), 4)
+        self.assertEqual(int(spine.register('stat_count_task')[0]), 1)
+        # Packets for other switches are only forwarded
+        emitted = self.process(spine, HorusPacket(PKT_TYPE_TASK_DONE, 0, 2, CLIENT_ID, 0, 1))
+        self.assertEqual(emitted, [(30, HorusPacket(PKT_TYPE_TASK_DONE, CLIENT_ID, SWITCH_ID, CLIENT_ID, 0, 1))])
+
+    def test_idle_remove_swap(self):
+        spine = self.make_spine(4)
+        idle_list = spine.register('idle_list')
+        idx_mapping = spine.register('idle_list_idx_mapping')
+        # Leaf 1 leaves the idle list: the last entry (leaf 3) moves to its slot in the resubmit pass
+        emitted = self.process(spine, HorusPacket(PKT_TYPE_IDLE_REMOVE, 0, 1, SWITCH_ID, 2, 1), (0,) * 8)
+        self.assertEqual(emitted, [])
+        self.assertEqual(spine.num_resubmissions, 1)
+        self.assertEqual(int(spine.register('stat_count_resub')[0]), 1)
+        self.assertEqual(int(spine.register('idle_count')[0]), 3)
+        self.assertEqual(idle_list[:4].tolist(), [0, 3, 2, INVALID_VALUE_16bit])
+        self.assertEqual(int(idx_mapping[3]), 1)
+        # IDLE_SIGNAL pushes leaf 1 back at the end and records its index
+        emitted = self.process(spine, HorusPacket(PKT_TYPE_IDLE_SIGNAL, 0, 1, SWITCH_ID, 0, 2))
+        self.assertEqual(emitted, [])
+        self.assertEqual(int(spine.register('idle_count')[0]), 4)
+        self.assertEqual(idle_list[:4].tolist(), [0, 3, 2, 1])
+        self.assertEqual(int(idx_mapping[1]), 3)
+        # Removing the last entry swaps it with itself: the slot past idle_count keeps the leaf id
+        self.process(spine, HorusPacket(PKT_TYPE_IDLE_REMOVE, 0, 1, SWITCH_ID, 0, 3), (0,) * 8)
+        self.assertEqual(idle_list[:4].tolist(), [0, 3, 2, 1])
+        self.assertEqual(int(idx_mapping[1]), 3)
+        self.assertEqual(int(spine.register('idle_count')[0]), 3)
+
+    def test_round_robin_fallback(self):
+        spine = self.make_spine(3)
+        spine.register('idle_count')[0] = 0
+        rr_counter = spine.register('rr_counter')
+        out_of_range = leaf_random(3) # index 3 == num_leafs
+        # Both tries of the first sample out of range: round robin, the second sample is in range
+        emitted = self.process(spine, HorusPacket(PKT_TYPE_NEW_TASK, 0, CLIENT_ID, SWITCH_ID, 0, 1),
+                               (out_of_range, leaf_random(2), out_of_range, 0))
+        self.assertEqual(emitted[0][1].dst_id, 0)
+        self.assertEqual(int(rr_counter[0]), 1)
+        # Both samples out of range: the second one is the first one >> 1
+        spine.register('queue_len_list_1')[1] = 9
+        emitted = self.process(spine, HorusPacket(PKT_TYPE_NEW_TASK, 0, CLIENT_ID, SWITCH_ID, 0, 2), (out_of_range,) * 4)
+        self.assertEqual(emitted[0][1].dst_id, 0)
+        self.assertEqual(int(rr_counter[0]), 2)
+        # The counter wraps after num_leafs - 1
+        emitted = self.process(spine, HorusPacket(PKT_TYPE_NEW_TASK, 0, CLIENT_ID, SWITCH_ID, 0, 3), (out_of_range,) * 4)
+        self.assertEqual(emitted[0][1].dst_id, 2)
+        self.assertEqual(int(rr_counter[0]), 0)
+        self.assertEqual(spine.num_resubmissions, 0)
+
+if __name__ == '__main__':
+    unittest.main()
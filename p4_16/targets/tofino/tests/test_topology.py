@@ -0,0 +1,47 @@
+#
+# Checks of the topology files (switch_ctrl/topology_file.py, ../topologies/).
+#
+# Usage:
+#
+#  python3 -m pytest tests/
+#
+import glob
+import json
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from switch_ctrl.topology_file import load_topology, TOPOLOGIES_DIR, TOPOLOGY_FILES
+
+class TopologyTest(unittest.TestCase):
+    def test_shipped_topologies(self):
+        paths = sorted(glob.glob(os.path.join(TOPOLOGIES_DIR, '*.json')))
+        self.assertTrue(paths)
+        for path in paths:
+            topology = load_topology(path)
+            self.assertTrue(topology['leaf']['vclusters'], path)
+        for placement, path in TOPOLOGY_FILES.items():
+            self.assertTrue(os.path.isfile(path), placement)
+
+    def test_worker_dst_ids_overlap_spine_ids(self):
+        with open(TOPOLOGY_FILES['b']) as f:
+            topology = json.load(f)
+        # Balanced placement: workers 0..7 of vcluster 3 are dst_ids 96..103
+        topology['leaf']['initial_linked_sq_spine'] = 100
+        topology['leaf']['spine_ports']['100'] = 152
+        tmp_dir = tempfile.mkdtemp()
+        try:
+            path = os.path.join(tmp_dir, 'overlap.json')
+            with open(path, 'w') as f:
+                json.dump(topology, f)
+            with self.assertRaises(ValueError):
+                load_topology(path)
+        finally:
+            shutil.rmtree(tmp_dir)
+
+if __name__ == '__main__':
+    unittest.main()